@@ -1,9 +1,21 @@
 from agents.core.base import BaseAgent, AgentType, AgentMessage, AgentResponse
-from agents.core.llm_manager import get_llm
-from langchain.schema import HumanMessage, SystemMessage
+from agents.core.cache import cached_process
+from agents.core.concurrency import gather_bounded
 from typing import List, Dict
+import os
 import time
 import re
+from .chunking import CodeChunk, extract_code, split_code
+
+# 分块审查适用的任务类型及各自的审查重点
+CHUNKED_REVIEW_FOCUS = {
+    "代码审查": "代码质量、潜在缺陷、安全隐患和性能问题",
+    "调试修复": "可能导致错误或异常的缺陷及其修复方法",
+    "重构优化": "可读性、重复代码、结构设计和性能方面的改进点",
+}
+
+# 审查结论的严重程度排序
+SEVERITY_ORDER = ["严重", "一般", "建议"]
 
 
 class CodeAssistantAgent(BaseAgent):
@@ -13,9 +25,6 @@ class CodeAssistantAgent(BaseAgent):
             name="智能代码助手",
             description="专业的代码助手，支持代码生成、分析、优化和调试"
         )
-        # 使用统一的LLM管理器
-        self.llm = get_llm()
-        
         # 编程语言配置
         self.languages = {
             "python": {
@@ -64,7 +73,15 @@ class CodeAssistantAgent(BaseAgent):
             "重构优化": ["重构", "优化", "改进", "简化"],
             "技术咨询": ["如何", "最佳实践", "建议", "方案", "架构"]
         }
+        
+        # 超过该行数的代码在审查类任务中改为分块并行审查
+        self.chunked_review_min_lines = int(os.getenv('CODE_ASSISTANT_CHUNKED_REVIEW_MIN_LINES', '300'))
+        # 每个审查块的最大行数
+        self.chunk_max_lines = int(os.getenv('CODE_ASSISTANT_CHUNK_MAX_LINES', '150'))
+        # 分块审查的并发上限
+        self.review_concurrency = int(os.getenv('CODE_ASSISTANT_REVIEW_CONCURRENCY', '4'))
 
+    @cached_process
     async def process(self, message: AgentMessage) -> AgentResponse:
         start_time = time.time()
         
@@ -84,15 +101,19 @@ class CodeAssistantAgent(BaseAgent):
             # 构建专业的系统提示
             system_prompt = self._build_system_prompt(code_info)
             
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=message.content)
-            ]
+            code = extract_code(message.content)
+            if self._should_review_in_chunks(code_info, code):
+                # 大段代码按语义单元分块并行审查，再合并去重
+                chunks = split_code(code, code_info["language"], self.chunk_max_lines)
+                code_info["chunks"] = len(chunks)
+                formatted_content = await self._review_in_chunks(system_prompt, message.content, chunks, code_info)
+            else:
+                messages = self._build_messages(system_prompt, message.content, message.history)
 
-            response = await self.llm.ainvoke(messages)
-            
-            # 后处理：格式化代码输出
-            formatted_content = self._format_code_output(response.content, code_info)
+                response = await self._generate(messages)
+                
+                # 后处理：格式化代码输出
+                formatted_content = self._format_code_output(response.content, code_info)
             
             return AgentResponse(
                 success=True,
@@ -103,7 +124,8 @@ class CodeAssistantAgent(BaseAgent):
                     "task_type": code_info.get("task_type", "通用代码助手"),
                     "language": code_info.get("language", "未指定"),
                     "complexity": code_info.get("complexity", "中等"),
-                    "has_code": self._contains_code_block(formatted_content)
+                    "has_code": self._contains_code_block(formatted_content),
+                    "review_chunks": code_info.get("chunks")
                 }
             )
 
@@ -116,6 +138,88 @@ class CodeAssistantAgent(BaseAgent):
                 error=str(e)
             )
 
+    def _should_review_in_chunks(self, code_info: Dict, code: str) -> bool:
+        """审查类任务且代码足够长时启用分块审查"""
+        return (code_info.get("task_type") in CHUNKED_REVIEW_FOCUS
+                and code.count("\n") + 1 >= self.chunked_review_min_lines)
+
+    async def _review_in_chunks(self, system_prompt: str, request: str,
+                                chunks: List[CodeChunk], code_info: Dict) -> str:
+        """并行审查各代码块，合并去重后生成审查报告"""
+        focus = CHUNKED_REVIEW_FOCUS[code_info["task_type"]]
+        results = await gather_bounded(
+            [
+                (lambda chunk=chunk: self._review_chunk(system_prompt, request, chunk, focus, code_info))
+                for chunk in chunks
+            ],
+            self.review_concurrency
+        )
+        findings = self._merge_findings(
+            [(chunk, finding) for chunk, chunk_findings in zip(chunks, results) for finding in chunk_findings]
+        )
+        return self._render_review_report(chunks, findings, code_info)
+
+    async def _review_chunk(self, system_prompt: str, request: str, chunk: CodeChunk,
+                            focus: str, code_info: Dict) -> List[Dict]:
+        """审查单个代码块，返回解析后的问题列表"""
+        language = code_info["language"] if code_info["language"] != "未指定" else ""
+        review_prompt = (
+            f"用户需求：{request[:300]}\n\n"
+            f"以下是待审查代码中的「{chunk.name}」（原文第{chunk.start_line}-{chunk.end_line}行）：\n"
+            f"```{language}\n{chunk.text}\n```\n\n"
+            f"请重点关注{focus}。只列出发现的问题，每条一行，格式为：\n"
+            "- [严重|一般|建议] 第N行: 问题描述 —— 修改建议\n"
+            "行号使用原文行号。没有发现问题时只输出：无问题"
+        )
+        response = await self.llm.ainvoke(self._build_messages(system_prompt, review_prompt))
+        return self._parse_findings(response.content)
+
+    def _parse_findings(self, content: str) -> List[Dict]:
+        """解析审查结论中的问题条目"""
+        findings = []
+        for line in content.split("\n"):
+            match = re.match(r'^\s*(?:[-*]|\d+[.、])\s*\[?(严重|一般|建议)\]?\s*[:：]?\s*(.+)$', line)
+            if match:
+                findings.append({"severity": match.group(1), "text": match.group(2).strip()})
+        return findings
+
+    def _merge_findings(self, findings: List[tuple]) -> List[Dict]:
+        """合并各块的问题，描述相同的问题只保留一条并记录全部出现位置"""
+        merged: Dict[str, Dict] = {}
+        for chunk, finding in findings:
+            key = re.sub(r'第\s*\d+\s*(?:-\s*\d+\s*)?行|[\s，。,.:：;；、]', '', finding["text"]).lower()
+            if key in merged:
+                entry = merged[key]
+                entry["locations"].append(chunk.name)
+                if SEVERITY_ORDER.index(finding["severity"]) < SEVERITY_ORDER.index(entry["severity"]):
+                    entry["severity"] = finding["severity"]
+            else:
+                merged[key] = {**finding, "locations": [chunk.name]}
+        return sorted(merged.values(), key=lambda entry: SEVERITY_ORDER.index(entry["severity"]))
+
+    def _render_review_report(self, chunks: List[CodeChunk], findings: List[Dict], code_info: Dict) -> str:
+        """生成合并后的审查报告"""
+        total_lines = sum(chunk.line_count for chunk in chunks)
+        lines = [
+            f"# {code_info['task_type']}报告",
+            "",
+            f"共审查 {len(chunks)} 个代码块（{total_lines} 行），发现 {len(findings)} 个问题。",
+        ]
+        for severity in SEVERITY_ORDER:
+            items = [finding for finding in findings if finding["severity"] == severity]
+            if not items:
+                continue
+            lines.extend(["", f"## {severity}问题", ""])
+            for item in items:
+                locations = "、".join(dict.fromkeys(item["locations"]))
+                lines.append(f"- {item['text']}（位置：{locations}）")
+        if not findings:
+            lines.extend(["", "未发现明显问题。"])
+        return "\n".join(lines)
+
+    def cache_analysis(self, message: AgentMessage) -> Dict:
+        return self._analyze_code_request(message.content)
+
     def _analyze_code_request(self, content: str) -> Dict:
         """分析代码请求"""
         content_lower = content.lower()
@@ -0,0 +1,161 @@
+"""
+代码分块
+将大段代码切分为函数/类等语义单元，供分块并行审查使用
+"""
+
+import ast
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+# 以花括号划分代码块的语言
+BRACE_LANGUAGES = {"javascript", "typescript", "java", "go", "rust", "cpp"}
+
+
+@dataclass
+class CodeChunk:
+    """代码块，行号从1开始且包含首尾"""
+    name: str
+    start_line: int
+    end_line: int
+    text: str
+
+    @property
+    def line_count(self) -> int:
+        return self.end_line - self.start_line + 1
+
+
+def extract_code(content: str) -> str:
+    """提取消息中的代码，优先使用Markdown代码块，没有代码块时视整段内容为代码"""
+    blocks = re.findall(r'```[\w+#-]*\n(.*?)```', content, re.DOTALL)
+    if blocks:
+        return "\n".join(block.rstrip("\n") for block in blocks)
+    return content
+
+
+def _make_chunk(lines: List[str], name: str, start: int, end: int) -> CodeChunk:
+    return CodeChunk(name=name, start_line=start, end_line=end, text="\n".join(lines[start - 1:end]))
+
+
+def _python_units(code: str, lines: List[str], max_lines: int) -> List[CodeChunk]:
+    """按顶层函数/类划分Python代码，过大的类按方法继续拆分"""
+    tree = ast.parse(code)
+    units: List[CodeChunk] = []
+    pending_start: Optional[int] = None
+    pending_end = 0
+
+    def flush_pending():
+        nonlocal pending_start
+        if pending_start is not None:
+            units.append(_make_chunk(lines, "模块级代码", pending_start, pending_end))
+            pending_start = None
+
+    for node in tree.body:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])])
+        end = node.end_lineno
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            flush_pending()
+            if isinstance(node, ast.ClassDef) and end - start + 1 > max_lines:
+                units.extend(_split_python_class(node, lines, start))
+            else:
+                units.append(_make_chunk(lines, node.name, start, end))
+        else:
+            if pending_start is None:
+                pending_start = start
+            pending_end = end
+    flush_pending()
+    return units
+
+
+def _split_python_class(node: ast.ClassDef, lines: List[str], start: int) -> List[CodeChunk]:
+    """将大类按方法拆分，类头部单独成块"""
+    units = []
+    methods = [n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    header_end = (methods[0].lineno - 1) if methods else node.end_lineno
+    if methods and methods[0].decorator_list:
+        header_end = min(d.lineno for d in methods[0].decorator_list) - 1
+    units.append(_make_chunk(lines, node.name, start, max(start, header_end)))
+    for method in methods:
+        method_start = min([method.lineno] + [d.lineno for d in method.decorator_list])
+        units.append(_make_chunk(lines, f"{node.name}.{method.name}", method_start, method.end_lineno))
+    return units
+
+
+def _brace_units(lines: List[str]) -> List[CodeChunk]:
+    """按花括号深度回到0的位置划分代码单元"""
+    units = []
+    depth = 0
+    start = None
+    for index, line in enumerate(lines, start=1):
+        stripped = re.sub(r'"(\\.|[^"\\])*"|\'(\\.|[^\'\\])*\'|//.*$', '', line)
+        if start is None and line.strip():
+            start = index
+        depth += stripped.count('{') - stripped.count('}')
+        depth = max(depth, 0)
+        if start is not None and depth == 0 and ('}' in stripped or stripped.rstrip().endswith(';') or not stripped.strip()):
+            units.append(_make_chunk(lines, _guess_name(lines[start - 1]), start, index))
+            start = None
+    if start is not None:
+        units.append(_make_chunk(lines, _guess_name(lines[start - 1]), start, len(lines)))
+    return units
+
+
+def _indent_units(lines: List[str]) -> List[CodeChunk]:
+    """按顶格缩进的行划分代码单元"""
+    units = []
+    start = None
+    for index, line in enumerate(lines, start=1):
+        if line.strip() and not line[0].isspace() and start is not None and not line.lstrip().startswith((')', ']', '}')):
+            units.append(_make_chunk(lines, _guess_name(lines[start - 1]), start, index - 1))
+            start = None
+        if start is None and line.strip():
+            start = index
+    if start is not None:
+        units.append(_make_chunk(lines, _guess_name(lines[start - 1]), start, len(lines)))
+    return units
+
+
+def _guess_name(line: str) -> str:
+    """从单元首行猜测函数或类名"""
+    match = re.search(r'(?:class|function|func|fn|def|interface|struct|impl)\s+([A-Za-z_][\w]*)', line)
+    if match:
+        return match.group(1)
+    match = re.search(r'([A-Za-z_][\w]*)\s*\(', line)
+    return match.group(1) if match else "代码片段"
+
+
+def _pack(units: List[CodeChunk], lines: List[str], max_lines: int) -> List[CodeChunk]:
+    """合并相邻的小单元，拆分超长单元，使每块不超过max_lines行"""
+    chunks: List[CodeChunk] = []
+    for unit in units:
+        if unit.line_count > max_lines:
+            for offset in range(unit.start_line, unit.end_line + 1, max_lines):
+                end = min(offset + max_lines - 1, unit.end_line)
+                chunks.append(_make_chunk(lines, f"{unit.name}（{offset}-{end}行）", offset, end))
+            continue
+        if chunks and chunks[-1].end_line < unit.start_line and unit.end_line - chunks[-1].start_line + 1 <= max_lines:
+            previous = chunks[-1]
+            name = f"{previous.name}, {unit.name}"
+            if len(name) > 60:
+                name = name[:57] + "..."
+            chunks[-1] = _make_chunk(lines, name, previous.start_line, unit.end_line)
+        else:
+            chunks.append(unit)
+    return chunks
+
+
+def split_code(code: str, language: str, max_lines: int = 150) -> List[CodeChunk]:
+    """
+    按语言将代码切分为不超过max_lines行的块
+
+    能被ast解析的代码按函数/类切分（语言识别按关键词子串匹配，不可靠，因此不论识别结果都先尝试）；
+    解析失败时花括号语言按括号深度切分，其余语言按缩进切分
+    """
+    lines = code.split("\n")
+    try:
+        return _pack(_python_units(code, lines, max_lines), lines, max_lines)
+    except (SyntaxError, ValueError):
+        pass
+    if language in BRACE_LANGUAGES or (language == "未指定" and code.count('{') >= 2):
+        return _pack(_brace_units(lines), lines, max_lines)
+    return _pack(_indent_units(lines), lines, max_lines)
@@ -23,6 +23,7 @@ class AgentMessage:
     agent_type: AgentType
     timestamp: datetime
     metadata: Optional[Dict[str, Any]] = None
+    history: Optional[Any] = None  # 对话历史上下文（ConversationMemory）
 
     def __post_init__(self):
         if not self.id:
@@ -42,11 +43,27 @@ class AgentResponse:
 
 
 class BaseAgent(ABC):
+    # 提示词版本，修改提示词或格式化逻辑时递增，使旧的缓存结果失效
+    cache_prompt_version = "1"
+
     def __init__(self, agent_type: AgentType, name: str, description: str):
         self.agent_type = agent_type
         self.name = name
         self.description = description
         self.id = str(uuid.uuid4())
+        self._llm = None
+
+    @property
+    def llm(self):
+        """模型实例在首次使用时创建，构造智能体时不连接模型服务"""
+        if self._llm is None:
+            from .llm_manager import get_llm
+            self._llm = get_llm()
+        return self._llm
+
+    @llm.setter
+    def llm(self, value):
+        self._llm = value
 
     @abstractmethod
     async def process(self, message: AgentMessage) -> AgentResponse:
@@ -59,6 +76,33 @@ class BaseAgent(ABC):
     def validate_input(self, message: AgentMessage) -> bool:
         return bool(message.content and message.content.strip())
 
+    def warm_up(self):
+        """预热不依赖网络连接的只读状态（如编译好的流程图），pre-fork时在主进程中调用"""
+        pass
+
+    def reset_clients(self):
+        """丢弃模型客户端，fork出的子进程在首次调用模型时重新创建，避免共享主进程的连接"""
+        self._llm = None
+
+    def cache_analysis(self, message: AgentMessage) -> Optional[Dict[str, Any]]:
+        """参与结果缓存键的需求分析结果，子类返回其需求分析（或路由）结果"""
+        return None
+
+    async def _generate(self, messages: List[Any]) -> Any:
+        """生成面向用户的正文，流式请求中逐段转发模型输出"""
+        from .streaming import generate_text
+        return await generate_text(self.llm, messages)
+
+    def _build_messages(self, system_prompt: str, content: str, history: Optional[Any] = None) -> List[Any]:
+        """组装发送给模型的消息：系统提示、对话历史上下文、当前用户消息"""
+        from langchain.schema import HumanMessage, SystemMessage
+
+        messages = [SystemMessage(content=system_prompt)]
+        if history is not None and not history.is_empty():
+            messages.extend(history.to_messages())
+        messages.append(HumanMessage(content=content))
+        return messages
+
 
 class AgentState:
     def __init__(self):
@@ -0,0 +1,241 @@
+"""
+批量生成
+按模型提供商限制并发地执行一批提示词，每完成一条即产出结果，并分批写入数据库
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .base import AgentResponse, AgentType
+
+logger = logging.getLogger(__name__)
+
+# 超过该时长未更新的运行中任务视为进程已退出，允许其他请求接管续跑
+STALE_RUNNING_SECONDS = 600
+
+
+@dataclass
+class BatchEntry:
+    """批量任务中的单个待执行条目"""
+    index: int
+    agent_type: AgentType
+    prompt: str
+
+
+@dataclass
+class BatchResult:
+    """单个条目的执行结果"""
+    entry: BatchEntry
+    response: AgentResponse
+
+
+def default_provider_for(agent_type: AgentType) -> str:
+    """智能体使用的模型提供商，目前所有智能体均通过get_llm()共用LLM_PROVIDER"""
+    return os.getenv('LLM_PROVIDER', 'openai')
+
+
+class ProviderLimiter:
+    """按模型提供商分别限制并发数"""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, default_limit: int = 4):
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def semaphore(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(max(1, self.limits.get(provider, self.default_limit)))
+        return self._semaphores[provider]
+
+
+async def run_batch(manager, entries: List[BatchEntry], limiter: ProviderLimiter,
+                    provider_for: Callable[[AgentType], str] = default_provider_for) -> AsyncIterator[BatchResult]:
+    """
+    并发执行批量条目，按完成顺序产出结果
+
+    调用方提前停止迭代时，尚未完成的条目会被取消
+    """
+
+    async def run(entry: BatchEntry) -> BatchResult:
+        async with limiter.semaphore(provider_for(entry.agent_type)):
+            try:
+                response = await manager.process_message(entry.prompt, entry.agent_type)
+            except Exception as e:
+                response = AgentResponse(
+                    success=False,
+                    content=f"处理消息时发生错误: {str(e)}",
+                    agent_type=entry.agent_type,
+                    execution_time=0,
+                    error=str(e)
+                )
+        return BatchResult(entry=entry, response=response)
+
+    tasks = [asyncio.ensure_future(run(entry)) for entry in entries]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def create_batch(batch_id: str, conversation_id: int, entries: List[BatchEntry]):
+    """创建批量任务及其全部条目"""
+    from django.db import transaction
+    from .models import BatchItem, BatchJob
+
+    with transaction.atomic():
+        job = BatchJob.objects.create(
+            batch_id=batch_id,
+            conversation_id=conversation_id,
+            total_items=len(entries)
+        )
+        BatchItem.objects.bulk_create([
+            BatchItem(batch_id=batch_id, index=entry.index, agent_type=entry.agent_type.value, prompt=entry.prompt)
+            for entry in entries
+        ])
+    return job
+
+
+def claim_batch(batch_id: str) -> bool:
+    """将任务标记为运行中；任务正由其他请求执行时返回False"""
+    from django.db.models import Q
+    from django.utils import timezone
+    from .models import BatchJob
+
+    stale_before = timezone.now() - timedelta(seconds=STALE_RUNNING_SECONDS)
+    claimed = BatchJob.objects.filter(
+        Q(batch_id=batch_id) & (~Q(status='running') | Q(updated_at__lt=stale_before))
+    ).update(status='running', updated_at=timezone.now())
+    return claimed == 1
+
+
+def pending_entries(batch_id: str) -> List[BatchEntry]:
+    """续跑时需要执行的条目：尚未完成或执行失败的条目"""
+    from .models import BatchItem
+
+    return [
+        BatchEntry(index=item.index, agent_type=AgentType(item.agent_type), prompt=item.prompt)
+        for item in BatchItem.objects.filter(batch_id=batch_id).exclude(status='completed')
+    ]
+
+
+class BatchWriter:
+    """缓存执行结果，累计到flush_size条后在一个事务中批量写入文档、版本和条目状态"""
+
+    def __init__(self, job, flush_size: int = 20):
+        self.job = job
+        self.flush_size = max(1, flush_size)
+        self._buffer: List[BatchResult] = []
+
+    def add(self, result: BatchResult) -> List[Dict[str, Any]]:
+        """加入一条结果，达到阈值时写库并返回已写入条目的文档ID"""
+        self._buffer.append(result)
+        if len(self._buffer) >= self.flush_size:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """将缓存的结果批量写入数据库"""
+        if not self._buffer:
+            return []
+        from django.db import transaction
+        from django.utils import timezone
+        from .models import BatchItem, BatchJob, Document, DocumentVersion
+        from .utils import markdown_to_plain_text, extract_title_from_content, detect_document_type
+
+        results, self._buffer = self._buffer, []
+        successes = [result for result in results if result.response.success and result.response.content]
+
+        with transaction.atomic():
+            documents = self._create_documents([
+                Document(
+                    conversation_id=self.job.conversation_id,
+                    title=extract_title_from_content(result.response.content),
+                    document_type=detect_document_type(result.response.content, result.entry.agent_type.value),
+                    current_version=1
+                )
+                for result in successes
+            ])
+            DocumentVersion.objects.bulk_create([
+                DocumentVersion(
+                    document_id=document.id,
+                    version_number=1,
+                    content=result.response.content,
+                    raw_content=result.response.content,
+                    formatted_content=markdown_to_plain_text(result.response.content),
+                    operation_type='create'
+                )
+                for document, result in zip(documents, successes)
+            ])
+
+            document_ids = {result.entry.index: document.id for document, result in zip(documents, successes)}
+            items = list(BatchItem.objects.filter(
+                batch_id=self.job.batch_id,
+                index__in=[result.entry.index for result in results]
+            ))
+            by_index = {result.entry.index: result for result in results}
+            now = timezone.now()
+            for item in items:
+                response = by_index[item.index].response
+                item.status = 'completed' if item.index in document_ids else 'failed'
+                item.document_id = document_ids.get(item.index)
+                item.error = '' if item.status == 'completed' else (response.error or response.content or '')
+                item.execution_time = response.execution_time
+                item.updated_at = now
+            BatchItem.objects.bulk_update(items, ['status', 'document_id', 'error', 'execution_time', 'updated_at'])
+            self._refresh_counts(BatchJob, BatchItem)
+
+        return [{'index': index, 'document_id': document_id} for index, document_id in document_ids.items()]
+
+    @staticmethod
+    def _create_documents(documents):
+        """批量插入文档；数据库不回填bulk_create的主键时（MySQL）在同一事务中逐条插入"""
+        from django.db import connection
+        from .models import Document
+
+        if connection.features.can_return_rows_from_bulk_insert:
+            return Document.objects.bulk_create(documents)
+        for document in documents:
+            document.save(force_insert=True)
+        return documents
+
+    def _refresh_counts(self, BatchJob, BatchItem):
+        from django.db.models import Count
+        from django.utils import timezone
+
+        counts = dict(
+            BatchItem.objects.filter(batch_id=self.job.batch_id)
+            .values_list('status').annotate(count=Count('id'))
+        )
+        self.job.completed_items = counts.get('completed', 0)
+        self.job.failed_items = counts.get('failed', 0)
+        BatchJob.objects.filter(id=self.job.id).update(
+            completed_items=self.job.completed_items,
+            failed_items=self.job.failed_items,
+            updated_at=timezone.now()
+        )
+
+    def finish(self, interrupted: bool = False):
+        """写入剩余结果并更新任务状态"""
+        from .models import BatchJob
+
+        try:
+            self.flush()
+        finally:
+            self.job.status = 'interrupted' if interrupted else 'completed'
+            BatchJob.objects.filter(id=self.job.id).update(status=self.job.status)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'batch_id': self.job.batch_id,
+            'status': self.job.status,
+            'total': self.job.total_items,
+            'completed': self.job.completed_items,
+            'failed': self.job.failed_items
+        }
@@ -0,0 +1,152 @@
+"""
+智能体结果缓存
+对输出足够确定的智能体，按智能体类型、规范化后的消息、需求分析结果和提示词版本缓存完整响应，
+命中时跳过需求分析之后的全部处理（包括模型调用和格式化）。缓存按智能体单独配置TTL，默认关闭
+"""
+
+import dataclasses
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 不参与缓存键的元数据字段
+NON_KEY_METADATA = {'bypass_cache', 'generation_id'}
+
+
+def parse_ttls(value: str) -> Dict[str, int]:
+    """解析形如 official_document=3600,news_writer=600 的TTL配置"""
+    ttls = {}
+    for item in value.split(','):
+        if '=' in item:
+            agent_type, ttl = item.split('=', 1)
+            ttls[agent_type.strip()] = int(ttl)
+    return ttls
+
+
+def normalize_content(content: str) -> str:
+    """规范化消息：统一全半角、折叠空白"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', content)).strip()
+
+
+class ResultCache:
+    """进程内带TTL的LRU结果缓存"""
+
+    def __init__(self, ttls: Optional[Dict[str, int]] = None, max_entries: int = 512):
+        self.ttls = ttls or {}
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl_for(self, agent_type: str) -> int:
+        return self.ttls.get(agent_type, 0)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def build_cache_key(agent, message, analysis: Optional[Dict[str, Any]]) -> str:
+    """缓存键：智能体类型、规范化消息、需求分析结果、提示词版本、影响输出的元数据和对话上下文"""
+    metadata = {key: value for key, value in (message.metadata or {}).items() if key not in NON_KEY_METADATA}
+    history = message.history
+    parts = {
+        'agent_type': agent.agent_type.value,
+        'content': normalize_content(message.content),
+        'analysis': analysis,
+        'prompt_version': agent.cache_prompt_version,
+        'metadata': metadata,
+        'history': [history.summary, [(turn.role, turn.content) for turn in history.recent]] if history else None
+    }
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def cached_process(process):
+    """
+    智能体process方法的缓存装饰器
+
+    只缓存成功的响应；消息元数据中bypass_cache为真时跳过读取缓存，但仍用新结果刷新缓存
+    """
+
+    @functools.wraps(process)
+    async def wrapper(self, message):
+        cache = get_result_cache()
+        ttl = cache.ttl_for(self.agent_type.value)
+        if ttl <= 0 or not self.validate_input(message):
+            return await process(self, message)
+
+        start_time = time.time()
+        try:
+            key = build_cache_key(self, message, self.cache_analysis(message))
+        except Exception as e:
+            logger.warning(f"生成缓存键失败，跳过缓存: {e}")
+            return await process(self, message)
+
+        bypass = bool((message.metadata or {}).get('bypass_cache'))
+        if not bypass:
+            cached = cache.get(key)
+            if cached is not None:
+                return dataclasses.replace(
+                    cached,
+                    execution_time=time.time() - start_time,
+                    metadata={**(cached.metadata or {}), 'cache_hit': True}
+                )
+
+        response = await process(self, message)
+        if response.success:
+            cache.set(key, dataclasses.replace(response, metadata=dict(response.metadata or {})), ttl)
+        return response
+
+    return wrapper
+
+
+# 全局结果缓存
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    """获取全局结果缓存，各智能体的TTL由AGENT_CACHE_TTL配置"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            ttls=parse_ttls(os.getenv('AGENT_CACHE_TTL', '')),
+            max_entries=int(os.getenv('AGENT_CACHE_MAX_ENTRIES', '512'))
+        )
+    return _result_cache
+
+
+def set_result_cache(cache: Optional[ResultCache]):
+    """替换全局结果缓存"""
+    global _result_cache
+    _result_cache = cache
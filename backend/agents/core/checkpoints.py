@@ -0,0 +1,199 @@
+"""
+长文生成检查点
+分段生成时持久化已完成的步骤，失败重试时只补齐缺失部分
+"""
+
+import asyncio
+import hashlib
+import logging
+import uuid
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+
+from .base import AgentMessage, AgentType
+from .streaming import report_progress
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Checkpoint:
+    """检查点快照"""
+    generation_id: str
+    agent_type: str
+    request_hash: str
+    status: str = 'running'
+    steps: Dict[str, str] = field(default_factory=dict)
+    total_steps: int = 0
+    error: str = ''
+
+
+class CheckpointStore:
+    """基于数据库的检查点存储"""
+
+    async def load(self, generation_id: str) -> Optional[Checkpoint]:
+        return await sync_to_async(self._load)(generation_id)
+
+    async def save(self, checkpoint: Checkpoint):
+        await sync_to_async(self._save)(checkpoint)
+
+    def _load(self, generation_id: str) -> Optional[Checkpoint]:
+        from .models import GenerationCheckpoint
+        try:
+            row = GenerationCheckpoint.objects.get(generation_id=generation_id)
+        except GenerationCheckpoint.DoesNotExist:
+            return None
+        return Checkpoint(
+            generation_id=row.generation_id,
+            agent_type=row.agent_type,
+            request_hash=row.request_hash,
+            status=row.status,
+            steps=dict(row.steps),
+            total_steps=row.total_steps,
+            error=row.error
+        )
+
+    def _save(self, checkpoint: Checkpoint):
+        from .models import GenerationCheckpoint
+        GenerationCheckpoint.objects.update_or_create(
+            generation_id=checkpoint.generation_id,
+            defaults={
+                'agent_type': checkpoint.agent_type,
+                'request_hash': checkpoint.request_hash,
+                'status': checkpoint.status,
+                'steps': checkpoint.steps,
+                'total_steps': checkpoint.total_steps,
+                'error': checkpoint.error
+            }
+        )
+
+
+class InMemoryCheckpointStore(CheckpointStore):
+    """进程内检查点存储，用于测试和无数据库环境"""
+
+    def __init__(self):
+        self._checkpoints: Dict[str, Checkpoint] = {}
+
+    async def load(self, generation_id: str) -> Optional[Checkpoint]:
+        checkpoint = self._checkpoints.get(generation_id)
+        if checkpoint is None:
+            return None
+        return Checkpoint(**{**checkpoint.__dict__, 'steps': dict(checkpoint.steps)})
+
+    async def save(self, checkpoint: Checkpoint):
+        self._checkpoints[checkpoint.generation_id] = Checkpoint(
+            **{**checkpoint.__dict__, 'steps': dict(checkpoint.steps)}
+        )
+
+
+class SectionCheckpointer:
+    """单次分段生成的检查点会话，已完成的步骤直接复用，新完成的步骤立即落盘"""
+
+    def __init__(self, store: CheckpointStore, checkpoint: Checkpoint):
+        self.store = store
+        self.checkpoint = checkpoint
+        self._lock = asyncio.Lock()
+
+    @property
+    def generation_id(self) -> str:
+        return self.checkpoint.generation_id
+
+    async def plan(self, step_names: List[str]):
+        """登记本次生成的全部步骤"""
+        self.checkpoint.total_steps = len(step_names)
+        self.checkpoint.status = 'running'
+        self.checkpoint.error = ''
+        await self._persist()
+
+    async def step(self, name: str, factory: Callable[[], Awaitable[str]]) -> str:
+        """执行一个步骤，若检查点中已有结果则直接返回"""
+        if name in self.checkpoint.steps:
+            return self.checkpoint.steps[name]
+
+        result = await factory()
+        self.checkpoint.steps[name] = result
+        await self._persist()
+        return result
+
+    async def complete(self):
+        self.checkpoint.status = 'completed'
+        await self._persist()
+
+    async def fail(self, error: str):
+        self.checkpoint.status = 'failed'
+        self.checkpoint.error = error
+        await self._persist()
+
+    async def _persist(self):
+        """写入检查点并向订阅方报告进度，存储不可用时只记录告警，不影响本次生成"""
+        try:
+            async with self._lock:
+                # 保存快照，避免并行章节在写入期间修改步骤字典
+                await self.store.save(replace(self.checkpoint, steps=dict(self.checkpoint.steps)))
+        except Exception as e:
+            logger.warning(f"保存生成检查点失败: {e}")
+        report_progress(self.progress())
+
+    def progress(self) -> Dict[str, Any]:
+        """返回可对外展示的生成进度"""
+        return {
+            'generation_id': self.checkpoint.generation_id,
+            'status': self.checkpoint.status,
+            'completed_steps': list(self.checkpoint.steps.keys()),
+            'total_steps': self.checkpoint.total_steps
+        }
+
+
+# 全局检查点存储实例
+_checkpoint_store: Optional[CheckpointStore] = None
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """获取全局检查点存储"""
+    global _checkpoint_store
+    if _checkpoint_store is None:
+        _checkpoint_store = CheckpointStore()
+    return _checkpoint_store
+
+
+def set_checkpoint_store(store: CheckpointStore):
+    """替换全局检查点存储"""
+    global _checkpoint_store
+    _checkpoint_store = store
+
+
+def compute_request_hash(agent_type: AgentType, content: str) -> str:
+    """计算请求摘要"""
+    return hashlib.sha256(f"{agent_type.value}:{content}".encode('utf-8')).hexdigest()
+
+
+async def open_checkpoint(message: AgentMessage, agent_type: AgentType) -> SectionCheckpointer:
+    """
+    打开生成检查点
+
+    消息元数据中带有 generation_id 且与原请求一致时续跑，否则新建检查点
+    """
+    store = get_checkpoint_store()
+    request_hash = compute_request_hash(agent_type, message.content)
+    generation_id = (message.metadata or {}).get('generation_id')
+
+    checkpoint = None
+    if generation_id:
+        try:
+            checkpoint = await store.load(generation_id)
+        except Exception as e:
+            logger.warning(f"读取生成检查点失败: {e}")
+        if checkpoint and checkpoint.request_hash != request_hash:
+            logger.info(f"生成检查点 {generation_id} 与当前请求不一致，重新生成")
+            checkpoint = Checkpoint(generation_id=generation_id, agent_type=agent_type.value, request_hash=request_hash)
+
+    if checkpoint is None:
+        checkpoint = Checkpoint(
+            generation_id=generation_id or uuid.uuid4().hex,
+            agent_type=agent_type.value,
+            request_hash=request_hash
+        )
+
+    return SectionCheckpointer(store, checkpoint)
@@ -0,0 +1,336 @@
+"""
+并发工具
+为智能体提供有界并发的协程调度能力，以及WSGI部署下同步视图共用的常驻后台事件循环
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+async def gather_bounded(factories: Iterable[Callable[[], Awaitable[T]]], limit: int,
+                         return_exceptions: bool = False) -> List[T]:
+    """
+    以有界并发执行一组协程工厂，结果按输入顺序返回
+
+    参数:
+        factories: 无参协程工厂列表，每个工厂返回一个待执行的协程
+        limit: 同时运行的协程数量上限
+        return_exceptions: 为True时异常作为结果返回，其余协程继续执行
+
+    使用示例:
+        results = await gather_bounded([lambda: fetch(a), lambda: fetch(b)], limit=2)
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(factory: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await factory()
+
+    return await asyncio.gather(*(run(factory) for factory in factories), return_exceptions=return_exceptions)
+
+
+_DONE = object()
+
+
+class LoopBridgeBusy(RuntimeError):
+    """后台事件循环中进行中的任务已达上限"""
+
+
+class BridgeSlot:
+    """LoopBridge中一个进行中的任务名额，只释放一次"""
+
+    def __init__(self, bridge: "LoopBridge"):
+        self._bridge = bridge
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._bridge._release()
+
+
+class LoopBridge:
+    """
+    进程级常驻后台事件循环
+
+    同步代码通过run_coroutine_threadsafe把协程提交到同一个事件循环，模型客户端的连接池、
+    缓存等绑定事件循环的资源在请求之间得以复用。进行中的任务数受max_in_flight限制，
+    并定期测量事件循环的调度延迟
+    """
+
+    # 流式迭代检查客户端断开的间隔（秒）
+    cancel_poll_interval = 0.2
+
+    def __init__(self, max_in_flight: int = 256, acquire_timeout: float = 5.0,
+                 lag_interval: float = 0.5, lag_warning: float = 0.2):
+        self.max_in_flight = max(1, max_in_flight)
+        self.acquire_timeout = acquire_timeout
+        self.lag_interval = lag_interval
+        self.lag_warning = lag_warning
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_avg = 0.0
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        self.start()
+        return self._loop
+
+    def start(self):
+        """启动后台线程，重复调用无副作用"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.create_task(self._monitor_lag())
+                loop.call_soon(started.set)
+                try:
+                    loop.run_forever()
+                finally:
+                    loop.close()
+
+            self._loop = loop
+            self._thread = threading.Thread(target=run, name='agent-event-loop', daemon=True)
+            self._thread.start()
+            started.wait()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def reserve(self) -> "BridgeSlot":
+        """
+        预先占用一个进行中的任务名额，进行中的任务已满且等待超时时抛出LoopBridgeBusy
+
+        调用方在提交前需要写库等准备工作时使用，名额用尽时可在产生副作用之前拒绝请求
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._stats_lock:
+                self.rejected += 1
+            raise LoopBridgeBusy(f"进行中的任务已达上限 {self.max_in_flight}")
+        with self._stats_lock:
+            self.in_flight += 1
+        return BridgeSlot(self)
+
+    def submit(self, coro: Coroutine[Any, Any, T], slot: Optional["BridgeSlot"] = None) -> "concurrent.futures.Future[T]":
+        """提交协程，返回concurrent.futures.Future；未传入预占的名额时当场申请，已满且等待超时时抛出LoopBridgeBusy"""
+        if slot is None:
+            try:
+                slot = self.reserve()
+            except LoopBridgeBusy:
+                coro.close()
+                raise
+        with self._stats_lock:
+            self.submitted += 1
+        try:
+            future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        except BaseException:
+            slot.release()
+            coro.close()
+            raise
+        future.add_done_callback(lambda _: slot.release())
+        return future
+
+    def _release(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """在后台事件循环中执行协程并等待结果，超时后取消协程"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def run_async(self, coro: Coroutine[Any, Any, T]) -> T:
+        """从其他事件循环中等待在后台事件循环里执行的协程，等待方被取消时协程一并取消"""
+        if self.in_loop_thread():
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def iterate(self, factory: Callable[[], AsyncIterator[T]],
+                cancelled: Optional[threading.Event] = None) -> Iterator[T]:
+        """
+        在后台事件循环中运行异步生成器，以同步迭代器的形式逐个返回结果
+
+        整个迭代占用一个进行中的任务名额；同步迭代器被提前关闭（WSGI下客户端断开导致写入失败），
+        或cancelled（具有is_set()的对象，如threading.Event）被设置（ASGI下收到http.disconnect）时
+        取消异步生成器并结束迭代
+        """
+        items: "queue.Queue" = queue.Queue()
+        started = threading.Event()
+        cleaned = threading.Event()
+
+        async def consume():
+            started.set()
+            agen = factory()
+            try:
+                async for item in agen:
+                    items.put((True, item))
+            finally:
+                try:
+                    await agen.aclose()
+                finally:
+                    cleaned.set()
+
+        future = self.submit(consume())
+
+        def finished(done):
+            if not done.cancelled() and done.exception() is not None:
+                items.put((False, done.exception()))
+            items.put((True, _DONE))
+
+        future.add_done_callback(finished)
+        next_check = time.monotonic() + self.cancel_poll_interval
+        try:
+            while True:
+                if cancelled is None:
+                    ok, item = items.get()
+                else:
+                    # 按固定间隔检查取消条件，模型持续输出时同样生效
+                    now = time.monotonic()
+                    if now >= next_check:
+                        if cancelled.is_set():
+                            logger.info("客户端已断开，取消后台事件循环中的流式任务")
+                            break
+                        next_check = now + self.cancel_poll_interval
+                    try:
+                        ok, item = items.get(timeout=max(next_check - now, 0))
+                    except queue.Empty:
+                        continue
+                if item is _DONE:
+                    break
+                if not ok:
+                    raise item
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+                # 已开始执行的异步生成器在事件循环中收尾，等待其释放资源
+                if started.is_set():
+                    cleaned.wait(5)
+
+    async def _monitor_lag(self):
+        """测量事件循环的调度延迟：定时器实际唤醒时间与预期时间之差"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(loop.time() - expected, 0.0)
+            with self._stats_lock:
+                self.lag_last = lag
+                self.lag_max = max(self.lag_max, lag)
+                self.lag_avg = lag if self.lag_avg == 0 else self.lag_avg * 0.9 + lag * 0.1
+            if lag > self.lag_warning:
+                logger.warning(f"后台事件循环调度延迟 {lag * 1000:.0f}ms，进行中的任务 {self.in_flight} 个")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'running': self.is_running(),
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'lag_last_ms': round(self.lag_last * 1000, 2),
+                'lag_max_ms': round(self.lag_max * 1000, 2),
+                'lag_avg_ms': round(self.lag_avg * 1000, 2)
+            }
+
+    def shutdown(self, timeout: float = 5.0):
+        """取消事件循环中未完成的任务，停止事件循环并等待线程退出"""
+        if not self.is_running():
+            return
+        loop = self._loop
+
+        async def cancel_all():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        with contextlib.suppress(Exception):
+            asyncio.run_coroutine_threadsafe(cancel_all(), loop).result(timeout)
+        with contextlib.suppress(RuntimeError):
+            loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+
+
+# 进程级后台事件循环
+_loop_bridge: Optional[LoopBridge] = None
+_loop_bridge_lock = threading.Lock()
+# 异步视图是否把智能体调用转交后台事件循环执行，WSGI部署时由wsgi.py开启
+_bridge_async_views = False
+
+
+def get_loop_bridge() -> LoopBridge:
+    """获取进程级后台事件循环，首次使用时启动，进程退出时关闭"""
+    global _loop_bridge
+    if _loop_bridge is None:
+        with _loop_bridge_lock:
+            if _loop_bridge is None:
+                bridge = LoopBridge(
+                    max_in_flight=int(os.getenv('AGENT_LOOP_MAX_IN_FLIGHT', '256')),
+                    acquire_timeout=float(os.getenv('AGENT_LOOP_ACQUIRE_TIMEOUT', '5'))
+                )
+                atexit.register(bridge.shutdown)
+                _loop_bridge = bridge
+    return _loop_bridge
+
+
+def set_loop_bridge(bridge: Optional[LoopBridge]):
+    """替换进程级后台事件循环；fork出的子进程不继承后台线程，传入None丢弃主进程的实例"""
+    global _loop_bridge
+    _loop_bridge = bridge
+
+
+def enable_loop_bridge_for_async_views(enabled: bool = True):
+    """WSGI下Django为每个异步视图请求新建事件循环，开启后异步视图把智能体调用转交后台事件循环"""
+    global _bridge_async_views
+    _bridge_async_views = enabled
+
+
+async def run_agent_coroutine(coro: Coroutine[Any, Any, T]) -> T:
+    """异步视图中执行智能体协程：WSGI部署时在后台事件循环中执行，ASGI部署时直接等待"""
+    if _bridge_async_views:
+        return await get_loop_bridge().run_async(coro)
+    return await coro
+
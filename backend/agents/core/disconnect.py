@@ -0,0 +1,220 @@
+"""
+客户端断开检测
+Django 4.2在读取完请求体后不再读取ASGI的receive通道，流式响应期间察觉不到客户端断开。
+该中间件在请求体读取完毕后继续监听http.disconnect，并通过scope中的事件通知流式视图；
+WSGI下客户端断开表现为写入失败，服务器随即关闭响应迭代器。
+另外Django 4.2在ASGI下会把同步迭代器整体读完后再发送，流式视图需通过stream_body返回异步迭代器：
+跟随帧缓冲的流直接使用异步读取，不占用线程；其余同步迭代器在专用线程池中读取，线程数即并发上限
+"""
+
+import asyncio
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, Optional, TypeVar
+
+T = TypeVar('T')
+
+SCOPE_KEY = 'agents.disconnected'
+
+
+class DisconnectWatchMiddleware:
+    """ASGI中间件：请求体读取完毕后监听客户端断开，断开时设置scope[SCOPE_KEY]事件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        # 流式视图的同步迭代器在线程中执行，使用线程安全的事件
+        disconnected = threading.Event()
+        scope[SCOPE_KEY] = disconnected
+        watcher: Optional[asyncio.Task] = None
+
+        async def watch():
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                    return
+
+        async def wrapped_receive():
+            nonlocal watcher
+            if watcher is not None:
+                # 监听任务已接管receive通道，应用再次读取时等待断开
+                await asyncio.shield(watcher)
+                return {'type': 'http.disconnect'}
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+            elif not message.get('more_body', False):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        try:
+            await self.app(scope, wrapped_receive, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await watcher
+
+
+def get_disconnect_event(request) -> Optional[threading.Event]:
+    """获取请求的客户端断开事件，非ASGI部署或未启用中间件时返回None"""
+    scope = getattr(request, 'scope', None)
+    if not scope:
+        return None
+    return scope.get(SCOPE_KEY)
+
+
+class StreamsBusy(RuntimeError):
+    """同步流式响应的读取线程已全部占用"""
+
+
+class _Slot:
+    """读取线程名额，只释放一次；视图提前返回或请求在发送前中止时，对象回收时归还"""
+
+    def __init__(self, semaphore: threading.BoundedSemaphore):
+        self._semaphore = semaphore
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._semaphore.release()
+
+    def __del__(self):
+        self.release()
+
+
+class _ThreadedStream:
+    """
+    在专用线程池中逐个读取同步迭代器的异步迭代器，占用一个读取线程名额
+
+    迭代结束或响应关闭时归还名额；不定义__iter__，Django据此按异步内容发送
+    """
+
+    def __init__(self, executor: 'StreamExecutor', iterator: Iterator[T], disconnected: Optional[threading.Event],
+                 slot: _Slot):
+        self._executor = executor
+        self._iterator = iterator
+        self._disconnected = disconnected
+        self._slot = slot
+
+    def __aiter__(self) -> AsyncIterator[T]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[T]:
+        loop = asyncio.get_running_loop()
+        executor = self._executor.pool
+        iterator = self._iterator
+        done = object()
+        pending = None
+        finished = False
+        try:
+            while True:
+                pending = loop.run_in_executor(executor, next, iterator, done)
+                item = await asyncio.shield(pending)
+                if item is done:
+                    finished = True
+                    return
+                yield item
+        finally:
+            try:
+                if not finished:
+                    # 响应被提前关闭：通知迭代器停止，等待正在执行的读取返回后再关闭生成器
+                    if self._disconnected is not None:
+                        self._disconnected.set()
+                    if pending is not None and not pending.done():
+                        await asyncio.gather(pending, return_exceptions=True)
+                    close = getattr(iterator, 'close', None)
+                    if close is not None:
+                        await loop.run_in_executor(executor, close)
+            finally:
+                self._slot.release()
+
+    def close(self):
+        """Django在响应结束时调用；迭代未开始时直接归还名额"""
+        self._slot.release()
+
+
+class StreamExecutor:
+    """
+    ASGI下读取同步流式迭代器的专用线程池
+
+    每个流式响应在整个生命周期内占用一个线程，线程数即同时进行的同步流式响应上限；
+    名额用尽时reserve抛出StreamsBusy，视图据此在打开流之前返回503，而不是排队占用事件循环的默认线程池
+    """
+
+    def __init__(self, max_streams: int = 64):
+        self.max_streams = max_streams
+        self.pool = ThreadPoolExecutor(max_workers=max_streams, thread_name_prefix='agent-stream')
+        self._slots = threading.BoundedSemaphore(max_streams)
+
+    def reserve(self) -> _Slot:
+        if not self._slots.acquire(blocking=False):
+            raise StreamsBusy(f"同步流式响应已达上限 {self.max_streams}")
+        return _Slot(self._slots)
+
+    def open(self, iterator: Iterator[T], disconnected: Optional[threading.Event] = None,
+             slot: Optional[_Slot] = None) -> _ThreadedStream:
+        return _ThreadedStream(self, iterator, disconnected, slot or self.reserve())
+
+
+# 全局流式读取线程池
+_stream_executor: Optional[StreamExecutor] = None
+_stream_executor_lock = threading.Lock()
+
+
+def get_stream_executor() -> StreamExecutor:
+    """获取流式读取线程池，线程数由STREAM_READER_THREADS配置"""
+    global _stream_executor
+    if _stream_executor is None:
+        with _stream_executor_lock:
+            if _stream_executor is None:
+                from django.conf import settings
+                _stream_executor = StreamExecutor(settings.STREAM_READER_THREADS)
+    return _stream_executor
+
+
+def set_stream_executor(executor: Optional[StreamExecutor]):
+    """替换全局流式读取线程池"""
+    global _stream_executor
+    _stream_executor = executor
+
+
+def is_asgi(request) -> bool:
+    return getattr(request, 'scope', None) is not None
+
+
+def reserve_stream(request) -> Optional[_Slot]:
+    """
+    ASGI下为同步流式响应预留读取线程名额，名额用尽时抛出StreamsBusy；WSGI下返回None
+
+    视图在写库之前调用，避免创建了对话记录却无法输出
+    """
+    if not is_asgi(request):
+        return None
+    return get_stream_executor().reserve()
+
+
+def stream_body(request, iterator, slot: Optional[_Slot] = None):
+    """
+    流式响应的内容：WSGI下原样返回同步迭代器；ASGI下异步迭代器原样返回，
+    同步迭代器交给专用线程池逐个读取（使用预留的名额，未预留时当场申请，名额用尽时抛出StreamsBusy）
+    """
+    if not is_asgi(request) or hasattr(iterator, '__aiter__'):
+        return iterator
+    try:
+        return get_stream_executor().open(iterator, get_disconnect_event(request), slot)
+    except StreamsBusy:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+        raise
@@ -10,87 +10,135 @@ def get_agent_manager():
     return _agent_manager
 
 
+# 智能体描述：类型、类的导入路径、名称、说明和能力列表，注册和列出智能体时都不导入智能体模块
+# 名称、说明和能力需与智能体类中的定义保持一致（tests/test_startup.py校验）
+AGENT_DESCRIPTORS = [
+    {
+        "agent_type": "general_qa",
+        "import_path": "agents.general_qa.agent:GeneralQAAgent",
+        "name": "通用问答助手",
+        "description": "基于LangGraph的智能通用问答助手，支持复杂对话流程和专业智能体路由",
+        "capabilities": ["通用知识问答", "问题解答", "建议咨询", "专业智能体路由"],
+    },
+    {
+        "agent_type": "speech_writer",
+        "import_path": "agents.speech_writer.agent:SpeechWriterAgent",
+        "name": "发言稿智能体",
+        "description": "专业的发言稿撰写助手，支持各类正式场合的发言稿创作",
+        "capabilities": [
+            "会议致辞撰写", "庆典讲话创作", "年会发言稿", "动员大会讲话", "党会发言稿", "新年致辞撰写",
+            "学术演讲稿", "培训讲话", "就职演说", "表彰大会发言", "开业致辞", "毕业典礼发言", "追悼致辞",
+            "竞聘演讲", "感谢致辞", "欢迎致辞", "项目启动讲话", "安全教育发言", "团建活动致辞",
+            "产品发布演讲", "工作汇报演讲",
+        ],
+    },
+    {
+        "agent_type": "news_writer",
+        "import_path": "agents.news_writer.agent:NewsWriterAgent",
+        "name": "新闻稿智能体",
+        "description": "专业的新闻稿撰写助手，支持各类新闻稿件的创作",
+        "capabilities": [
+            "企业新闻稿撰写", "产品发布新闻", "人事变动公告", "合作协议新闻", "活动报道撰写", "业绩公告新闻",
+            "危机公关稿件", "媒体通稿撰写",
+        ],
+    },
+    {
+        "agent_type": "official_document",
+        "import_path": "agents.official_document.agent:OfficialDocumentAgent",
+        "name": "智能公文智能体",
+        "description": "专业的公文撰写助手，支持各类公文格式的标准化创作",
+        "capabilities": [
+            "通知公告撰写", "请示报告起草", "批复文件撰写", "函件商洽起草", "会议纪要整理", "工作方案制定",
+            "规章制度起草", "总结报告撰写", "调研报告编制", "公文格式规范化",
+        ],
+    },
+    {
+        "agent_type": "research_report",
+        "import_path": "agents.research_report.agent:ResearchReportAgent",
+        "name": "智能研报智能体",
+        "description": "专业的研究报告撰写助手，支持各类研究报告的深度分析和撰写",
+        "capabilities": [
+            "市场调研报告撰写", "行业分析报告", "可行性研究报告", "竞争分析报告", "技术调研报告", "投资研究报告",
+            "商业计划书", "尽职调查报告", "战略咨询报告", "专题研究报告",
+        ],
+    },
+    {
+        "agent_type": "code_assistant",
+        "import_path": "agents.code_assistant.agent:CodeAssistantAgent",
+        "name": "智能代码助手",
+        "description": "专业的代码助手，支持代码生成、分析、优化和调试",
+        "capabilities": [
+            "多语言代码生成", "代码审查与优化", "Bug调试和修复", "代码重构和改进", "架构设计咨询",
+            "代码解释和文档", "最佳实践建议", "性能优化指导", "单元测试编写", "API设计和实现",
+        ],
+    },
+    {
+        "agent_type": "data_analysis",
+        "import_path": "agents.data_analysis.agent:DataAnalysisAgent",
+        "name": "数据分析智能体",
+        "description": "专业的数据分析助手，支持数据处理、分析和可视化",
+        "capabilities": [
+            "数据清洗与预处理", "描述性统计分析", "预测建模与预报", "数据可视化设计", "业务洞察分析", "A/B测试设计",
+            "用户行为分析", "销售数据分析", "财务数据分析", "市场调研分析",
+        ],
+    },
+]
+
+
+def _attach_specialists(general_qa_agent, registry):
+    """通用问答智能体通过注册表视图访问专业智能体，专业智能体在首次路由到时才加载"""
+    from .base import AgentType
+    general_qa_agent.specialist_agents = registry.view(exclude=[AgentType.GENERAL_QA])
+
+
 def create_agent_manager():
-    """创建并配置智能体管理器"""
+    """
+    创建并配置智能体管理器
+
+    只登记智能体描述，不导入智能体模块、不创建模型客户端；各智能体在首次处理消息时加载
+    """
+    import importlib.util
+    import logging
+    import time
+    from .base import AgentType
     from .manager import AgentManager
-    from ..general_qa.agent import GeneralQAAgent
+    from .registry import AgentDescriptor
     from .llm_manager import set_ollama_env
-    
+
+    logger = logging.getLogger(__name__)
+    phase_start = total_start = time.perf_counter()
+
+    def log_phase(phase):
+        nonlocal phase_start
+        now = time.perf_counter()
+        logger.info(f"智能体初始化阶段 {phase} 耗时 {(now - phase_start) * 1000:.1f}ms")
+        phase_start = now
+
     # 设置使用Ollama
     set_ollama_env("qwen3:8B")
     print("✓ 已配置使用本地Ollama模型 qwen3:8B")
-    
+    log_phase("配置模型")
+
     manager = AgentManager()
-    
-    try:
-        # 创建通用问答智能体
-        general_qa_agent = GeneralQAAgent()
-        manager.register_agent(general_qa_agent)
-        print("✓ 通用问答智能体注册成功")
-        
-        # 尝试导入并注册其他智能体
-        try:
-            from ..speech_writer.agent import SpeechWriterAgent
-            speech_writer_agent = SpeechWriterAgent()
-            manager.register_agent(speech_writer_agent)
-            general_qa_agent.register_specialist_agent(speech_writer_agent.agent_type, speech_writer_agent)
-            print("✓ 发言稿写作智能体注册成功")
-        except ImportError as e:
-            print(f"⚠ 发言稿写作智能体未找到: {e}")
-        
-        try:
-            from ..news_writer.agent import NewsWriterAgent
-            news_writer_agent = NewsWriterAgent()
-            manager.register_agent(news_writer_agent)
-            general_qa_agent.register_specialist_agent(news_writer_agent.agent_type, news_writer_agent)
-            print("✓ 新闻稿写作智能体注册成功")
-        except ImportError as e:
-            print(f"⚠ 新闻稿写作智能体未找到: {e}")
-        
-        try:
-            from ..official_document.agent import OfficialDocumentAgent
-            official_document_agent = OfficialDocumentAgent()
-            manager.register_agent(official_document_agent)
-            general_qa_agent.register_specialist_agent(official_document_agent.agent_type, official_document_agent)
-            print("✓ 公文写作智能体注册成功")
-        except ImportError as e:
-            print(f"⚠ 公文写作智能体未找到: {e}")
-        
-        try:
-            from ..research_report.agent import ResearchReportAgent
-            research_report_agent = ResearchReportAgent()
-            manager.register_agent(research_report_agent)
-            general_qa_agent.register_specialist_agent(research_report_agent.agent_type, research_report_agent)
-            print("✓ 研报写作智能体注册成功")
-        except ImportError as e:
-            print(f"⚠ 研报写作智能体未找到: {e}")
-        
-        try:
-            from ..code_assistant.agent import CodeAssistantAgent
-            code_assistant_agent = CodeAssistantAgent()
-            manager.register_agent(code_assistant_agent)
-            general_qa_agent.register_specialist_agent(code_assistant_agent.agent_type, code_assistant_agent)
-            print("✓ 代码助手智能体注册成功")
-        except ImportError as e:
-            print(f"⚠ 代码助手智能体未找到: {e}")
-        
-        try:
-            from ..data_analysis.agent import DataAnalysisAgent
-            data_analysis_agent = DataAnalysisAgent()
-            manager.register_agent(data_analysis_agent)
-            general_qa_agent.register_specialist_agent(data_analysis_agent.agent_type, data_analysis_agent)
-            print("✓ 数据分析智能体注册成功")
-        except ImportError as e:
-            print(f"⚠ 数据分析智能体未找到: {e}")
-        
-    except Exception as e:
-        print(f"智能体初始化出错: {e}")
-        # 如果出错，至少确保有一个通用问答智能体
-        if not manager.agents:
-            from ..general_qa.agent import GeneralQAAgent
-            general_qa_agent = GeneralQAAgent()
-            manager.register_agent(general_qa_agent)
-    
+    log_phase("创建管理器")
+
+    for entry in AGENT_DESCRIPTORS:
+        descriptor = AgentDescriptor(**{**entry, "agent_type": AgentType(entry["agent_type"])})
+        if descriptor.agent_type == AgentType.GENERAL_QA:
+            descriptor.setup = _attach_specialists
+        else:
+            try:
+                found = importlib.util.find_spec(descriptor.module_name) is not None
+            except ImportError:
+                found = False
+            if not found:
+                print(f"⚠ {descriptor.name}未找到: {descriptor.module_name}")
+                continue
+        manager.register_descriptor(descriptor)
+        print(f"✓ {descriptor.name}注册成功")
+    log_phase("登记智能体")
+
+    logger.info(f"智能体初始化总耗时 {(time.perf_counter() - total_start) * 1000:.1f}ms")
     print(f"智能体系统初始化完成，注册了 {len(manager.agents)} 个智能体")
     return manager
 
@@ -0,0 +1,209 @@
+"""
+异步生成任务
+研究报告、长篇讲话稿等长文生成不占用HTTP请求：提交后立即返回job_id，由Celery工作进程运行智能体。
+生成中的增量、进度和已完成的章节写入帧缓冲（与可续传流式输出共用），客户端轮询任务状态或通过SSE订阅；
+结果保存为文档及文档版本。任务以job_id作为生成检查点ID，工作进程崩溃后重新投递的任务从检查点续跑
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Dict, Iterator, Optional, Set
+
+from asgiref.sync import sync_to_async
+
+from .base import AgentType
+from .checkpoints import get_checkpoint_store
+from .stream_buffer import get_stream_buffer
+from .streaming import coalesce_deltas, sse_content_frame, sse_frame
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+class JobQueueUnavailable(Exception):
+    """任务无法投递到Celery（消息代理不可用）"""
+
+
+def _load_job(job_id: str):
+    from .models import GenerationJob
+    return GenerationJob.objects.filter(job_id=job_id).first()
+
+
+def _update_job(job_id: str, **fields):
+    from django.utils import timezone
+    from .models import GenerationJob
+    GenerationJob.objects.filter(job_id=job_id).update(updated_at=timezone.now(), **fields)
+
+
+def submit_job(message: str, agent_type_str: str, conversation_id: Optional[int] = None,
+               user_id: Optional[int] = None, metadata: Optional[Dict[str, Any]] = None):
+    """保存用户消息和任务记录并投递到Celery，返回任务记录；对话不存在或不属于该用户时抛出Conversation.DoesNotExist"""
+    from django.conf import settings
+    from .models import Conversation, GenerationJob, Message
+    from .tasks import run_generation_job
+
+    if conversation_id:
+        conversation = Conversation.objects.get(id=conversation_id, user_id=user_id)
+    else:
+        conversation = Conversation.objects.create(user_id=user_id)
+    Message.objects.create(
+        conversation_id=conversation.id,
+        content=message,
+        agent_type=agent_type_str,
+        is_user_message=True
+    )
+    job = GenerationJob.objects.create(
+        job_id=uuid.uuid4().hex,
+        conversation_id=conversation.id,
+        agent_type=agent_type_str,
+        prompt=message,
+        metadata=metadata or {}
+    )
+    # 先建立帧缓冲，工作进程开始执行前订阅请求即可连接
+    buffer = get_stream_buffer()
+    buffer.open(job.job_id)
+    try:
+        run_generation_job.delay(job.job_id)
+    except Exception as e:
+        logger.error(f"生成任务 {job.job_id} 投递失败: {e}")
+        _update_job(job.job_id, status='failed', error=f'Job queue unavailable: {e}')
+        buffer.finish(job.job_id)
+        raise JobQueueUnavailable(str(e)) from e
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        # 任务已在本进程中执行完毕
+        job.refresh_from_db()
+    return job
+
+
+class JobPublisher:
+    """把任务事件写入帧缓冲，缓冲不可用时只记录告警，不影响生成"""
+
+    def __init__(self, buffer, job_id: str):
+        self.buffer = buffer
+        self.job_id = job_id
+
+    def publish(self, frame: str):
+        try:
+            self.buffer.append(self.job_id, frame)
+        except Exception as e:
+            logger.warning(f"生成任务 {self.job_id} 写入帧缓冲失败: {e}")
+
+    def finish(self):
+        try:
+            self.buffer.finish(self.job_id)
+        except Exception as e:
+            logger.warning(f"生成任务 {self.job_id} 结束标记写入失败: {e}")
+
+
+async def _generate(job, publisher: JobPublisher):
+    """运行智能体，转发增量和进度，每有章节完成即推送章节内容；返回最终响应"""
+    from .initialization import lazy_get_agent_manager
+
+    metadata = {**(job.metadata or {}), 'generation_id': job.job_id}
+    published: Set[str] = set()
+    final_response = None
+    agent_manager = lazy_get_agent_manager()
+    async for event in coalesce_deltas(
+        agent_manager.stream_message(job.prompt, AgentType(job.agent_type), metadata, job.conversation_id)
+    ):
+        if event.type == 'delta':
+            publisher.publish(sse_content_frame(event.delta))
+        elif event.type == 'progress':
+            await sync_to_async(_update_job)(job.job_id, progress=event.response)
+            publisher.publish(sse_frame({'type': 'progress', 'data': event.response}))
+            await _publish_sections(job.job_id, event.response, published, publisher)
+        else:
+            final_response = event.response
+    return final_response
+
+
+async def _publish_sections(job_id: str, progress: Dict[str, Any], published: Set[str], publisher: JobPublisher):
+    """从检查点读取新完成的章节并推送，续跑时检查点中已有的章节一并推送"""
+    names = [name for name in progress.get('completed_steps', []) if name not in published]
+    if not names:
+        return
+    try:
+        checkpoint = await get_checkpoint_store().load(job_id)
+    except Exception as e:
+        logger.warning(f"读取生成检查点失败: {e}")
+        return
+    for name in names:
+        if checkpoint is not None and name in checkpoint.steps:
+            published.add(name)
+            publisher.publish(sse_frame({'type': 'section', 'data': {'name': name, 'content': checkpoint.steps[name]}}))
+
+
+def run_job(job_id: str):
+    """工作进程中执行任务：运行智能体并发布事件，保存消息和文档后更新任务状态"""
+    from .utils import markdown_to_plain_text
+    from .views import persist_agent_response
+
+    job = _load_job(job_id)
+    if job is None or job.status in TERMINAL_STATUSES:
+        # 任务已被删除或重复投递
+        return
+    _update_job(job_id, status='running')
+    buffer = get_stream_buffer()
+    if not buffer.exists(job_id):
+        # 进程内缓冲不与Web进程共享，或缓冲已过期
+        buffer.open(job_id)
+    publisher = JobPublisher(buffer, job_id)
+
+    try:
+        try:
+            final_response = asyncio.run(_generate(job, publisher))
+        except Exception as e:
+            logger.error(f"生成任务 {job_id} 执行失败: {e}")
+            _update_job(job_id, status='failed', error=str(e))
+            publisher.publish(sse_frame({'type': 'error', 'data': str(e)}))
+            return
+
+        document_id = persist_agent_response(job.conversation_id, job.agent_type, final_response)
+        if final_response.success:
+            _update_job(job_id, status='completed', document_id=document_id)
+            publisher.publish(sse_frame({'type': 'complete', 'data': {
+                'job_id': job_id,
+                'status': 'completed',
+                'document_id': document_id,
+                'raw_content': final_response.content,
+                'formatted_content': markdown_to_plain_text(final_response.content),
+                'metadata': final_response.metadata
+            }}))
+        else:
+            _update_job(job_id, status='failed', error=final_response.content)
+            publisher.publish(sse_frame({'type': 'error', 'data': final_response.content}))
+    finally:
+        publisher.finish()
+
+
+def job_result_frame(job) -> str:
+    """已结束任务的结果帧，内容需按document_id读取文档"""
+    if job.status == 'completed':
+        return sse_frame({'type': 'complete', 'data': {'job_id': job.job_id, 'status': job.status,
+                                                       'document_id': job.document_id}})
+    return sse_frame({'type': 'error', 'data': job.error})
+
+
+def poll_job_frames(job_id: str, disconnected=None, interval: Optional[float] = None) -> Iterator[str]:
+    """
+    帧缓冲中没有该任务时（缓冲已过期，或工作进程使用进程内缓冲）轮询任务记录，
+    进度变化时推送progress帧，任务结束后推送结果帧
+    """
+    if interval is None:
+        from django.conf import settings
+        interval = settings.GENERATION_JOB_POLL_INTERVAL
+    last_progress = None
+    while disconnected is None or not disconnected.is_set():
+        job = _load_job(job_id)
+        if job is None:
+            return
+        if job.status in TERMINAL_STATUSES:
+            yield job_result_frame(job)
+            return
+        if job.progress and job.progress != last_progress:
+            last_progress = job.progress
+            yield sse_frame({'type': 'progress', 'data': job.progress})
+        time.sleep(interval)
@@ -337,6 +337,26 @@ class OllamaProvider(BaseLLMProvider):
                                 self.content = content
                         
                         return OllamaResponse(response)
+
+                    async def astream(self, messages):
+                        # 提取最后一条用户消息
+                        if isinstance(messages, list) and len(messages) > 0:
+                            last_message = messages[-1]
+                            content = last_message.content if hasattr(last_message, 'content') else str(last_message)
+                        else:
+                            content = str(messages)
+
+                        class OllamaChunk:
+                            def __init__(self, content):
+                                self.content = content
+
+                        stream = self.llm.astream(content)
+                        try:
+                            async for text in stream:
+                                yield OllamaChunk(text)
+                        finally:
+                            # 调用方停止迭代时关闭底层HTTP流，Ollama随即停止生成
+                            await stream.aclose()
                 
                 ollama_llm = Ollama(
                     model=config.model,
@@ -416,6 +436,13 @@ class MockProvider(BaseLLMProvider):
                 class MockResponse:
                     content = f"这是来自{self.model_name}的模拟响应"
                 return MockResponse()
+
+            async def astream(self, messages):
+                class MockChunk:
+                    def __init__(self, content):
+                        self.content = content
+                for piece in ["这是来自", self.model_name, "的模拟响应"]:
+                    yield MockChunk(piece)
         
         return MockLLM(config.model)
     
@@ -1,103 +1,158 @@
-from typing import Dict, List, Type, Optional
-from langgraph.graph import StateGraph, END
-from .base import BaseAgent, AgentType, AgentMessage, AgentResponse, AgentState
+from typing import Annotated, Any, AsyncIterator, Dict, List, Type, Optional, Tuple, TypedDict
+from .base import BaseAgent, AgentType, AgentMessage, AgentResponse
+from .memory import ConversationMemory, load_conversation_memory
+from .registry import AgentDescriptor, LazyAgentRegistry
+from .streaming import StreamEvent, stream_process
 import asyncio
+import operator
 import time
 import uuid
 from datetime import datetime
 
 
+# 工作流中后一步智能体看到的前一步输出的最大字符数
+WORKFLOW_HANDOFF_CHARS = 6000
+
+
+class WorkflowState(TypedDict):
+    """多智能体工作流的图状态，每一步的响应按顺序追加到responses"""
+    content: str
+    metadata: Optional[Dict[str, Any]]
+    history: Optional[ConversationMemory]
+    responses: Annotated[List[AgentResponse], operator.add]
+
+
 class AgentManager:
     def __init__(self):
-        self.agents: Dict[AgentType, BaseAgent] = {}
-        self.graph = None
+        self.agents: LazyAgentRegistry = LazyAgentRegistry()
+        # 按步骤序列缓存编译好的工作流图，只在请求工作流时编译
+        self._workflow_graphs: Dict[Tuple[AgentType, ...], Any] = {}
     # 注册智能体
     def register_agent(self, agent: BaseAgent):
-        self.agents[agent.agent_type] = agent
-        self._build_graph()
+        self.register_agents([agent])
+    # 批量注册智能体，注册本身不编译任何图
+    def register_agents(self, agents: List[BaseAgent]):
+        for agent in agents:
+            self.agents[agent.agent_type] = agent
+        self._workflow_graphs.clear()
+    # 登记智能体描述，智能体在首次处理消息时才导入并实例化
+    def register_descriptor(self, descriptor: AgentDescriptor):
+        self.agents.register(descriptor)
+        self._workflow_graphs.clear()
     # 获取智能体
     def get_agent(self, agent_type: AgentType) -> Optional[BaseAgent]:
         return self.agents.get(agent_type)
-    # 列出所有智能体
-    def list_agents(self) -> List[Dict[str, str]]:
+    # 列出所有智能体，只读取登记的描述信息，不导入和实例化尚未加载的智能体
+    def list_agents(self) -> List[Dict[str, Any]]:
+        descriptors = [self.agents.descriptor(agent_type) for agent_type in self.agents]
         return [
             {
-                "type": agent.agent_type.value,
-                "name": agent.name,
-                "description": agent.description,
-                "capabilities": agent.get_capabilities()
+                "type": descriptor.agent_type.value,
+                "name": descriptor.name,
+                "description": descriptor.description,
+                "capabilities": list(descriptor.capabilities)
             }
-            for agent in self.agents.values()
+            for descriptor in descriptors
         ]
-    # 构建智能体图
-    def _build_graph(self):
-        if not self.agents:
-            return
-            
-        # 简化图结构，创建独立的节点，每个节点都连接到END
-        graph = StateGraph(AgentState)
-        
-        # 添加节点并设置边关系
-        for agent_type, agent in self.agents.items():
-            node_name = agent_type.value
-            graph.add_node(node_name, self._create_agent_node(agent))
-            # 每个节点处理完成后都结束流程
-            graph.add_edge(node_name, END)
-
-        # 设置默认入口点
-        if AgentType.GENERAL_QA in self.agents:
-            graph.set_entry_point("general_qa")
-        elif self.agents:
-            # 如果没有通用问答助手，使用第一个智能体作为入口
-            first_agent = list(self.agents.keys())[0]
-            graph.set_entry_point(first_agent.value)
 
-        try:
-            self.graph = graph.compile()
-        except Exception as e:
-            print(f"Warning: Failed to compile graph: {e}")
-            # 创建一个简单的回退方案
-            self.graph = None
-
-    def _create_agent_node(self, agent: BaseAgent):
-        async def agent_node(state: AgentState):
-            if state.messages:
-                last_message = state.messages[-1]
-                start_time = time.time()
-                try:
-                    response = await agent.process(last_message)
-                    execution_time = time.time() - start_time
-                    response.execution_time = execution_time
-                    
-                    result_message = AgentMessage(
-                        id=str(uuid.uuid4()),
-                        content=response.content,
-                        agent_type=agent.agent_type,
-                        timestamp=datetime.now()
-                    )
-                    state.add_message(result_message)
-                    state.update_context(f"{agent.agent_type.value}_response", response)
-                    
-                except Exception as e:
-                    error_message = AgentMessage(
-                        id=str(uuid.uuid4()),
-                        content=f"Error: {str(e)}",
-                        agent_type=agent.agent_type,
-                        timestamp=datetime.now()
-                    )
-                    state.add_message(error_message)
-                    
-            return state
-        return agent_node
-
-    async def process_message(self, content: str, agent_type: AgentType = AgentType.GENERAL_QA) -> AgentResponse:
+    def get_workflow_graph(self, steps: List[AgentType]):
+        """获取按steps顺序串联智能体的工作流图，同一步骤序列只编译一次"""
+        key = tuple(steps)
+        if key not in self._workflow_graphs:
+            self._workflow_graphs[key] = self._build_workflow_graph(key)
+        return self._workflow_graphs[key]
+
+    def _build_workflow_graph(self, steps: Tuple[AgentType, ...]):
+        """构建工作流图：每一步处理完成后，成功则进入下一步，失败则结束"""
+        from langgraph.graph import StateGraph, END
+
+        graph = StateGraph(WorkflowState)
+        node_names = [f"{index}_{agent_type.value}" for index, agent_type in enumerate(steps)]
+        for index, agent_type in enumerate(steps):
+            graph.add_node(node_names[index], self._create_workflow_node(index, agent_type, steps))
+        graph.set_entry_point(node_names[0])
+        for index, node_name in enumerate(node_names):
+            next_node = node_names[index + 1] if index + 1 < len(node_names) else END
+            graph.add_conditional_edges(
+                node_name,
+                lambda state, next_node=next_node: next_node if state["responses"][-1].success else END
+            )
+        return graph.compile()
+
+    def _create_workflow_node(self, index: int, agent_type: AgentType, steps: Tuple[AgentType, ...]):
+        async def workflow_node(state: WorkflowState):
+            content = state["content"]
+            if index > 0:
+                previous = state["responses"][-1]
+                content = (
+                    f"{content}\n\n"
+                    f"以下是上一步（{steps[index - 1].value}）的输出，请在此基础上完成你的部分：\n"
+                    f"{previous.content[:WORKFLOW_HANDOFF_CHARS]}"
+                )
+            response = await self.process_message(
+                content, agent_type, state["metadata"], history=state["history"]
+            )
+            return {"responses": [response]}
+        return workflow_node
+
+    async def run_workflow(self, content: str, steps: List[AgentType],
+                           metadata: Optional[Dict[str, Any]] = None,
+                           conversation_id: Optional[int] = None) -> AgentResponse:
+        """
+        按顺序执行多智能体工作流，前一步的输出交给下一步继续处理
+
+        返回最后一步的响应，metadata.workflow_steps记录每一步的执行情况；某一步失败时提前结束
+        """
+        start_time = time.time()
+        missing = [agent_type for agent_type in steps if agent_type not in self.agents]
+        if not steps or missing:
+            return AgentResponse(
+                success=False,
+                content="Agent not found",
+                agent_type=missing[0] if missing else AgentType.GENERAL_QA,
+                execution_time=0,
+                error="Agent type not registered"
+            )
+
+        history = await load_conversation_memory(conversation_id, content) if conversation_id else None
+        state = await self.get_workflow_graph(steps).ainvoke({
+            "content": content,
+            "metadata": metadata,
+            "history": history,
+            "responses": []
+        })
+        responses = state["responses"]
+        final = responses[-1]
+        final.metadata = {
+            **(final.metadata or {}),
+            "workflow_steps": [
+                {
+                    "agent_type": response.agent_type.value,
+                    "success": response.success,
+                    "execution_time": response.execution_time
+                }
+                for response in responses
+            ]
+        }
+        final.execution_time = time.time() - start_time
+        return final
+
+    async def process_message(self, content: str, agent_type: AgentType = AgentType.GENERAL_QA,
+                              metadata: Optional[Dict[str, Any]] = None,
+                              conversation_id: Optional[int] = None,
+                              history: Optional[ConversationMemory] = None) -> AgentResponse:
         if agent_type in self.agents:
             agent = self.agents[agent_type]
+            # 指定对话时在token预算内带上历史上下文
+            if history is None and conversation_id:
+                history = await load_conversation_memory(conversation_id, content)
             message = AgentMessage(
                 id=str(uuid.uuid4()),
                 content=content,
                 agent_type=agent_type,
-                timestamp=datetime.now()
+                timestamp=datetime.now(),
+                metadata=metadata,
+                history=history
             )
             return await agent.process(message)
         else:
@@ -107,4 +162,58 @@ class AgentManager:
                 agent_type=agent_type,
                 execution_time=0,
                 error="Agent type not registered"
-            )
\ No newline at end of file
+            )
+
+    async def stream_message(self, content: str, agent_type: AgentType = AgentType.GENERAL_QA,
+                             metadata: Optional[Dict[str, Any]] = None,
+                             conversation_id: Optional[int] = None,
+                             history: Optional[ConversationMemory] = None) -> AsyncIterator[StreamEvent]:
+        """
+        流式处理消息：模型生成正文时逐段产出增量，处理完成后产出包含格式化结果的最终响应
+
+        不支持增量输出的处理路径（如分章节并行生成、缓存命中）只产出最终响应，分章节生成每完成一步产出一次进度
+        """
+        # 调用方停止迭代时立即关闭内层生成器，取消处理任务
+        events = stream_process(
+            lambda: self.process_message(content, agent_type, metadata, conversation_id, history)
+        )
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+    async def process_many(self, content: str, agent_types: List[AgentType],
+                           metadata: Optional[Dict[str, Any]] = None,
+                           conversation_id: Optional[int] = None) -> AsyncIterator[AgentResponse]:
+        """
+        将同一条消息并发分发给多个智能体，按完成顺序逐个产出结果
+
+        总耗时取决于最慢的智能体而非各智能体耗时之和；调用方提前停止迭代
+        （如客户端断开）时，尚未完成的智能体任务会被一并取消
+        """
+        # 各智能体共用同一份历史上下文，只加载一次
+        history = await load_conversation_memory(conversation_id, content) if conversation_id else None
+        tasks = {
+            asyncio.ensure_future(self.process_message(content, agent_type, metadata, history=history)): agent_type
+            for agent_type in dict.fromkeys(agent_types)
+        }
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        yield task.result()
+                    except Exception as e:
+                        yield AgentResponse(
+                            success=False,
+                            content=f"处理消息时发生错误: {str(e)}",
+                            agent_type=tasks[task],
+                            execution_time=0,
+                            error=str(e)
+                        )
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,189 @@
+"""
+对话记忆
+加载对话中最近的消息，在token预算内组装为提示词上下文：最近几轮保留原文，更早的轮次压缩为摘要。
+已由后台折叠进滚动摘要（见summaries.py）的消息直接复用保存的摘要
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+# 历史上下文的token预算
+MEMORY_TOKEN_BUDGET = int(os.getenv('CONVERSATION_MEMORY_TOKENS', '2000'))
+# 最多加载的历史消息条数
+MEMORY_MAX_MESSAGES = int(os.getenv('CONVERSATION_MEMORY_MAX_MESSAGES', '40'))
+# 预算中用于保留原文的比例，其余用于更早轮次的摘要
+RECENT_SHARE = 0.75
+# 摘要中每条消息保留的字符数
+SUMMARY_LINE_CHARS = 80
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约每字1个token，其余字符约每4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """截断文本使其不超过预算，保留开头部分"""
+    if estimate_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + "…（已截断）"
+
+
+@dataclass
+class ConversationTurn:
+    """对话中的一条消息"""
+    role: str  # user, assistant
+    content: str
+    agent_type: str = ''
+
+
+@dataclass
+class ConversationMemory:
+    """组装好的历史上下文：更早轮次的摘要加最近轮次的原文"""
+    summary: str = ''
+    recent: List[ConversationTurn] = field(default_factory=list)
+    omitted_turns: int = 0
+    stored_summary_tokens: int = 0  # 复用的滚动摘要的token数
+    stored_summary_updated_at: Any = None
+
+    @property
+    def token_count(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(turn.content) for turn in self.recent)
+
+    def is_empty(self) -> bool:
+        return not self.summary and not self.recent
+
+    def to_messages(self) -> List[Any]:
+        """转换为LangChain消息列表，插在系统提示与当前用户消息之间"""
+        from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+        messages = []
+        if self.summary:
+            messages.append(SystemMessage(content=f"此前对话摘要：\n{self.summary}"))
+        for turn in self.recent:
+            if turn.role == 'user':
+                messages.append(HumanMessage(content=turn.content))
+            else:
+                messages.append(AIMessage(content=turn.content))
+        return messages
+
+
+def summarize_turns(turns: List[ConversationTurn], budget: int) -> str:
+    """将较早的轮次压缩为逐条的要点摘要，预算不足时优先舍弃最早的轮次"""
+    # 预留省略提示所需的预算
+    used = estimate_tokens(f"（更早的{len(turns)}条消息已省略）")
+    if used > budget:
+        return ''
+    lines: List[str] = []
+    for turn in reversed(turns):
+        text = re.sub(r'[#>*`]+', '', turn.content).strip()
+        first_line = text.split('\n', 1)[0].strip()
+        speaker = '用户' if turn.role == 'user' else f"助手（{turn.agent_type}）" if turn.agent_type else '助手'
+        line = f"- {speaker}：{first_line[:SUMMARY_LINE_CHARS]}"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        lines.insert(0, line)
+        used += cost
+    if len(lines) < len(turns):
+        lines.insert(0, f"（更早的{len(turns) - len(lines)}条消息已省略）")
+    return "\n".join(lines)
+
+
+def build_memory(turns: List[ConversationTurn], budget: int = MEMORY_TOKEN_BUDGET,
+                 stored_summary: str = '') -> ConversationMemory:
+    """
+    在预算内组装历史上下文
+
+    从最新的轮次往前保留原文，直到用完原文预算；最新一轮过长时截断保留。
+    其余较早的轮次压缩为摘要，占用剩余预算；已保存的滚动摘要优先放入摘要部分。
+    """
+    if (not turns and not stored_summary) or budget <= 0:
+        return ConversationMemory()
+
+    recent_budget = int(budget * RECENT_SHARE)
+    recent: List[ConversationTurn] = []
+    used = 0
+    for turn in reversed(turns):
+        cost = estimate_tokens(turn.content)
+        if used + cost > recent_budget:
+            if not recent:
+                recent.append(ConversationTurn(turn.role, truncate_to_tokens(turn.content, recent_budget), turn.agent_type))
+                used = recent_budget
+            break
+        recent.insert(0, turn)
+        used += cost
+
+    older = turns[:len(turns) - len(recent)]
+    summary_parts = []
+    if stored_summary:
+        stored_summary = truncate_to_tokens(stored_summary, max(budget - used, 0))
+        summary_parts.append(stored_summary)
+        used += estimate_tokens(stored_summary)
+    if older:
+        summary_parts.append(summarize_turns(older, budget - used))
+    summary = "\n".join(part for part in summary_parts if part)
+    return ConversationMemory(summary=summary, recent=recent, omitted_turns=len(older))
+
+
+def load_conversation_turns(conversation_id: int, current_content: Optional[str] = None,
+                            limit: int = MEMORY_MAX_MESSAGES, after_id: int = 0) -> List[ConversationTurn]:
+    """加载对话中ID大于after_id的最近消息，按时间顺序返回"""
+    from .models import Message
+    from .write_behind import ensure_persisted
+
+    # 开启延迟写入时，先写入该对话尚未写库的消息
+    ensure_persisted(conversation_id=conversation_id)
+
+    rows = list(
+        Message.objects.filter(conversation_id=conversation_id, id__gt=after_id)
+        .order_by('-id').values_list('content', 'is_user_message', 'agent_type')[:limit]
+    )
+    # 流式聊天、多智能体和异步任务接口在调用智能体前已保存当前用户消息，不应重复计入历史；
+    # 普通聊天接口在智能体返回后才与回复一并保存，最近一条用户消息属于上一轮
+    if rows and current_content is not None and rows[0][1] and rows[0][0] == current_content:
+        rows = rows[1:]
+    return [
+        ConversationTurn(role='user' if is_user else 'assistant', content=content,
+                         agent_type='' if is_user else agent_type)
+        for content, is_user, agent_type in reversed(rows)
+    ]
+
+
+async def load_conversation_memory(conversation_id: int, current_content: Optional[str] = None,
+                                   budget: int = MEMORY_TOKEN_BUDGET) -> ConversationMemory:
+    """加载并组装对话的历史上下文，已折叠进滚动摘要的消息不再加载，加载失败时返回空上下文"""
+    from .summaries import load_summary_state
+
+    def load():
+        state = load_summary_state(conversation_id)
+        return state, load_conversation_turns(conversation_id, current_content, after_id=state.summarized_until)
+
+    try:
+        state, turns = await sync_to_async(load)()
+    except Exception as e:
+        logger.warning(f"加载对话历史失败: {e}")
+        return ConversationMemory()
+    memory = build_memory(turns, budget, state.summary)
+    memory.stored_summary_tokens = state.token_count
+    memory.stored_summary_updated_at = state.updated_at
+    return memory
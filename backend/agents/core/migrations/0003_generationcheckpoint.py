@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_document_message_document_id_documentversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationCheckpoint',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('generation_id', models.CharField(max_length=64, unique=True)),
+                ('agent_type', models.CharField(max_length=50)),
+                ('request_hash', models.CharField(max_length=64)),
+                ('status', models.CharField(default='running', max_length=20)),
+                ('steps', models.JSONField(blank=True, default=dict)),
+                ('total_steps', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-updated_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_generationcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('batch_id', models.CharField(max_length=64, unique=True)),
+                ('conversation_id', models.IntegerField()),
+                ('status', models.CharField(default='running', max_length=20)),
+                ('total_items', models.IntegerField(default=0)),
+                ('completed_items', models.IntegerField(default=0)),
+                ('failed_items', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BatchItem',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('batch_id', models.CharField(db_index=True, max_length=64)),
+                ('index', models.IntegerField()),
+                ('agent_type', models.CharField(max_length=50)),
+                ('prompt', models.TextField()),
+                ('status', models.CharField(default='pending', max_length=20)),
+                ('document_id', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('execution_time', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['index'],
+                'unique_together': {('batch_id', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_batchjob_batchitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('conversation_id', models.IntegerField(unique=True)),
+                ('summary', models.TextField(blank=True)),
+                ('summarized_until', models.IntegerField(default=0)),
+                ('summarized_messages', models.IntegerField(default=0)),
+                ('token_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
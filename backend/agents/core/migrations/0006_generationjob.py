@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_conversationsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('job_id', models.CharField(max_length=64, unique=True)),
+                ('conversation_id', models.IntegerField()),
+                ('agent_type', models.CharField(max_length=50)),
+                ('prompt', models.TextField()),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(default='queued', max_length=20)),
+                ('progress', models.JSONField(blank=True, default=dict)),
+                ('document_id', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -66,4 +66,84 @@ class AgentConfig(models.Model):
     is_enabled = models.BooleanField(default=True)
     config = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
\ No newline at end of file
+    updated_at = models.DateTimeField(auto_now=True)
+
+class GenerationCheckpoint(models.Model):
+    """长文生成检查点，记录分段生成中已完成的步骤，用于失败后续跑"""
+    id = models.AutoField(primary_key=True)
+    generation_id = models.CharField(max_length=64, unique=True)
+    agent_type = models.CharField(max_length=50)
+    request_hash = models.CharField(max_length=64)  # 原始请求摘要，续跑时校验是否为同一请求
+    status = models.CharField(max_length=20, default='running')  # running, failed, completed
+    steps = models.JSONField(default=dict, blank=True)  # 已完成步骤：{步骤名: 生成内容}
+    total_steps = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+
+
+class BatchJob(models.Model):
+    """批量生成任务，可按batch_id续跑未完成的条目"""
+    id = models.AutoField(primary_key=True)
+    batch_id = models.CharField(max_length=64, unique=True)
+    conversation_id = models.IntegerField()
+    status = models.CharField(max_length=20, default='running')  # running, completed, interrupted
+    total_items = models.IntegerField(default=0)
+    completed_items = models.IntegerField(default=0)
+    failed_items = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+
+
+class BatchItem(models.Model):
+    """批量生成任务中的单个条目"""
+    id = models.AutoField(primary_key=True)
+    batch_id = models.CharField(max_length=64, db_index=True)
+    index = models.IntegerField()  # 条目在请求中的序号
+    agent_type = models.CharField(max_length=50)
+    prompt = models.TextField()
+    status = models.CharField(max_length=20, default='pending')  # pending, completed, failed
+    document_id = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    execution_time = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['index']
+        unique_together = ['batch_id', 'index']
+
+
+class ConversationSummary(models.Model):
+    """对话的滚动摘要，较早的消息在响应返回后增量折叠进摘要"""
+    id = models.AutoField(primary_key=True)
+    conversation_id = models.IntegerField(unique=True)
+    summary = models.TextField(blank=True)
+    summarized_until = models.IntegerField(default=0)  # 已折叠进摘要的最后一条消息ID
+    summarized_messages = models.IntegerField(default=0)
+    token_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class GenerationJob(models.Model):
+    """异步生成任务，由Celery工作进程执行，结果保存为文档"""
+    id = models.AutoField(primary_key=True)
+    job_id = models.CharField(max_length=64, unique=True)
+    conversation_id = models.IntegerField()
+    agent_type = models.CharField(max_length=50)
+    prompt = models.TextField()
+    metadata = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, default='queued')  # queued, running, completed, failed
+    progress = models.JSONField(default=dict, blank=True)  # 最近一次分段生成进度
+    document_id = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
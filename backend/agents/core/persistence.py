@@ -0,0 +1,110 @@
+"""
+对话和文档的持久化
+每个操作在一个事务中完成并尽量减少查询：一轮对话的用户消息和智能体消息一次bulk_create；
+文档版本号以 F('current_version') + 1 原子递增，UPDATE持有行锁直到提交，并发编辑不会分配到相同的版本号
+"""
+
+from typing import Any, Dict, Optional
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Document, DocumentVersion, Message
+from .utils import detect_document_type, extract_title_from_content, markdown_to_plain_text
+
+
+def _create_version(document_id: int, version_number: int, content: str, operation_type: str,
+                    version_note: str = '') -> DocumentVersion:
+    return DocumentVersion.objects.create(
+        document_id=document_id,
+        version_number=version_number,
+        content=content,
+        raw_content=content,
+        formatted_content=markdown_to_plain_text(content),
+        version_note=version_note,
+        operation_type=operation_type
+    )
+
+
+def _create_document(conversation_id: int, content: str, agent_type: str) -> Document:
+    document = Document.objects.create(
+        conversation_id=conversation_id,
+        title=extract_title_from_content(content),
+        document_type=detect_document_type(content, agent_type),
+        current_version=1
+    )
+    _create_version(document.id, 1, content, 'create')
+    return document
+
+
+def _append_version(document_id: int, content: str, operation_type: str, version_note: str = '') -> Optional[int]:
+    """需在事务中调用；文档不存在时返回None"""
+    updated = Document.objects.filter(id=document_id).update(
+        current_version=F('current_version') + 1,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        return None
+    # UPDATE已锁定该行，读回的版本号即本事务分配的版本号
+    version_number = Document.objects.filter(id=document_id).values_list('current_version', flat=True).get()
+    _create_version(document_id, version_number, content, operation_type, version_note)
+    return version_number
+
+
+def create_document(conversation_id: int, content: str, agent_type: str) -> Document:
+    """创建文档及其第一个版本（2次查询）"""
+    with transaction.atomic():
+        return _create_document(conversation_id, content, agent_type)
+
+
+def append_document_version(document_id: int, content: str, operation_type: str = 'edit',
+                            version_note: str = '') -> int:
+    """递增文档当前版本并保存新版本，返回新版本号（3次查询）；文档不存在时抛出Document.DoesNotExist"""
+    with transaction.atomic():
+        version_number = _append_version(document_id, content, operation_type, version_note)
+    if version_number is None:
+        raise Document.DoesNotExist(f"Document {document_id} does not exist")
+    return version_number
+
+
+def load_document_content(document_id: int, version_number: Optional[int] = None) -> str:
+    """读取文档指定版本（未指定时为当前版本）的内容（1次查询）；不存在时抛出Document.DoesNotExist"""
+    versions = DocumentVersion.objects.filter(document_id=document_id)
+    if version_number:
+        versions = versions.filter(version_number=version_number)
+    else:
+        versions = versions.filter(
+            version_number=Subquery(Document.objects.filter(id=OuterRef('document_id')).values('current_version'))
+        )
+    content = versions.values_list('content', flat=True).first()
+    if content is None:
+        raise Document.DoesNotExist(f"Document {document_id} version {version_number or 'current'} does not exist")
+    return content
+
+
+def save_chat_turn(conversation_id: int, agent_type: str, response, user_message: Optional[Dict[str, Any]] = None,
+                   document_id: Optional[int] = None) -> Optional[int]:
+    """
+    在一个事务中保存一轮对话，返回文档ID
+
+    生成成功时更新指定文档（不存在时新建）或新建文档；user_message不为空时与智能体消息一起bulk_create
+    """
+    with transaction.atomic():
+        if response.success and response.content:
+            if not document_id or _append_version(document_id, response.content, 'edit') is None:
+                document_id = _create_document(conversation_id, response.content, agent_type).id
+        messages = [Message(**user_message)] if user_message else []
+        messages.append(Message(
+            conversation_id=conversation_id,
+            content=response.content,
+            agent_type=agent_type,
+            is_user_message=False,
+            document_id=document_id,
+            metadata={
+                'execution_time': response.execution_time,
+                'success': response.success
+            }
+        ))
+        Message.objects.bulk_create(messages)
+    return document_id
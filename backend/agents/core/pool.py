@@ -0,0 +1,73 @@
+"""
+智能体池
+各智能体的专属接口（api/agents/<agent>/）通过智能体池获取进程内共享的智能体实例，
+而不是在每个请求中重新创建智能体（及其模型客户端和流程图）
+"""
+
+from typing import Any, Callable, Dict, Optional
+
+from .base import AgentType, BaseAgent
+
+
+class AgentPool:
+    """按智能体类型提供共享的智能体实例，实例由智能体管理器统一创建和预热"""
+
+    def __init__(self, manager_factory: Optional[Callable[[], Any]] = None):
+        if manager_factory is None:
+            from .initialization import lazy_get_agent_manager
+            manager_factory = lazy_get_agent_manager
+        self._manager_factory = manager_factory
+
+    @property
+    def manager(self):
+        return self._manager_factory()
+
+    def get(self, agent_type: AgentType) -> BaseAgent:
+        """获取共享实例，智能体未注册时抛出KeyError"""
+        agent = self.manager.get_agent(agent_type)
+        if agent is None:
+            raise KeyError(f"智能体未注册: {agent_type.value}")
+        return agent
+
+    def __contains__(self, agent_type: AgentType) -> bool:
+        return agent_type in self.manager.agents
+
+    def describe(self, agent_type: AgentType) -> Dict[str, Any]:
+        agent = self.get(agent_type)
+        return {
+            'agent_type': agent.agent_type.value,
+            'name': agent.name,
+            'description': agent.description,
+            'capabilities': agent.get_capabilities()
+        }
+
+
+class AgentEndpointMixin:
+    """
+    智能体专属接口视图的混入类
+
+    子类设置agent_type后通过self.agent获取共享实例；Django每个请求都会实例化视图，
+    因此视图中不应持有或创建智能体
+    """
+    agent_type: AgentType = None
+
+    @property
+    def agent(self) -> BaseAgent:
+        return get_agent_pool().get(self.agent_type)
+
+
+# 全局智能体池
+_agent_pool: Optional[AgentPool] = None
+
+
+def get_agent_pool() -> AgentPool:
+    global _agent_pool
+    if _agent_pool is None:
+        _agent_pool = AgentPool()
+    return _agent_pool
+
+
+def set_agent_pool(pool: Optional[AgentPool]):
+    """替换全局智能体池"""
+    global _agent_pool
+    _agent_pool = pool
@@ -0,0 +1,157 @@
+"""
+智能体注册表
+启动时只登记智能体的描述信息，智能体模块在首次被请求时才导入并实例化，
+降低工作进程的冷启动耗时
+"""
+
+import importlib
+import logging
+import threading
+import time
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .base import AgentType, BaseAgent
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AgentDescriptor:
+    """智能体的描述信息，import_path形如 agents.news_writer.agent:NewsWriterAgent"""
+    agent_type: AgentType
+    import_path: str
+    name: str = ''
+    description: str = ''
+    # 静态能力列表，列出智能体时使用，无需实例化
+    capabilities: List[str] = field(default_factory=list)
+    # 实例化后调用，参数为智能体实例和注册表
+    setup: Optional[Callable[[BaseAgent, 'LazyAgentRegistry'], None]] = None
+
+    @property
+    def module_name(self) -> str:
+        return self.import_path.split(':', 1)[0]
+
+    def load_class(self):
+        module_name, class_name = self.import_path.split(':', 1)
+        return getattr(importlib.import_module(module_name), class_name)
+
+
+class LazyAgentRegistry(MutableMapping):
+    """
+    按智能体类型存放智能体的映射
+
+    成员判断和遍历键只使用描述信息，不会触发导入；按键取值时才导入模块并实例化，
+    每个智能体只实例化一次，并记录导入和实例化各自的耗时
+    """
+
+    def __init__(self):
+        self._descriptors: Dict[AgentType, AgentDescriptor] = {}
+        self._instances: Dict[AgentType, BaseAgent] = {}
+        self._lock = threading.RLock()
+
+    def register(self, descriptor: AgentDescriptor):
+        """登记智能体描述，替换同类型已有的智能体"""
+        with self._lock:
+            self._descriptors[descriptor.agent_type] = descriptor
+            self._instances.pop(descriptor.agent_type, None)
+
+    def descriptor(self, agent_type: AgentType) -> Optional[AgentDescriptor]:
+        return self._descriptors.get(agent_type)
+
+    def is_loaded(self, agent_type: AgentType) -> bool:
+        return agent_type in self._instances
+
+    def loaded(self) -> Dict[AgentType, BaseAgent]:
+        """已实例化的智能体"""
+        return dict(self._instances)
+
+    def view(self, exclude: Iterable[AgentType] = ()) -> 'AgentRegistryView':
+        return AgentRegistryView(self, exclude)
+
+    def __getitem__(self, agent_type: AgentType) -> BaseAgent:
+        agent = self._instances.get(agent_type)
+        if agent is not None:
+            return agent
+        with self._lock:
+            agent = self._instances.get(agent_type)
+            if agent is None:
+                if agent_type not in self._descriptors:
+                    raise KeyError(agent_type)
+                agent = self._instantiate(self._descriptors[agent_type])
+            return agent
+
+    def _instantiate(self, descriptor: AgentDescriptor) -> BaseAgent:
+        start = time.perf_counter()
+        agent_class = descriptor.load_class()
+        imported = time.perf_counter()
+        agent = agent_class()
+        # 先放入实例表，setup中可以访问注册表中的其他智能体
+        self._instances[descriptor.agent_type] = agent
+        if descriptor.setup is not None:
+            descriptor.setup(agent, self)
+        constructed = time.perf_counter()
+        logger.info(
+            f"智能体 {descriptor.agent_type.value} 已加载：导入 {(imported - start) * 1000:.1f}ms，"
+            f"实例化 {(constructed - imported) * 1000:.1f}ms"
+        )
+        return agent
+
+    def __setitem__(self, agent_type: AgentType, agent: BaseAgent):
+        """直接放入已创建的智能体实例"""
+        with self._lock:
+            self._descriptors[agent_type] = AgentDescriptor(
+                agent_type=agent_type,
+                import_path=f"{type(agent).__module__}:{type(agent).__name__}",
+                name=agent.name,
+                description=agent.description,
+                capabilities=agent.get_capabilities()
+            )
+            self._instances[agent_type] = agent
+
+    def __delitem__(self, agent_type: AgentType):
+        with self._lock:
+            del self._descriptors[agent_type]
+            self._instances.pop(agent_type, None)
+
+    def __contains__(self, agent_type) -> bool:
+        return agent_type in self._descriptors
+
+    def __iter__(self) -> Iterator[AgentType]:
+        return iter(list(self._descriptors))
+
+    def __len__(self) -> int:
+        return len(self._descriptors)
+
+
+class AgentRegistryView(MutableMapping):
+    """注册表的过滤视图，用作通用问答智能体的专业智能体表"""
+
+    def __init__(self, registry: LazyAgentRegistry, exclude: Iterable[AgentType] = ()):
+        self._registry = registry
+        self._exclude = set(exclude)
+
+    def __getitem__(self, agent_type: AgentType) -> BaseAgent:
+        if agent_type in self._exclude:
+            raise KeyError(agent_type)
+        return self._registry[agent_type]
+
+    def __setitem__(self, agent_type: AgentType, agent: BaseAgent):
+        if agent_type in self._exclude:
+            raise KeyError(agent_type)
+        self._registry[agent_type] = agent
+
+    def __delitem__(self, agent_type: AgentType):
+        if agent_type in self._exclude:
+            raise KeyError(agent_type)
+        del self._registry[agent_type]
+
+    def __contains__(self, agent_type) -> bool:
+        return agent_type not in self._exclude and agent_type in self._registry
+
+    def __iter__(self) -> Iterator[AgentType]:
+        return (agent_type for agent_type in self._registry if agent_type not in self._exclude)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
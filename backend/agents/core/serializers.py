@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Conversation, Message, AgentConfig, Document, DocumentVersion
+from .models import (Conversation, Message, AgentConfig, Document, DocumentVersion, GenerationCheckpoint,
+                     BatchJob, BatchItem, GenerationJob)
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -55,6 +56,66 @@ class ChatRequestSerializer(serializers.Serializer):
     agent_type = serializers.CharField(default='general_qa')
     conversation_id = serializers.IntegerField(required=False)
     document_id = serializers.IntegerField(required=False)
+    generation_id = serializers.CharField(required=False, max_length=64)  # 续跑中断的分段生成
+    dataset_id = serializers.CharField(required=False, max_length=64)  # 数据分析智能体上传的数据集
+    bypass_cache = serializers.BooleanField(default=False)  # 跳过智能体结果缓存，重新生成
+    workflow = serializers.ListField(child=serializers.CharField(), required=False, min_length=1, max_length=7)  # 按顺序串联执行的智能体
+
+
+class MultiChatRequestSerializer(serializers.Serializer):
+    message = serializers.CharField()
+    agent_types = serializers.ListField(child=serializers.CharField(), min_length=1, max_length=10)
+    conversation_id = serializers.IntegerField(required=False)
+    dataset_id = serializers.CharField(required=False, max_length=64)
+
+
+class BatchEntrySerializer(serializers.Serializer):
+    message = serializers.CharField()
+    agent_type = serializers.CharField(default='general_qa')
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    items = BatchEntrySerializer(many=True, required=False)
+    batch_id = serializers.CharField(required=False, max_length=64)  # 指定已有任务ID时续跑未完成的条目
+
+
+class BatchItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BatchItem
+        fields = ['index', 'agent_type', 'status', 'document_id', 'error', 'execution_time', 'updated_at']
+
+
+class BatchJobSerializer(serializers.ModelSerializer):
+    items = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BatchJob
+        fields = ['batch_id', 'conversation_id', 'status', 'total_items', 'completed_items', 'failed_items',
+                 'created_at', 'updated_at', 'items']
+
+    def get_items(self, obj):
+        return BatchItemSerializer(BatchItem.objects.filter(batch_id=obj.batch_id), many=True).data
+
+
+class GenerationCheckpointSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationCheckpoint
+        fields = ['generation_id', 'agent_type', 'status', 'steps', 'total_steps', 'error',
+                 'created_at', 'updated_at']
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    sections = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GenerationJob
+        fields = ['job_id', 'conversation_id', 'agent_type', 'status', 'progress', 'document_id', 'error',
+                 'created_at', 'updated_at', 'sections']
+
+    def get_sections(self, obj):
+        # 已完成的章节保存在以job_id为ID的生成检查点中
+        checkpoint = GenerationCheckpoint.objects.filter(generation_id=obj.job_id).first()
+        return checkpoint.steps if checkpoint else {}
 
 
 class DocumentEditRequestSerializer(serializers.Serializer):
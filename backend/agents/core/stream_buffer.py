@@ -0,0 +1,396 @@
+"""
+可续传的流式输出
+每次流式生成分配一个stream_id，生成作为任务在进程级后台事件循环中进行，每一帧写入缓冲（Redis Stream，带过期时间），
+HTTP响应只是缓冲的读者：客户端断线后携带Last-Event-ID重连，即使落在其他工作进程，
+也能补发错过的帧并继续跟随生成。客户端断开后生成不会立即取消，所有读者断开超过宽限期（STREAM_RESUME_GRACE）后才取消
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from contextlib import suppress
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每次读取缓冲最多阻塞的秒数，读者借此定期续约并检查客户端是否断开
+READ_TIMEOUT = 1.0
+
+Entries = List[Tuple[str, str]]
+
+
+def format_event_id(stream_id: str, entry_id: str) -> str:
+    return f"{stream_id}:{entry_id}"
+
+
+def parse_event_id(event_id: str) -> Tuple[str, Optional[str]]:
+    """解析Last-Event-ID，返回（stream_id，该流中最后收到的帧ID）；只有stream_id时从头补发"""
+    stream_id, _, entry_id = event_id.strip().partition(':')
+    return stream_id, entry_id or None
+
+
+class MemoryStreamBuffer:
+    """
+    进程内的帧缓冲，供未部署Redis的开发环境和测试使用
+
+    只有落在同一工作进程的重连才能续传
+    """
+
+    def __init__(self, ttl: int = 600, reader_grace: float = 30):
+        self.ttl = ttl
+        self.reader_grace = reader_grace
+        self._streams: Dict[str, dict] = {}
+        self._condition = threading.Condition()
+        # 异步读者：stream_id -> {(事件循环, 事件)}，有新帧或生成结束时唤醒
+        self._async_waiters: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def _wake(self, stream_id: str):
+        for loop, event in self._async_waiters.pop(stream_id, ()):
+            with suppress(RuntimeError):
+                # 读者所在的事件循环已关闭
+                loop.call_soon_threadsafe(event.set)
+
+    def _purge(self, now: float):
+        for stream_id in [key for key, stream in self._streams.items() if stream['expires_at'] < now]:
+            del self._streams[stream_id]
+
+    def open(self, stream_id: str):
+        now = time.monotonic()
+        with self._condition:
+            self._purge(now)
+            self._streams[stream_id] = {'frames': [], 'finished': False, 'expires_at': now + self.ttl,
+                                        'reader_seen': now}
+
+    def append(self, stream_id: str, frame: str) -> str:
+        with self._condition:
+            stream = self._streams[stream_id]
+            stream['frames'].append(frame)
+            stream['expires_at'] = time.monotonic() + self.ttl
+            self._condition.notify_all()
+            self._wake(stream_id)
+            return str(len(stream['frames']))
+
+    def finish(self, stream_id: str):
+        with self._condition:
+            stream = self._streams.get(stream_id)
+            if stream is not None:
+                stream['finished'] = True
+                self._condition.notify_all()
+                self._wake(stream_id)
+
+    def exists(self, stream_id: str) -> bool:
+        with self._condition:
+            stream = self._streams.get(stream_id)
+            return stream is not None and stream['expires_at'] >= time.monotonic()
+
+    def read(self, stream_id: str, after: Optional[str], timeout: float = READ_TIMEOUT) -> Tuple[Entries, bool]:
+        """读取after之后的帧，没有新帧时最多等待timeout秒；返回（帧列表，生成是否已结束且帧已读完）"""
+        start = int(after) if after and after.isdigit() else 0
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                stream = self._streams.get(stream_id)
+                if stream is None:
+                    return [], True
+                frames = stream['frames']
+                if len(frames) > start:
+                    return [(str(index + 1), frames[index]) for index in range(start, len(frames))], False
+                remaining = deadline - time.monotonic()
+                if stream['finished'] or remaining <= 0:
+                    return [], stream['finished']
+                self._condition.wait(remaining)
+
+    async def aread(self, stream_id: str, after: Optional[str], timeout: float = READ_TIMEOUT) -> Tuple[Entries, bool]:
+        """read的异步版本，在事件循环中等待新帧，不占用线程"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            waiter = (loop, asyncio.Event())
+            with self._condition:
+                entries, finished = self.read(stream_id, after, 0)
+                remaining = deadline - loop.time()
+                if entries or finished or remaining <= 0:
+                    return entries, finished
+                self._async_waiters.setdefault(stream_id, set()).add(waiter)
+            try:
+                await asyncio.wait_for(waiter[1].wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    waiters = self._async_waiters.get(stream_id)
+                    if waiters is not None:
+                        waiters.discard(waiter)
+                        if not waiters:
+                            del self._async_waiters[stream_id]
+
+    async def aexists(self, stream_id: str) -> bool:
+        return self.exists(stream_id)
+
+    async def atouch_reader(self, stream_id: str):
+        self.touch_reader(stream_id)
+
+    async def aappend(self, stream_id: str, frame: str) -> str:
+        return self.append(stream_id, frame)
+
+    async def afinish(self, stream_id: str):
+        self.finish(stream_id)
+
+    async def ahas_reader(self, stream_id: str) -> bool:
+        return self.has_reader(stream_id)
+
+    def touch_reader(self, stream_id: str):
+        with self._condition:
+            stream = self._streams.get(stream_id)
+            if stream is not None:
+                stream['reader_seen'] = time.monotonic()
+
+    def has_reader(self, stream_id: str) -> bool:
+        with self._condition:
+            stream = self._streams.get(stream_id)
+            return stream is not None and time.monotonic() - stream['reader_seen'] <= self.reader_grace
+
+
+class RedisStreamBuffer:
+    """
+    基于Redis Stream的帧缓冲，各工作进程共享
+
+    每个生成对应一个Stream，帧ID即Redis生成的条目ID；生成结束时追加结束标记。
+    读者定期刷新带过期时间的在线标记，标记过期即视为所有读者已断开
+    """
+
+    KEY_PREFIX = 'agents:stream:'
+    MAX_FRAMES = 10000
+
+    def __init__(self, client, ttl: int = 600, reader_grace: float = 30,
+                 async_client_factory: Optional[Callable] = None):
+        self.client = client
+        self.ttl = ttl
+        self.reader_grace = reader_grace
+        # redis.asyncio客户端的连接绑定在创建它的事件循环上，每个事件循环各建一个
+        self._async_client_factory = async_client_factory
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = self._async_client_factory()
+        return client
+
+    def _key(self, stream_id: str) -> str:
+        return f"{self.KEY_PREFIX}{stream_id}"
+
+    def _reader_key(self, stream_id: str) -> str:
+        return f"{self.KEY_PREFIX}{stream_id}:reader"
+
+    def _add(self, stream_id: str, fields: Dict[str, str]) -> str:
+        key = self._key(stream_id)
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.xadd(key, fields, maxlen=self.MAX_FRAMES, approximate=True)
+        pipeline.expire(key, self.ttl)
+        entry_id, _ = pipeline.execute()
+        return entry_id
+
+    async def _aadd(self, stream_id: str, fields: Dict[str, str]) -> str:
+        if self._async_client_factory is None:
+            return await asyncio.to_thread(self._add, stream_id, fields)
+        key = self._key(stream_id)
+        pipeline = self._async_client().pipeline(transaction=False)
+        pipeline.xadd(key, fields, maxlen=self.MAX_FRAMES, approximate=True)
+        pipeline.expire(key, self.ttl)
+        entry_id, _ = await pipeline.execute()
+        return entry_id
+
+    def open(self, stream_id: str):
+        # 写入开始标记使Stream立即存在，重连请求在首帧写入前也能找到该生成
+        self._add(stream_id, {'open': '1'})
+        self.touch_reader(stream_id)
+
+    def append(self, stream_id: str, frame: str) -> str:
+        return self._add(stream_id, {'frame': frame})
+
+    def finish(self, stream_id: str):
+        self._add(stream_id, {'end': '1'})
+
+    async def aappend(self, stream_id: str, frame: str) -> str:
+        return await self._aadd(stream_id, {'frame': frame})
+
+    async def afinish(self, stream_id: str):
+        await self._aadd(stream_id, {'end': '1'})
+
+    def exists(self, stream_id: str) -> bool:
+        return bool(self.client.exists(self._key(stream_id)))
+
+    def read(self, stream_id: str, after: Optional[str], timeout: float = READ_TIMEOUT) -> Tuple[Entries, bool]:
+        """读取after之后的帧，没有新帧时最多阻塞timeout秒；返回（帧列表，是否读到结束标记）"""
+        result = self.client.xread({self._key(stream_id): after or '0'}, count=500,
+                                   block=max(int(timeout * 1000), 1))
+        return self._parse_entries(result)
+
+    async def aread(self, stream_id: str, after: Optional[str], timeout: float = READ_TIMEOUT) -> Tuple[Entries, bool]:
+        """read的异步版本，通过redis.asyncio阻塞读取，不占用线程"""
+        if self._async_client_factory is None:
+            return await asyncio.to_thread(self.read, stream_id, after, timeout)
+        result = await self._async_client().xread({self._key(stream_id): after or '0'}, count=500,
+                                                  block=max(int(timeout * 1000), 1))
+        return self._parse_entries(result)
+
+    @staticmethod
+    def _parse_entries(result) -> Tuple[Entries, bool]:
+        entries = []
+        for _, items in result or []:
+            for entry_id, fields in items:
+                if 'end' in fields:
+                    return entries, True
+                # 开始标记以空帧返回，读者据此推进读取位置
+                entries.append((entry_id, fields.get('frame', '')))
+        return entries, False
+
+    def touch_reader(self, stream_id: str):
+        self.client.set(self._reader_key(stream_id), '1', px=max(int(self.reader_grace * 1000), 1))
+
+    def has_reader(self, stream_id: str) -> bool:
+        return bool(self.client.exists(self._reader_key(stream_id)))
+
+    async def aexists(self, stream_id: str) -> bool:
+        if self._async_client_factory is None:
+            return await asyncio.to_thread(self.exists, stream_id)
+        return bool(await self._async_client().exists(self._key(stream_id)))
+
+    async def atouch_reader(self, stream_id: str):
+        if self._async_client_factory is None:
+            return await asyncio.to_thread(self.touch_reader, stream_id)
+        await self._async_client().set(self._reader_key(stream_id), '1', px=max(int(self.reader_grace * 1000), 1))
+
+    async def ahas_reader(self, stream_id: str) -> bool:
+        if self._async_client_factory is None:
+            return await asyncio.to_thread(self.has_reader, stream_id)
+        return bool(await self._async_client().exists(self._reader_key(stream_id)))
+
+
+async def publish_stream(buffer, stream_id: str, frames: AsyncIterator[str]):
+    """
+    消费异步帧迭代器并逐帧写入缓冲，结束（含出错、取消）时写入结束标记；在后台事件循环中作为任务运行
+
+    客户端断开不会立即取消生成：读者每次读取时续约，所有读者断开超过宽限期后才取消帧迭代器，
+    期间重连的客户端可以继续跟随
+    """
+    async def write():
+        async for frame in frames:
+            await buffer.aappend(stream_id, frame)
+
+    writer = asyncio.ensure_future(write())
+    cancelled_by_readers = False
+    # 检查间隔短于宽限期，读者全部断开后最多再等待半个宽限期
+    interval = max(min(READ_TIMEOUT, buffer.reader_grace / 2), 0.05)
+    try:
+        while not writer.done():
+            await asyncio.wait({writer}, timeout=interval)
+            if writer.done():
+                break
+            try:
+                has_reader = await buffer.ahas_reader(stream_id)
+            except Exception as e:
+                # 缓冲暂时不可用时继续生成
+                logger.warning(f"检查流式读者失败: {e}")
+                continue
+            if not has_reader:
+                logger.info(f"流式生成 {stream_id} 的读者均已断开超过宽限期，取消生成")
+                cancelled_by_readers = True
+                writer.cancel()
+        await writer
+    except asyncio.CancelledError:
+        writer.cancel()
+        if not writer.done():
+            await asyncio.gather(writer, return_exceptions=True)
+        # 读者离开引起的取消到此结束，外部取消（如关闭后台事件循环）继续向上传递
+        if not cancelled_by_readers:
+            raise
+    except Exception as e:
+        logger.warning(f"流式生成 {stream_id} 写入缓冲失败: {e}")
+    finally:
+        await frames.aclose()
+        try:
+            await buffer.afinish(stream_id)
+        except Exception as e:
+            logger.warning(f"流式生成 {stream_id} 结束标记写入失败: {e}")
+
+
+def tail_stream(buffer, stream_id: str, after: Optional[str] = None,
+                disconnected: Optional[threading.Event] = None) -> Iterator[str]:
+    """
+    跟随缓冲输出SSE帧（附带事件ID），从after之后开始，生成结束后停止
+
+    客户端断开（WSGI下关闭迭代器，ASGI下设置disconnected）后停止续约，超过宽限期后生成被取消
+    """
+    # 每次读取的阻塞时间短于宽限期，保证读者在线标记不会在阻塞期间过期
+    timeout = max(min(READ_TIMEOUT, buffer.reader_grace / 2), 0.05)
+    while disconnected is None or not disconnected.is_set():
+        buffer.touch_reader(stream_id)
+        entries, finished = buffer.read(stream_id, after, timeout)
+        for entry_id, frame in entries:
+            after = entry_id
+            if frame:
+                yield f"id: {format_event_id(stream_id, entry_id)}\n{frame}"
+        if finished or (not entries and not buffer.exists(stream_id)):
+            return
+
+
+async def atail_stream(buffer, stream_id: str, after: Optional[str] = None,
+                       disconnected: Optional[threading.Event] = None) -> AsyncIterator[str]:
+    """tail_stream的异步版本，ASGI下使用：等待新帧期间不占用线程"""
+    timeout = max(min(READ_TIMEOUT, buffer.reader_grace / 2), 0.05)
+    while disconnected is None or not disconnected.is_set():
+        await buffer.atouch_reader(stream_id)
+        entries, finished = await buffer.aread(stream_id, after, timeout)
+        for entry_id, frame in entries:
+            after = entry_id
+            if frame:
+                yield f"id: {format_event_id(stream_id, entry_id)}\n{frame}"
+        if finished or (not entries and not await buffer.aexists(stream_id)):
+            return
+
+
+# 全局帧缓冲
+_stream_buffer = None
+_stream_buffer_lock = threading.Lock()
+
+
+def get_stream_buffer():
+    """获取帧缓冲：按配置使用Redis，Redis不可用时退回进程内缓冲"""
+    global _stream_buffer
+    if _stream_buffer is None:
+        with _stream_buffer_lock:
+            if _stream_buffer is None:
+                from django.conf import settings
+
+                ttl = settings.STREAM_BUFFER_TTL
+                grace = settings.STREAM_RESUME_GRACE
+                buffer = None
+                if settings.STREAM_BUFFER_BACKEND == 'redis':
+                    try:
+                        import redis
+                        import redis.asyncio
+                        url = settings.STREAM_BUFFER_REDIS_URL
+                        client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=READ_TIMEOUT + 5)
+                        client.ping()
+                        buffer = RedisStreamBuffer(
+                            client, ttl, grace,
+                            lambda: redis.asyncio.Redis.from_url(url, decode_responses=True,
+                                                                 socket_timeout=READ_TIMEOUT + 5)
+                        )
+                    except Exception as e:
+                        logger.warning(f"Redis不可用，流式缓冲退回进程内存，断线续传仅限同一工作进程: {e}")
+                if buffer is None:
+                    buffer = MemoryStreamBuffer(ttl, grace)
+                _stream_buffer = buffer
+    return _stream_buffer
+
+
+def set_stream_buffer(buffer):
+    """替换全局帧缓冲"""
+    global _stream_buffer
+    _stream_buffer = buffer
@@ -0,0 +1,295 @@
+"""
+流式输出
+智能体生成面向用户的正文时，把模型输出的增量转发给当前请求的接收方（通过上下文变量传递），
+流式接口据此逐段推送，生成结束后再推送格式化后的完整内容。
+客户端断开后流式接口停止迭代，处理任务随之取消，取消沿智能体协程传递到模型的流式连接
+"""
+
+import asyncio
+import json
+import os
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .memory import estimate_tokens
+
+# SSE增量合并：首个增量到达后最多等待的毫秒数（为0时每个增量单独成帧），以及累积到多少字节时立即发送
+SSE_FLUSH_INTERVAL = float(os.getenv('AGENT_SSE_FLUSH_INTERVAL_MS', '30')) / 1000
+SSE_FLUSH_BYTES = int(os.getenv('AGENT_SSE_FLUSH_BYTES', '1024'))
+
+DeltaSink = Callable[[str], None]
+ProgressSink = Callable[[Dict[str, Any]], None]
+
+# 当前请求的增量接收方，未设置时智能体按非流式方式调用模型
+_delta_sink: ContextVar[Optional[DeltaSink]] = ContextVar('agent_delta_sink', default=None)
+# 当前请求的进度接收方，分段生成等长任务每完成一步报告一次进度
+_progress_sink: ContextVar[Optional[ProgressSink]] = ContextVar('agent_progress_sink', default=None)
+
+
+def current_delta_sink() -> Optional[DeltaSink]:
+    return _delta_sink.get()
+
+
+def report_progress(progress: Dict[str, Any]):
+    """报告长任务进度，当前请求未订阅进度时忽略"""
+    sink = _progress_sink.get()
+    if sink is not None:
+        sink(progress)
+
+
+async def with_delta_sink(sink: Optional[DeltaSink], awaitable: Awaitable,
+                          progress_sink: Optional[ProgressSink] = None):
+    """在指定的增量（及进度）接收方下执行协程，设置只对该协程及其创建的任务生效；未指定进度接收方时沿用外层的"""
+    token = _delta_sink.set(sink)
+    progress_token = _progress_sink.set(progress_sink) if progress_sink is not None else None
+    try:
+        return await awaitable
+    finally:
+        if progress_token is not None:
+            _progress_sink.reset(progress_token)
+        _delta_sink.reset(token)
+
+
+class DeltaBuffer:
+    """暂存增量，attach后把已暂存的增量和后续增量转发给目标接收方；用于推测执行时只转发被选中的一方"""
+
+    def __init__(self):
+        self._pending: List[str] = []
+        self._target: Optional[DeltaSink] = None
+
+    def push(self, delta: str):
+        if self._target is not None:
+            self._target(delta)
+        else:
+            self._pending.append(delta)
+
+    def attach(self, target: Optional[DeltaSink]):
+        if target is None:
+            return
+        for delta in self._pending:
+            target(delta)
+        self._pending = []
+        self._target = target
+
+
+async def generate_text(llm, messages) -> Any:
+    """
+    调用模型生成正文
+
+    存在增量接收方且模型支持astream时流式生成并逐段转发，返回与ainvoke相同的带content属性的结果
+    """
+    sink = current_delta_sink()
+    if sink is None or not hasattr(llm, 'astream'):
+        return await llm.ainvoke(messages)
+
+    from langchain.schema import AIMessage
+
+    parts = []
+    stream = llm.astream(messages)
+    try:
+        async for chunk in stream:
+            text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if text:
+                parts.append(text)
+                sink(text)
+    finally:
+        # 任务被取消时显式关闭模型的流式连接，使服务端停止生成
+        if hasattr(stream, 'aclose'):
+            await stream.aclose()
+    return AIMessage(content=''.join(parts))
+
+
+class StreamMetrics:
+    """流式请求统计：完成/取消的流数量，以及已生成的token数（取消的流中已生成的部分计入cancelled_tokens）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.completed_tokens = 0
+        self.cancelled_tokens = 0
+        self.framed_responses = 0
+        self.frames = 0
+        self.deltas = 0
+
+    def record_started(self):
+        with self._lock:
+            self.started += 1
+
+    def record_finished(self, tokens: int, cancelled: bool):
+        with self._lock:
+            if cancelled:
+                self.cancelled += 1
+                self.cancelled_tokens += tokens
+            else:
+                self.completed += 1
+                self.completed_tokens += tokens
+
+    def record_frames(self, frames: int, deltas: int):
+        """记录一次流式响应发送的帧数及其中合并的模型增量数"""
+        with self._lock:
+            self.framed_responses += 1
+            self.frames += frames
+            self.deltas += deltas
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'started': self.started,
+                'in_progress': self.started - self.completed - self.cancelled,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'completed_tokens': self.completed_tokens,
+                'cancelled_tokens': self.cancelled_tokens,
+                'frames': self.frames,
+                'frames_per_response': round(self.frames / self.framed_responses, 2) if self.framed_responses else 0,
+                'deltas_per_frame': round(self.deltas / self.frames, 2) if self.frames else 0
+            }
+
+
+# 全局流式统计
+_stream_metrics: Optional[StreamMetrics] = None
+
+
+def get_stream_metrics() -> StreamMetrics:
+    global _stream_metrics
+    if _stream_metrics is None:
+        _stream_metrics = StreamMetrics()
+    return _stream_metrics
+
+
+def set_stream_metrics(metrics: Optional[StreamMetrics]):
+    """替换全局流式统计"""
+    global _stream_metrics
+    _stream_metrics = metrics
+
+
+@dataclass
+class StreamEvent:
+    """流式事件：delta为模型增量，progress为长任务进度（response为进度字典），complete为最终响应"""
+    type: str
+    delta: str = ''
+    response: Any = None
+
+
+async def stream_process(factory: Callable[[], Awaitable[Any]]) -> AsyncIterator[StreamEvent]:
+    """
+    执行智能体处理协程，先逐个产出模型增量和进度，处理完成后产出最终响应
+
+    调用方提前停止迭代（客户端断开）时取消处理任务，并把已生成的token数计入取消统计
+    """
+    metrics = get_stream_metrics()
+    events: asyncio.Queue = asyncio.Queue()
+    generated = []
+
+    def sink(delta: str):
+        generated.append(delta)
+        events.put_nowait(StreamEvent(type='delta', delta=delta))
+
+    def progress_sink(progress: Dict[str, Any]):
+        events.put_nowait(StreamEvent(type='progress', response=progress))
+
+    metrics.record_started()
+    task = asyncio.ensure_future(with_delta_sink(sink, factory(), progress_sink))
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    cancelled = True
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+        # 处理任务已结束（成功或出错），此后调用方停止迭代不再视为取消
+        cancelled = False
+        yield StreamEvent(type='complete', response=task.result())
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        metrics.record_finished(estimate_tokens(''.join(generated)), cancelled)
+
+
+async def coalesce_deltas(events: AsyncIterator[StreamEvent], flush_interval: Optional[float] = None,
+                          flush_bytes: Optional[int] = None) -> AsyncIterator[StreamEvent]:
+    """
+    合并相邻的模型增量，减少SSE帧数
+
+    首个增量到达后最多等待flush_interval秒，期间到达的增量合并为一帧；累积达到flush_bytes字节，
+    或收到其他类型的事件时立即发送。本地模型每秒输出上百个token时，可避免逐token序列化和写入
+    """
+    flush_interval = SSE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+    flush_bytes = SSE_FLUSH_BYTES if flush_bytes is None else flush_bytes
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    pending: List[str] = []
+    pending_bytes = 0
+    deadline = 0.0
+    next_event: Optional[asyncio.Future] = None
+    frames = 0
+    deltas = 0
+
+    def flush() -> StreamEvent:
+        nonlocal pending, pending_bytes, frames
+        event = StreamEvent(type='delta', delta=''.join(pending))
+        pending = []
+        pending_bytes = 0
+        frames += 1
+        return event
+
+    try:
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(iterator.__anext__())
+            if pending:
+                done, _ = await asyncio.wait({next_event}, timeout=max(deadline - loop.time(), 0))
+                if not done:
+                    yield flush()
+                    continue
+            try:
+                event = await next_event
+            except StopAsyncIteration:
+                next_event = None
+                break
+            next_event = None
+
+            if event.type != 'delta':
+                if pending:
+                    yield flush()
+                frames += 1
+                yield event
+                continue
+
+            deltas += 1
+            if not pending:
+                deadline = loop.time() + flush_interval
+            pending.append(event.delta)
+            pending_bytes += len(event.delta.encode('utf-8'))
+            if pending_bytes >= flush_bytes or flush_interval <= 0:
+                yield flush()
+        if pending:
+            yield flush()
+    finally:
+        if next_event is not None:
+            next_event.cancel()
+            await asyncio.gather(next_event, return_exceptions=True)
+        if hasattr(iterator, 'aclose'):
+            await iterator.aclose()
+        get_stream_metrics().record_frames(frames, deltas)
+
+
+def sse_frame(payload: Dict[str, Any]) -> str:
+    """序列化一个SSE事件帧"""
+    return f"data: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+
+# 内容帧的固定部分预先拼好，每帧只需序列化增量文本本身；json.dumps会转义换行，帧内不会出现空行
+_CONTENT_FRAME_PREFIX = 'data: {"type": "content", "data": '
+_CONTENT_FRAME_SUFFIX = '}\n\n'
+
+
+def sse_content_frame(delta: str) -> str:
+    """序列化模型增量的SSE帧，与sse_frame({'type': 'content', 'data': delta})的输出一致"""
+    return _CONTENT_FRAME_PREFIX + json.dumps(delta, ensure_ascii=False) + _CONTENT_FRAME_SUFFIX
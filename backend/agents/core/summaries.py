@@ -0,0 +1,193 @@
+"""
+对话滚动摘要
+未折叠的消息超过阈值后，在响应返回后的后台线程中把最早的消息增量折叠进已保存的摘要，
+每条消息只参与一次摘要，后续轮次直接复用已保存的摘要
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .memory import ConversationTurn, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 未折叠消息超过该数量时触发摘要更新
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv('CONVERSATION_SUMMARY_TRIGGER', '12'))
+# 折叠后保留为原文的最近消息数
+SUMMARY_KEEP_RECENT = int(os.getenv('CONVERSATION_SUMMARY_KEEP_RECENT', '6'))
+# 摘要的最大字数
+SUMMARY_MAX_CHARS = int(os.getenv('CONVERSATION_SUMMARY_MAX_CHARS', '800'))
+# 每条消息送入摘要模型的最大字符数
+FOLD_MESSAGE_CHARS = 1500
+
+
+@dataclass
+class SummaryState:
+    """已保存的摘要及其覆盖范围"""
+    summary: str = ''
+    summarized_until: int = 0
+    summarized_messages: int = 0
+    token_count: int = 0
+    updated_at: Any = None
+
+
+def load_summary_state(conversation_id: int) -> SummaryState:
+    from .models import ConversationSummary
+
+    record = ConversationSummary.objects.filter(conversation_id=conversation_id).first()
+    if record is None:
+        return SummaryState()
+    return SummaryState(
+        summary=record.summary,
+        summarized_until=record.summarized_until,
+        summarized_messages=record.summarized_messages,
+        token_count=record.token_count,
+        updated_at=record.updated_at
+    )
+
+
+def load_unsummarized(conversation_id: int, after_id: int, limit: Optional[int] = None) -> List[Tuple[int, ConversationTurn]]:
+    """按时间顺序加载尚未折叠进摘要的消息"""
+    from .models import Message
+
+    queryset = Message.objects.filter(conversation_id=conversation_id, id__gt=after_id).order_by('id')
+    if limit is not None:
+        queryset = queryset[:limit]
+    return [
+        (message_id, ConversationTurn(role='user' if is_user else 'assistant', content=content,
+                                      agent_type='' if is_user else agent_type))
+        for message_id, content, is_user, agent_type
+        in queryset.values_list('id', 'content', 'is_user_message', 'agent_type')
+    ]
+
+
+def count_unsummarized(conversation_id: int, after_id: int) -> int:
+    from .models import Message
+    return Message.objects.filter(conversation_id=conversation_id, id__gt=after_id).count()
+
+
+def build_fold_prompt(summary: str, turns: List[ConversationTurn]) -> str:
+    lines = []
+    for turn in turns:
+        speaker = '用户' if turn.role == 'user' else '助手'
+        lines.append(f"{speaker}：{turn.content[:FOLD_MESSAGE_CHARS]}")
+    return (
+        f"已有对话摘要：\n{summary or '（无）'}\n\n"
+        f"新增对话：\n" + "\n\n".join(lines) + "\n\n"
+        f"请将新增对话合并进已有摘要，输出更新后的完整摘要。保留用户的需求、偏好、已确认的事实和"
+        f"已生成文档的要点，省略寒暄和重复内容，不超过{SUMMARY_MAX_CHARS}字，只输出摘要正文。"
+    )
+
+
+async def fold_conversation(conversation_id: int, llm=None) -> bool:
+    """
+    将最早的未折叠消息合并进摘要
+
+    只处理超出阈值的部分，最近SUMMARY_KEEP_RECENT条消息保持原文；返回是否更新了摘要
+    """
+    from asgiref.sync import sync_to_async
+    from langchain.schema import HumanMessage, SystemMessage
+
+    state = await sync_to_async(load_summary_state)(conversation_id)
+    pending = await sync_to_async(count_unsummarized)(conversation_id, state.summarized_until)
+    if pending <= SUMMARY_TRIGGER_MESSAGES:
+        return False
+
+    fold = await sync_to_async(load_unsummarized)(
+        conversation_id, state.summarized_until, pending - SUMMARY_KEEP_RECENT
+    )
+    if not fold:
+        return False
+
+    if llm is None:
+        from .llm_manager import get_llm
+        llm = get_llm()
+    response = await llm.ainvoke([
+        SystemMessage(content="你负责维护多轮对话的滚动摘要，摘要将作为后续对话的上下文。"),
+        HumanMessage(content=build_fold_prompt(state.summary, [turn for _, turn in fold]))
+    ])
+    summary = response.content.strip()[:SUMMARY_MAX_CHARS * 2]
+
+    await sync_to_async(save_summary)(
+        conversation_id, summary, fold[-1][0], state.summarized_messages + len(fold), state.summarized_until
+    )
+    return True
+
+
+def save_summary(conversation_id: int, summary: str, summarized_until: int, summarized_messages: int,
+                 expected_until: int):
+    """保存摘要；并发折叠时只接受基于最新状态的结果"""
+    from django.utils import timezone
+    from .models import ConversationSummary
+
+    values = {
+        'summary': summary,
+        'summarized_until': summarized_until,
+        'summarized_messages': summarized_messages,
+        'token_count': estimate_tokens(summary),
+        'updated_at': timezone.now()
+    }
+    updated = ConversationSummary.objects.filter(
+        conversation_id=conversation_id, summarized_until=expected_until
+    ).update(**values)
+    if not updated and expected_until == 0:
+        ConversationSummary.objects.get_or_create(conversation_id=conversation_id, defaults=values)
+
+
+def get_summary_status(conversation_id: int) -> Dict[str, Any]:
+    """摘要的token数与新鲜度：已覆盖的消息数、尚未折叠的消息数与最后更新时间"""
+    state = load_summary_state(conversation_id)
+    pending = count_unsummarized(conversation_id, state.summarized_until)
+    return {
+        'conversation_id': conversation_id,
+        'summary': state.summary,
+        'token_count': state.token_count,
+        'summarized_messages': state.summarized_messages,
+        'pending_messages': pending,
+        'stale': pending > SUMMARY_TRIGGER_MESSAGES,
+        'updated_at': state.updated_at
+    }
+
+
+# 后台摘要线程，摘要更新不占用请求线程
+_executor: Optional[ThreadPoolExecutor] = None
+_in_flight = set()
+_lock = threading.Lock()
+
+
+def schedule_summary_refresh(conversation_id: int):
+    """在后台线程中更新对话摘要，同一对话同时只有一个更新任务"""
+    global _executor
+    with _lock:
+        if conversation_id in _in_flight:
+            return
+        _in_flight.add(conversation_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='conversation-summary')
+    _executor.submit(_refresh, conversation_id)
+
+
+def _refresh(conversation_id: int):
+    from django.db import close_old_connections
+
+    try:
+        asyncio.run(fold_conversation(conversation_id))
+    except Exception as e:
+        logger.warning(f"更新对话摘要失败: {e}")
+    finally:
+        with _lock:
+            _in_flight.discard(conversation_id)
+        close_old_connections()
+
+
+def reset_after_fork():
+    """fork出的子进程不继承后台线程，丢弃主进程的线程池和进行中标记"""
+    global _executor, _in_flight, _lock
+    _executor = None
+    _in_flight = set()
+    _lock = threading.Lock()
@@ -0,0 +1,18 @@
+"""
+Celery任务
+"""
+
+from celery_app import app
+
+from .jobs import run_job
+
+
+@app.task(name='agents.core.tasks.run_generation_job')
+def run_generation_job(job_id: str):
+    """执行异步生成任务"""
+    from django.db import close_old_connections
+
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
@@ -1,13 +1,27 @@
 from django.urls import path
-from .views import ChatView, ConversationListView, AgentListView, StreamChatView, DocumentEditView, DocumentView, TestStreamView
+from .views import (ChatView, ConversationListView, AgentListView, StreamChatView, DocumentEditView, DocumentView,
+                    TestStreamView, GenerationProgressView, MultiChatView, BatchView,
+                    ConversationSummaryView, EventLoopStatsView, StreamStatsView, GenerationJobView,
+                    GenerationJobEventsView)
 
 urlpatterns = [
     path('chat/', ChatView.as_view(), name='chat'),
     path('stream-chat/', StreamChatView.as_view(), name='stream_chat'),
+    path('stream-chat/<str:stream_id>/', StreamChatView.as_view(), name='stream_chat_resume'),
+    path('multi-chat/', MultiChatView.as_view(), name='multi_chat'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('batch/<str:batch_id>/', BatchView.as_view(), name='batch_detail'),
+    path('jobs/', GenerationJobView.as_view(), name='generation_jobs'),
+    path('jobs/<str:job_id>/', GenerationJobView.as_view(), name='generation_job_detail'),
+    path('jobs/<str:job_id>/events/', GenerationJobEventsView.as_view(), name='generation_job_events'),
     path('test-stream/', TestStreamView.as_view(), name='test_stream'),
     path('conversations/', ConversationListView.as_view(), name='conversations'),
+    path('conversations/<int:conversation_id>/summary/', ConversationSummaryView.as_view(), name='conversation_summary'),
     path('list/', AgentListView.as_view(), name='agent_list'),
     path('documents/', DocumentView.as_view(), name='documents'),
     path('documents/<int:document_id>/', DocumentView.as_view(), name='document_detail'),
     path('documents/edit/', DocumentEditView.as_view(), name='document_edit'),
+    path('generations/<str:generation_id>/', GenerationProgressView.as_view(), name='generation_progress'),
+    path('runtime/event-loop/', EventLoopStatsView.as_view(), name='event_loop_stats'),
+    path('runtime/streams/', StreamStatsView.as_view(), name='stream_stats'),
 ]
\ No newline at end of file
@@ -5,166 +5,242 @@ from rest_framework.permissions import AllowAny
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.http import StreamingHttpResponse
-from django.utils import timezone
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
 import json
+import logging
 import time
-from .models import Conversation, Message, AgentConfig, Document, DocumentVersion
+import uuid
+from .models import (Conversation, Message, AgentConfig, Document, DocumentVersion, GenerationCheckpoint, BatchJob,
+                     GenerationJob)
 from .serializers import (ConversationSerializer, ChatRequestSerializer, AgentConfigSerializer,
-                         DocumentSerializer, DocumentEditRequestSerializer)
+                         DocumentSerializer, DocumentEditRequestSerializer, GenerationCheckpointSerializer,
+                         MultiChatRequestSerializer, BatchRequestSerializer, BatchJobSerializer,
+                         GenerationJobSerializer)
 from .base import AgentType, AgentMessage
+from .memory import ConversationMemory
 from .initialization import lazy_get_agent_manager
 from .utils import markdown_to_plain_text, extract_title_from_content, detect_document_type
+from .concurrency import LoopBridgeBusy, get_loop_bridge, run_agent_coroutine
+from .disconnect import StreamsBusy, get_disconnect_event, is_asgi, reserve_stream, stream_body
+from .stream_buffer import atail_stream, get_stream_buffer, parse_event_id, publish_stream, tail_stream
+from .streaming import coalesce_deltas, get_stream_metrics, sse_content_frame, sse_frame
+from .jobs import JobQueueUnavailable, poll_job_frames, submit_job
+from .summaries import get_summary_status, schedule_summary_refresh
+from .persistence import append_document_version, load_document_content, save_chat_turn
+from .write_behind import ensure_persisted, get_write_behind, message_item, version_item
+from .batch import (BatchEntry, BatchWriter, ProviderLimiter, claim_batch, create_batch, pending_entries,
+                    run_batch)
+from django.conf import settings
 import asyncio
 import threading
-from concurrent.futures import ThreadPoolExecutor
 from asgiref.sync import sync_to_async
 
+logger = logging.getLogger(__name__)
 
-@method_decorator(csrf_exempt, name='dispatch')
-class ChatView(APIView):
-    permission_classes = [AllowAny]
-    
-    def post(self, request):
+
+def parse_json_body(request):
+    """解析JSON请求体，格式错误时返回None"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def json_response(payload, status_code=status.HTTP_200_OK):
+    return JsonResponse(payload, status=status_code, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+def follow_stream(request, buffer, stream_id, after=None):
+    """跟随帧缓冲输出SSE：ASGI下异步读取缓冲，等待新帧时不占用线程；WSGI下同步读取"""
+    disconnected = get_disconnect_event(request)
+    if is_asgi(request):
+        return atail_stream(buffer, stream_id, after, disconnected)
+    return tail_stream(buffer, stream_id, after, disconnected)
+
+
+async def get_request_user_id(request):
+    """异步视图中读取当前用户ID，会话和用户查询在线程中执行"""
+    def get_user_id():
+        user = getattr(request, 'user', None)
+        return user.id if user is not None and user.is_authenticated else None
+    return await sync_to_async(get_user_id)()
+
+
+class ChatView(View):
+    """
+    聊天接口（异步视图）
+
+    ASGI部署时在事件循环中直接等待智能体，单个工作进程可同时处理大量进行中的模型调用；
+    数据库读写使用Django的异步ORM，多步写入通过sync_to_async在线程中执行
+    """
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+
+    async def post(self, request):
         """处理聊天请求"""
-        serializer = ChatRequestSerializer(data=request.data)
+        serializer = ChatRequestSerializer(data=parse_json_body(request))
         if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
         data = serializer.validated_data
         message_content = data['message']
         agent_type_str = data.get('agent_type', 'general_qa')
         conversation_id = data.get('conversation_id')
         document_id = data.get('document_id')
+        metadata = {key: data[key] for key in ('generation_id', 'dataset_id', 'bypass_cache') if data.get(key)} or None
 
         try:
             agent_type = AgentType(agent_type_str)
-        except ValueError:
-            return Response(
-                {'error': f'Invalid agent type: {agent_type_str}'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            # 指定工作流时按顺序串联执行，文档和消息归属最后一步的智能体
+            workflow = [AgentType(value) for value in data['workflow']] if data.get('workflow') else None
+        except ValueError as e:
+            return json_response({'error': f'Invalid agent type: {e}'}, status.HTTP_400_BAD_REQUEST)
+        if workflow:
+            agent_type = workflow[-1]
+            agent_type_str = agent_type.value
 
         # 处理对话
+        user_id = await get_request_user_id(request)
+        history = None
         if conversation_id:
             try:
-                conversation = Conversation.objects.get(
-                    id=conversation_id, 
-                    user_id=request.user.id if request.user.is_authenticated else None
-                )
+                conversation = await Conversation.objects.aget(id=conversation_id, user_id=user_id)
             except Conversation.DoesNotExist:
-                return Response(
-                    {'error': 'Conversation not found'}, 
-                    status=status.HTTP_404_NOT_FOUND
-                )
+                return json_response({'error': 'Conversation not found'}, status.HTTP_404_NOT_FOUND)
         else:
-            conversation = Conversation.objects.create(
-                user_id=request.user.id if request.user.is_authenticated else None
-            )
-
-        # 创建用户消息
-        user_message = Message.objects.create(
-            conversation_id=conversation.id,
-            content=message_content,
-            agent_type=agent_type_str,
-            is_user_message=True,
-            document_id=document_id
-        )
+            conversation = await Conversation.objects.acreate(user_id=user_id)
+            # 新对话没有历史，不必再查询摘要和消息
+            history = ConversationMemory()
+
+        # 用户消息与本轮回复一起保存（同步写入时一次bulk_create，延迟写入时一起入队），不在调用智能体前写库
+        user_message = {
+            'conversation_id': conversation.id,
+            'content': message_content,
+            'agent_type': agent_type_str,
+            'is_user_message': True,
+            'document_id': document_id
+        }
+        writer = get_write_behind()
 
         try:
-            # 使用同步方式运行异步代码
-            response = asyncio.run(self._process_message_async(message_content, agent_type))
-            
-            # 创建或更新文档
-            if response.success and response.content:
-                document = self._create_or_update_document(
-                    conversation.id, 
-                    response.content, 
-                    agent_type_str,
-                    document_id
+            if workflow:
+                response = await run_agent_coroutine(
+                    self._run_workflow_async(message_content, workflow, metadata, conversation.id)
                 )
-                document_id = document.id
-            
-            # 创建智能体响应消息
-            agent_message = Message.objects.create(
-                conversation_id=conversation.id,
-                content=response.content,
-                agent_type=agent_type_str,
-                is_user_message=False,
-                document_id=document_id,
-                metadata={
-                    'execution_time': response.execution_time,
-                    'success': response.success
-                }
-            )
+            else:
+                response = await run_agent_coroutine(
+                    self._process_message_async(message_content, agent_type, metadata, conversation.id, history)
+                )
+
+            if writer is not None:
+                # 延迟写入：消息和文档版本由后台线程批量写库，写库后再更新滚动摘要
+                document_id = await sync_to_async(enqueue_chat_turn)(
+                    writer, user_message, response, agent_type_str, document_id
+                )
+            else:
+                # 文档、文档版本和本轮的两条消息在一个事务中写入
+                document_id = await sync_to_async(save_chat_turn)(
+                    conversation.id, agent_type_str, response, user_message, document_id
+                )
+                # 对话较长时在后台增量更新滚动摘要，不阻塞本次响应
+                schedule_summary_refresh(conversation.id)
 
-            return Response({
+            return json_response({
                 'conversation_id': conversation.id,
                 'document_id': document_id,
                 'response': response.content,
                 'formatted_response': markdown_to_plain_text(response.content),
                 'agent_type': agent_type_str,
                 'success': response.success,
-                'execution_time': response.execution_time
+                'execution_time': response.execution_time,
+                'metadata': response.metadata
             })
 
+        except LoopBridgeBusy as e:
+            await self._save_user_message(writer, user_message)
+            return json_response({'error': str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
-            return Response(
-                {'error': str(e)}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            await self._save_user_message(writer, user_message)
+            return json_response({'error': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def _save_user_message(self, writer, user_message):
+        """处理失败时只保存用户消息"""
+        if writer is not None:
+            writer.submit([message_item(**user_message)])
+        else:
+            await Message.objects.acreate(**user_message)
+
+    async def _process_message_async(self, message_content, agent_type, metadata=None, conversation_id=None,
+                                     history=None):
+        """异步处理消息"""
+        agent_manager = lazy_get_agent_manager()
+        return await agent_manager.process_message(message_content, agent_type, metadata, conversation_id, history)
+
+    async def _run_workflow_async(self, message_content, workflow, metadata=None, conversation_id=None):
+        """异步执行多智能体工作流"""
+        agent_manager = lazy_get_agent_manager()
+        return await agent_manager.run_workflow(message_content, workflow, metadata, conversation_id)
+
 
-    def _create_or_update_document(self, conversation_id, content, agent_type, document_id=None):
-        """创建或更新文档"""
+def enqueue_chat_turn(writer, user_message, response, agent_type_str, document_id=None):
+    """
+    延迟写入模式下保存一轮对话，返回文档ID
+
+    新文档需要向客户端返回ID，只同步创建文档记录；文档版本和两条消息交给后台线程批量写库
+    """
+    conversation_id = user_message['conversation_id']
+    items = [message_item(**user_message)]
+    if response.success and response.content:
         if document_id:
-            # 更新现有文档
-            try:
-                document = Document.objects.get(id=document_id)
-                document.current_version += 1
-                document.updated_at = timezone.now()
-                document.save()
-            except Document.DoesNotExist:
-                document = None
+            items.append(version_item(document_id, response.content))
         else:
-            document = None
-            
-        if not document:
-            # 创建新文档
-            title = extract_title_from_content(content)
-            doc_type = detect_document_type(content, agent_type)
-            
             document = Document.objects.create(
                 conversation_id=conversation_id,
-                title=title,
-                document_type=doc_type,
+                title=extract_title_from_content(response.content),
+                document_type=detect_document_type(response.content, agent_type_str),
                 current_version=1
             )
-        
-        # 创建文档版本
-        DocumentVersion.objects.create(
-            document_id=document.id,
-            version_number=document.current_version,
-            content=content,
-            raw_content=content,
-            formatted_content=markdown_to_plain_text(content),
-            operation_type='create' if document.current_version == 1 else 'edit'
-        )
-        
-        return document
+            document_id = document.id
+            items.append(version_item(document_id, response.content, version_number=1))
+    items.append(message_item(
+        conversation_id=conversation_id,
+        content=response.content,
+        agent_type=agent_type_str,
+        is_user_message=False,
+        document_id=document_id,
+        metadata={
+            'execution_time': response.execution_time,
+            'success': response.success
+        }
+    ))
+    writer.submit(items)
+    return document_id
 
-    async def _process_message_async(self, message_content, agent_type):
-        """异步处理消息"""
-        agent_manager = lazy_get_agent_manager()
-        return await agent_manager.process_message(message_content, agent_type)
 
+def persist_agent_response(conversation_id, agent_type_str, response):
+    """保存流式生成的智能体消息，生成成功时同时保存文档；返回文档ID，保存失败时只记录告警"""
+    try:
+        document_id = save_chat_turn(conversation_id, agent_type_str, response)
+        schedule_summary_refresh(conversation_id)
+        return document_id
+    except Exception as e:
+        logger.warning(f"保存流式响应失败: {e}")
+        return None
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class StreamChatView(APIView):
     permission_classes = [AllowAny]
     
-    def post(self, request):
-        """流式输出聊天响应"""
+    def post(self, request, stream_id=None):
+        """流式输出聊天响应；请求头携带Last-Event-ID或指定stream_id时续传对应的生成"""
+        if stream_id or request.headers.get('Last-Event-ID'):
+            return self.get(request, stream_id)
+
         serializer = ChatRequestSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -173,6 +249,7 @@ class StreamChatView(APIView):
         message_content = data['message']
         agent_type_str = data.get('agent_type', 'general_qa')
         conversation_id = data.get('conversation_id')
+        metadata = {key: data[key] for key in ('generation_id', 'dataset_id', 'bypass_cache') if data.get(key)} or None
 
         try:
             agent_type = AgentType(agent_type_str)
@@ -182,53 +259,100 @@ class StreamChatView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        def generate_stream():
-            """生成流式响应"""
+        user_id = request.user.id if request.user.is_authenticated else None
+        stream_id = uuid.uuid4().hex
+        buffer = get_stream_buffer()
+        conversation = None
+
+        async def generate_stream():
+            """
+            转发智能体生成过程中的模型增量，生成结束后推送格式化内容，最后保存消息和文档
+
+            作为任务在后台事件循环中执行，帧写入缓冲；客户端断开后保留宽限期等待续传，
+            所有客户端断开超过宽限期后取消生成
+            """
+            final_response = None
             try:
-                # 创建或获取对话
-                if conversation_id:
-                    conversation = Conversation.objects.get(id=conversation_id)
-                else:
-                    conversation = Conversation.objects.create(
-                        user_id=request.user.id if request.user.is_authenticated else None
-                    )
-                
                 # 发送对话ID
-                yield f"data: {json.dumps({'type': 'conversation_id', 'data': conversation.id})}\n\n"
-                
-                # 处理消息
-                def process_message():
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        return loop.run_until_complete(self._process_message_async(message_content, agent_type))
-                    finally:
-                        loop.close()
-                
-                with ThreadPoolExecutor() as executor:
-                    future = executor.submit(process_message)
-                    response = future.result()
-                
-                if response.success:
-                    # 分段发送内容
-                    content = response.content
-                    chunk_size = 50  # 每次发送的字符数
-                    
-                    for i in range(0, len(content), chunk_size):
-                        chunk = content[i:i + chunk_size]
-                        yield f"data: {json.dumps({'type': 'content', 'data': chunk})}\n\n"
-                        time.sleep(0.1)  # 模拟打字机效果
-                    
+                yield sse_frame({'type': 'conversation_id', 'data': conversation.id})
+
+                # 相邻的模型增量合并后成帧
+                agent_manager = lazy_get_agent_manager()
+                async for event in coalesce_deltas(
+                    agent_manager.stream_message(message_content, agent_type, metadata, conversation.id)
+                ):
+                    if event.type == 'delta':
+                        yield sse_content_frame(event.delta)
+                        continue
+                    if event.type == 'progress':
+                        yield sse_frame({'type': 'progress', 'data': event.response})
+                        continue
+                    final_response = event.response
+
+                if final_response.success:
+                    content = final_response.content
                     # 发送完成信号和格式化内容
-                    yield f"data: {json.dumps({'type': 'complete', 'data': {'raw_content': content, 'formatted_content': markdown_to_plain_text(content)}})}\n\n"
+                    yield sse_frame({'type': 'complete', 'data': {'raw_content': content, 'formatted_content': markdown_to_plain_text(content), 'metadata': final_response.metadata}})
                 else:
-                    yield f"data: {json.dumps({'type': 'error', 'data': response.content})}\n\n"
-                    
+                    yield sse_frame({'type': 'error', 'data': final_response.content})
+
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'data': str(e)})}\n\n"
+                yield sse_frame({'type': 'error', 'data': str(e)})
+            finally:
+                # 生成完成后保存智能体消息和文档，生成被取消时不保存
+                if final_response is not None:
+                    await sync_to_async(persist_agent_response)(conversation.id, agent_type_str, final_response)
+
+        # 先占用后台事件循环的任务名额，已满时在写库和打开流之前返回503
+        task = publish_stream(buffer, stream_id, generate_stream())
+        try:
+            slot = get_loop_bridge().reserve()
+        except LoopBridgeBusy as e:
+            task.close()
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            # 创建或获取当前用户的对话，其消息和摘要会作为历史上下文送入模型
+            if conversation_id:
+                conversation = Conversation.objects.get(id=conversation_id, user_id=user_id)
+            else:
+                conversation = Conversation.objects.create(user_id=user_id)
+            Message.objects.create(
+                conversation_id=conversation.id,
+                content=message_content,
+                agent_type=agent_type_str,
+                is_user_message=True
+            )
+            buffer.open(stream_id)
+        except Conversation.DoesNotExist:
+            slot.release()
+            task.close()
+            return Response(
+                {'error': 'Conversation not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except Exception:
+            slot.release()
+            task.close()
+            raise
+        get_loop_bridge().submit(task, slot)
+        return self._stream_response(request, buffer, stream_id)
+
+    def get(self, request, stream_id=None):
+        """续传生成：从Last-Event-ID请求头（或last_event_id参数）之后补发，只指定stream_id时从头补发"""
+        last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+        resumed_id, after = parse_event_id(last_event_id) if last_event_id else (stream_id, None)
+        buffer = get_stream_buffer()
+        if not resumed_id or (stream_id and resumed_id != stream_id) or not buffer.exists(resumed_id):
+            return Response(
+                {'error': 'Stream not found or expired'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return self._stream_response(request, buffer, resumed_id, after)
 
+    def _stream_response(self, request, buffer, stream_id, after=None):
+        """跟随帧缓冲输出SSE，每帧带有可用于续传的事件ID"""
         response = StreamingHttpResponse(
-            generate_stream(),
+            follow_stream(request, buffer, stream_id, after),
             content_type='text/event-stream'
         )
         response['Cache-Control'] = 'no-cache'
@@ -236,107 +360,284 @@ class StreamChatView(APIView):
         response['Access-Control-Allow-Origin'] = '*'
         return response
 
-    async def _process_message_async(self, message_content, agent_type):
-        """异步处理消息"""
-        agent_manager = lazy_get_agent_manager()
-        return await agent_manager.process_message(message_content, agent_type)
-
 
 @method_decorator(csrf_exempt, name='dispatch')
-class DocumentEditView(APIView):
+class MultiChatView(APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
-        """编辑文档内容"""
-        serializer = DocumentEditRequestSerializer(data=request.data)
+        """将同一条消息并发分发给多个智能体，每完成一个即推送结果并保存为独立文档"""
+        serializer = MultiChatRequestSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         data = serializer.validated_data
-        document_id = data['document_id']
-        operation = data['operation']
-        instruction = data['instruction']
-        target_version = data.get('target_version')
+        message_content = data['message']
+        conversation_id = data.get('conversation_id')
+        metadata = {'dataset_id': data['dataset_id']} if data.get('dataset_id') else None
 
         try:
-            document = Document.objects.get(id=document_id)
-            
-            # 获取目标版本内容
-            if target_version:
-                version = DocumentVersion.objects.get(
-                    document_id=document_id, 
-                    version_number=target_version
+            slot = reserve_stream(request)
+        except StreamsBusy as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        try:
+            agent_types = [AgentType(agent_type_str) for agent_type_str in data['agent_types']]
+        except ValueError as e:
+            return Response(
+                {'error': f'Invalid agent type: {e}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if conversation_id:
+            try:
+                conversation = Conversation.objects.get(
+                    id=conversation_id, 
+                    user_id=request.user.id if request.user.is_authenticated else None
                 )
-                base_content = version.content
-            else:
-                # 使用当前版本
-                version = DocumentVersion.objects.get(
-                    document_id=document_id, 
-                    version_number=document.current_version
+            except Conversation.DoesNotExist:
+                return Response(
+                    {'error': 'Conversation not found'}, 
+                    status=status.HTTP_404_NOT_FOUND
                 )
-                base_content = version.content
+        else:
+            conversation = Conversation.objects.create(
+                user_id=request.user.id if request.user.is_authenticated else None
+            )
 
-            # 构建编辑指令
-            edit_instruction = self._build_edit_instruction(operation, instruction, base_content)
-            
-            # 处理编辑请求
-            response = asyncio.run(self._process_edit_async(edit_instruction))
-            
-            if response.success:
-                # 创建新版本
-                new_version_number = document.current_version + 1
-                document.current_version = new_version_number
-                document.save()
-                
-                DocumentVersion.objects.create(
-                    document_id=document.id,
-                    version_number=new_version_number,
-                    content=response.content,
-                    raw_content=response.content,
-                    formatted_content=markdown_to_plain_text(response.content),
-                    version_note=f"{operation}: {instruction}",
-                    operation_type=operation
+        Message.objects.create(
+            conversation_id=conversation.id,
+            content=message_content,
+            agent_type=','.join(agent_type.value for agent_type in agent_types),
+            is_user_message=True
+        )
+
+        disconnected = get_disconnect_event(request)
+
+        def generate_stream():
+            """按完成顺序推送各智能体的结果，客户端断开时取消未完成的智能体"""
+            yield f"data: {json.dumps({'type': 'conversation_id', 'data': conversation.id})}\n\n"
+            try:
+                agent_manager = lazy_get_agent_manager()
+                results = get_loop_bridge().iterate(
+                    lambda: agent_manager.process_many(message_content, agent_types, metadata, conversation.id),
+                    cancelled=disconnected
                 )
-                
-                return Response({
-                    'success': True,
-                    'document_id': document.id,
-                    'new_version': new_version_number,
-                    'content': response.content,
-                    'formatted_content': markdown_to_plain_text(response.content)
-                })
-            else:
-                return Response({
-                    'success': False,
-                    'error': response.content
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                
-        except Document.DoesNotExist:
+                for response in results:
+                    agent_type_str = response.agent_type.value
+                    document_id = save_chat_turn(conversation.id, agent_type_str, response)
+                    result = {
+                        'agent_type': agent_type_str,
+                        'document_id': document_id,
+                        'success': response.success,
+                        'response': response.content,
+                        'formatted_response': markdown_to_plain_text(response.content),
+                        'execution_time': response.execution_time,
+                        'metadata': response.metadata
+                    }
+                    yield f"data: {json.dumps({'type': 'result', 'data': result}, ensure_ascii=False)}\n\n"
+                schedule_summary_refresh(conversation.id)
+                if disconnected is not None and disconnected.is_set():
+                    return
+                yield f"data: {json.dumps({'type': 'complete'})}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'type': 'error', 'data': str(e)})}\n\n"
+
+        response = StreamingHttpResponse(
+            stream_body(request, generate_stream(), slot),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class BatchView(APIView):
+    permission_classes = [AllowAny]
+    
+    def post(self, request):
+        """批量生成：按提供商限制并发执行，以NDJSON逐行返回结果，指定batch_id时续跑未完成条目"""
+        serializer = BatchRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        try:
+            slot = reserve_stream(request)
+        except StreamsBusy as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        batch_id = data.get('batch_id')
+        job = BatchJob.objects.filter(batch_id=batch_id).first() if batch_id else None
+
+        if job is None:
+            items = data.get('items') or []
+            if not items:
+                return Response({'error': 'items is required'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(items) > settings.BATCH_MAX_ITEMS:
+                return Response(
+                    {'error': f'Too many items, limit is {settings.BATCH_MAX_ITEMS}'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                entries = [
+                    BatchEntry(index=index, agent_type=AgentType(item['agent_type']), prompt=item['message'])
+                    for index, item in enumerate(items)
+                ]
+            except ValueError as e:
+                return Response({'error': f'Invalid agent type: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+            conversation = Conversation.objects.create(
+                user_id=request.user.id if request.user.is_authenticated else None
+            )
+            job = create_batch(batch_id or uuid.uuid4().hex, conversation.id, entries)
+        else:
+            if data.get('items'):
+                return Response(
+                    {'error': 'Batch already exists; resume it without items or use a new batch_id'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if not claim_batch(job.batch_id):
+                return Response({'error': 'Batch is already running'}, status=status.HTTP_409_CONFLICT)
+            entries = pending_entries(job.batch_id)
+
+        def line(payload):
+            return json.dumps(payload, ensure_ascii=False) + "\n"
+
+        disconnected = get_disconnect_event(request)
+
+        def generate_ndjson():
+            """每完成一条输出一行结果，每次批量写库后输出一行文档ID"""
+            writer = BatchWriter(job, settings.BATCH_FLUSH_SIZE)
+            finished = False
+            yield line({'type': 'batch', 'batch_id': job.batch_id, 'conversation_id': job.conversation_id,
+                        'total': job.total_items, 'pending': len(entries)})
+            try:
+                agent_manager = lazy_get_agent_manager()
+                limiter = ProviderLimiter(settings.BATCH_PROVIDER_CONCURRENCY, settings.BATCH_DEFAULT_CONCURRENCY)
+                results = get_loop_bridge().iterate(
+                    lambda: run_batch(agent_manager, entries, limiter), cancelled=disconnected
+                )
+                for result in results:
+                    response = result.response
+                    yield line({
+                        'type': 'result',
+                        'index': result.entry.index,
+                        'agent_type': result.entry.agent_type.value,
+                        'success': response.success,
+                        'response': response.content,
+                        'execution_time': response.execution_time,
+                        'error': response.error
+                    })
+                    persisted = writer.add(result)
+                    if persisted:
+                        yield line({'type': 'persisted', 'items': persisted})
+                if disconnected is not None and disconnected.is_set():
+                    return
+                persisted = writer.flush()
+                if persisted:
+                    yield line({'type': 'persisted', 'items': persisted})
+                writer.finish()
+                finished = True
+                yield line({'type': 'complete', **writer.summary()})
+            except Exception as e:
+                yield line({'type': 'error', 'data': str(e)})
+            finally:
+                if not finished:
+                    # 客户端断开或出错时保存已完成的结果，其余条目留待续跑
+                    writer.finish(interrupted=True)
+
+        response = StreamingHttpResponse(stream_body(request, generate_ndjson(), slot),
+                                         content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+
+    def get(self, request, batch_id):
+        """查询批量任务进度及各条目状态"""
+        try:
+            job = BatchJob.objects.get(batch_id=batch_id)
+        except BatchJob.DoesNotExist:
             return Response(
-                {'error': 'Document not found'}, 
+                {'error': 'Batch not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
-        except Exception as e:
-            return Response(
-                {'error': str(e)}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        return Response(BatchJobSerializer(job).data)
+
+
+class DocumentEditView(View):
+    """文档编辑接口（异步视图）"""
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+
+    async def post(self, request):
+        """编辑文档内容"""
+        serializer = DocumentEditRequestSerializer(data=parse_json_body(request))
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        try:
+            result = await edit_document(
+                data['document_id'], data['operation'], data['instruction'], data.get('target_version')
             )
+            return json_response(result, status.HTTP_200_OK if result['success'] else status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        except Document.DoesNotExist:
+            return json_response({'error': 'Document not found'}, status.HTTP_404_NOT_FOUND)
+        except LoopBridgeBusy as e:
+            return json_response({'error': str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE)
+        except Exception as e:
+            return json_response({'error': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def build_edit_instruction(operation, instruction, base_content):
+    """构建编辑指令"""
+    operation_prompts = {
+        'expand': f"请对以下内容进行扩写，具体要求：{instruction}\n\n原内容：\n{base_content}",
+        'compress': f"请对以下内容进行缩写，具体要求：{instruction}\n\n原内容：\n{base_content}",
+        'polish': f"请对以下内容进行润色，具体要求：{instruction}\n\n原内容：\n{base_content}",
+        'edit': f"请对以下内容进行修改，具体要求：{instruction}\n\n原内容：\n{base_content}"
+    }
+    return operation_prompts.get(operation, f"{instruction}\n\n{base_content}")
 
-    def _build_edit_instruction(self, operation, instruction, base_content):
-        """构建编辑指令"""
-        operation_prompts = {
-            'expand': f"请对以下内容进行扩写，具体要求：{instruction}\n\n原内容：\n{base_content}",
-            'compress': f"请对以下内容进行缩写，具体要求：{instruction}\n\n原内容：\n{base_content}",
-            'polish': f"请对以下内容进行润色，具体要求：{instruction}\n\n原内容：\n{base_content}",
-            'edit': f"请对以下内容进行修改，具体要求：{instruction}\n\n原内容：\n{base_content}"
+
+async def edit_document(document_id, operation, instruction, target_version=None):
+    """
+    按指令编辑文档并保存为新版本，返回接口响应内容
+
+    文档不存在时抛出Document.DoesNotExist；供文档编辑接口和WebSocket聊天共用
+    """
+    await sync_to_async(ensure_persisted)(document_id=document_id)
+    # 获取目标版本内容，未指定时使用当前版本
+    base_content = await sync_to_async(load_document_content)(document_id, target_version)
+
+    # 构建编辑指令
+    edit_instruction = build_edit_instruction(operation, instruction, base_content)
+
+    # 使用通用问答助手处理编辑请求
+    agent_manager = lazy_get_agent_manager()
+    response = await run_agent_coroutine(agent_manager.process_message(edit_instruction, AgentType.GENERAL_QA))
+
+    if not response.success:
+        return {
+            'success': False,
+            'error': response.content
         }
-        return operation_prompts.get(operation, f"{instruction}\n\n{base_content}")
 
-    async def _process_edit_async(self, instruction):
-        """异步处理编辑请求"""
-        agent_manager = lazy_get_agent_manager()
-        # 使用通用问答助手进行编辑
-        return await agent_manager.process_message(instruction, AgentType.GENERAL_QA)
+    # 在事务中原子递增版本号并创建新版本，并发编辑不会分配到相同的版本号
+    new_version_number = await sync_to_async(append_document_version)(
+        document_id, response.content, operation, f"{operation}: {instruction}"
+    )
+
+    return {
+        'success': True,
+        'document_id': document_id,
+        'new_version': new_version_number,
+        'content': response.content,
+        'formatted_content': markdown_to_plain_text(response.content)
+    }
 
 
 class DocumentView(APIView):
@@ -345,6 +646,7 @@ class DocumentView(APIView):
     def get(self, request, document_id=None):
         """获取文档详情"""
         if document_id:
+            ensure_persisted(document_id=document_id)
             try:
                 document = Document.objects.get(id=document_id)
                 serializer = DocumentSerializer(document)
@@ -357,6 +659,7 @@ class DocumentView(APIView):
         else:
             # 获取文档列表
             conversation_id = request.query_params.get('conversation_id')
+            ensure_persisted()
             if conversation_id:
                 documents = Document.objects.filter(conversation_id=conversation_id)
             else:
@@ -380,10 +683,132 @@ class DocumentView(APIView):
             )
 
 
+class GenerationProgressView(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request, generation_id):
+        """获取分段生成进度及已完成的章节"""
+        try:
+            checkpoint = GenerationCheckpoint.objects.get(generation_id=generation_id)
+        except GenerationCheckpoint.DoesNotExist:
+            return Response(
+                {'error': 'Generation not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        serializer = GenerationCheckpointSerializer(checkpoint)
+        return Response(serializer.data)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GenerationJobView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        """提交异步生成任务，立即返回job_id，由Celery工作进程执行"""
+        serializer = ChatRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        agent_type_str = data.get('agent_type', 'general_qa')
+        try:
+            AgentType(agent_type_str)
+        except ValueError:
+            return Response(
+                {'error': f'Invalid agent type: {agent_type_str}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        metadata = {key: data[key] for key in ('dataset_id', 'bypass_cache') if data.get(key)}
+
+        try:
+            job = submit_job(
+                data['message'], agent_type_str, data.get('conversation_id'),
+                request.user.id if request.user.is_authenticated else None, metadata
+            )
+        except Conversation.DoesNotExist:
+            return Response(
+                {'error': 'Conversation not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except JobQueueUnavailable:
+            return Response(
+                {'error': 'Job queue unavailable'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response(GenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    def get(self, request, job_id):
+        """查询任务状态、进度及已完成的章节，完成后返回文档ID"""
+        try:
+            job = GenerationJob.objects.get(job_id=job_id)
+        except GenerationJob.DoesNotExist:
+            return Response(
+                {'error': 'Job not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(GenerationJobSerializer(job).data)
+
+
+class GenerationJobEventsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        """SSE订阅任务的增量、进度、章节和结果；携带Last-Event-ID重连时从断点续传"""
+        if not GenerationJob.objects.filter(job_id=job_id).exists():
+            return Response(
+                {'error': 'Job not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+        after = parse_event_id(last_event_id)[1] if last_event_id else None
+        buffer = get_stream_buffer()
+        if buffer.exists(job_id):
+            frames = follow_stream(request, buffer, job_id, after)
+        else:
+            try:
+                frames = stream_body(request, poll_job_frames(job_id, get_disconnect_event(request)))
+            except StreamsBusy as e:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response = StreamingHttpResponse(frames, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+
+
+class ConversationSummaryView(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request, conversation_id):
+        """获取对话的滚动摘要、token数及新鲜度"""
+        if not Conversation.objects.filter(id=conversation_id).exists():
+            return Response(
+                {'error': 'Conversation not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(get_summary_status(conversation_id))
+
+
+class EventLoopStatsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        """后台事件循环的运行状态：进行中的任务数、拒绝次数和调度延迟"""
+        return Response(get_loop_bridge().stats())
+
+
+class StreamStatsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        """流式生成统计：完成和因客户端断开而取消的流数量及token数"""
+        return Response(get_stream_metrics().stats())
+
+
 class ConversationListView(APIView):
     permission_classes = [AllowAny]
     
     def get(self, request):
+        ensure_persisted()
         conversations = Conversation.objects.filter(
             user_id=request.user.id if request.user.is_authenticated else None
         )
@@ -0,0 +1,76 @@
+"""
+pre-fork预热
+在gunicorn --preload的主进程中加载全部智能体、导入重依赖并构建只读状态（如通用问答的路由流程图），
+随后调用gc.freeze()，使fork出的工作进程以写时复制方式共享这些内存页，首个请求也无需再承担初始化耗时。
+模型客户端等网络连接不在主进程中创建，fork后由子进程在首次使用时重新创建
+"""
+
+import gc
+import logging
+import os
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+_fork_hook_registered = False
+
+
+def warm_up(freeze: bool = True) -> Dict[str, float]:
+    """预热智能体系统，返回各阶段耗时（秒）"""
+    global _fork_hook_registered
+    from django.db import connections
+    from .initialization import get_agent_manager
+
+    timings = {}
+    start = time.perf_counter()
+
+    # 重依赖在主进程中导入一次，子进程共享
+    import langchain.schema  # noqa: F401
+    import langgraph.graph  # noqa: F401
+    timings['imports'] = time.perf_counter() - start
+
+    phase = time.perf_counter()
+    manager = get_agent_manager()
+    for agent_type in manager.agents:
+        agent = manager.agents[agent_type]
+        agent.warm_up()
+        # 预热过程中不应创建模型客户端，以防万一仍在fork前丢弃
+        agent.reset_clients()
+    timings['agents'] = time.perf_counter() - phase
+
+    # 数据库连接不能跨进程共享
+    connections.close_all()
+
+    if not _fork_hook_registered and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=reset_after_fork)
+        _fork_hook_registered = True
+
+    if freeze:
+        phase = time.perf_counter()
+        # 回收预热产生的垃圾后冻结剩余对象，避免子进程的垃圾回收写入共享页
+        gc.collect()
+        gc.freeze()
+        timings['freeze'] = time.perf_counter() - phase
+
+    timings['total'] = time.perf_counter() - start
+    logger.info(
+        f"智能体预热完成，加载 {len(manager.agents.loaded())} 个智能体，冻结 {gc.get_freeze_count()} 个对象，"
+        + "，".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in timings.items())
+    )
+    return timings
+
+
+def reset_after_fork():
+    """fork后在子进程中调用：丢弃继承的模型客户端、后台线程和后台事件循环"""
+    from .concurrency import set_loop_bridge
+    from .initialization import _agent_manager
+    from .summaries import reset_after_fork as reset_summaries
+    from .write_behind import reset_after_fork as reset_write_behind
+
+    if _agent_manager is not None:
+        for agent in _agent_manager.agents.loaded().values():
+            agent.reset_clients()
+    reset_summaries()
+    reset_write_behind()
+    set_loop_bridge(None)
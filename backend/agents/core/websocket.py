@@ -0,0 +1,312 @@
+"""
+WebSocket聊天
+客户端为每个对话建立一个连接（/ws/agents/chat/?conversation_id=&agent_type=），在同一连接上连续发送消息和
+文档编辑操作，接收流式增量和长任务进度。连接期间缓存对话记录、历史上下文（滚动摘要及其后的消息）和绑定的智能体，
+每轮不再重复请求解析、序列化校验、对话查询和历史加载
+
+握手时校验Origin（须在CSRF_TRUSTED_ORIGINS中），并从会话Cookie解析用户，只能打开该用户的对话，
+与HTTP接口的归属规则一致
+"""
+
+import asyncio
+import json
+import logging
+from http.cookies import CookieError, SimpleCookie
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+
+from .base import AgentType
+from .memory import MEMORY_MAX_MESSAGES, MEMORY_TOKEN_BUDGET, ConversationTurn, build_memory
+
+logger = logging.getLogger(__name__)
+
+WS_CHAT_PATH = '/ws/agents/chat/'
+
+# 关闭码：对话不存在、参数错误、来源不受信任
+CLOSE_NOT_FOUND = 4404
+CLOSE_BAD_REQUEST = 4400
+CLOSE_FORBIDDEN = 4403
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get('headers') or []:
+        if key.lower() == name:
+            return value.decode('latin1')
+    return None
+
+
+def origin_allowed(scope) -> bool:
+    """浏览器发起的连接必须来自CSRF_TRUSTED_ORIGINS；不带Origin的非浏览器客户端无法携带其他站点的Cookie，予以放行"""
+    from django.conf import settings
+
+    origin = _header(scope, b'origin')
+    if origin is None:
+        return True
+    return origin.lower() in {trusted.lower() for trusted in settings.CSRF_TRUSTED_ORIGINS}
+
+
+def resolve_user_id(scope) -> Optional[int]:
+    """从会话Cookie解析当前用户ID，未登录时返回None"""
+    from importlib import import_module
+
+    from django.conf import settings
+    from django.contrib.auth import get_user
+
+    try:
+        cookies = SimpleCookie(_header(scope, b'cookie') or '')
+    except CookieError:
+        return None
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if session_key is None:
+        return None
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key.value)
+    user = get_user(SimpleNamespace(session=session))
+    return user.id if user.is_authenticated else None
+
+
+class ChatSession:
+    """
+    单个WebSocket连接的会话
+
+    客户端消息（JSON）：
+        {"type": "message", "message": "...", "agent_type": "可选，切换绑定的智能体", "generation_id": "可选"}
+        {"type": "edit", "document_id": 1, "operation": "polish", "instruction": "...", "target_version": 可选}
+        {"type": "bind", "agent_type": "news_writer"}
+        {"type": "cancel"}：取消进行中的一轮
+        {"type": "ping"}
+    服务端消息：session、content（增量）、progress（分段生成进度）、complete、edit_result、cancelled、error、pong
+
+    同一时间只处理一轮消息或编辑，连接断开时取消进行中的一轮；只能编辑本对话中的文档
+    """
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.user_id: Optional[int] = None
+        self.conversation = None
+        self.agent_type = AgentType.GENERAL_QA
+        self.summary = ''
+        self.turns: List[ConversationTurn] = []
+        self.current: Optional[asyncio.Task] = None
+
+    async def run(self):
+        from django.db import close_old_connections
+
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if not origin_allowed(self.scope):
+            await self.send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+            return
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            conversation_id = int(params['conversation_id'][0]) if 'conversation_id' in params else None
+            if 'agent_type' in params:
+                self.agent_type = AgentType(params['agent_type'][0])
+        except ValueError:
+            await self.send({'type': 'websocket.close', 'code': CLOSE_BAD_REQUEST})
+            return
+        self.user_id = await sync_to_async(resolve_user_id)(self.scope)
+        if not await sync_to_async(self._open)(conversation_id):
+            await self.send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+            return
+
+        await self.send({'type': 'websocket.accept'})
+        await self.push('session', {'conversation_id': self.conversation.id, 'agent_type': self.agent_type.value})
+        try:
+            while True:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message['type'] == 'websocket.receive':
+                    await self.handle(message.get('text') or (message.get('bytes') or b'').decode())
+        finally:
+            if self.current is not None and not self.current.done():
+                self.current.cancel()
+                await asyncio.gather(self.current, return_exceptions=True)
+            await sync_to_async(close_old_connections)()
+
+    def _open(self, conversation_id: Optional[int]) -> bool:
+        """加载或创建当前用户的对话，并缓存滚动摘要及其后的消息"""
+        from django.db import close_old_connections
+
+        from .models import Conversation
+        from .memory import load_conversation_turns
+        from .summaries import load_summary_state
+
+        close_old_connections()
+        if conversation_id is None:
+            self.conversation = Conversation.objects.create(user_id=self.user_id)
+            return True
+        self.conversation = Conversation.objects.filter(id=conversation_id, user_id=self.user_id).first()
+        if self.conversation is None:
+            return False
+        state = load_summary_state(conversation_id)
+        self.summary = state.summary
+        self.turns = load_conversation_turns(conversation_id, after_id=state.summarized_until)
+        return True
+
+    async def push(self, event_type: str, data: Any = None):
+        await self.send({'type': 'websocket.send',
+                         'text': json.dumps({'type': event_type, 'data': data}, ensure_ascii=False, default=str)})
+
+    async def handle(self, text: str):
+        try:
+            payload = json.loads(text)
+            if not isinstance(payload, dict):
+                raise ValueError
+        except ValueError:
+            await self.push('error', 'Invalid JSON')
+            return
+
+        kind = payload.get('type')
+        if kind == 'ping':
+            await self.push('pong')
+        elif kind == 'cancel':
+            if self.current is not None and not self.current.done():
+                self.current.cancel()
+        elif kind == 'bind':
+            try:
+                self.agent_type = AgentType(payload.get('agent_type'))
+            except ValueError:
+                await self.push('error', f"Invalid agent type: {payload.get('agent_type')}")
+                return
+            await self.push('session', {'conversation_id': self.conversation.id, 'agent_type': self.agent_type.value})
+        elif kind in ('message', 'edit'):
+            if self.current is not None and not self.current.done():
+                await self.push('error', 'A message is already being processed')
+                return
+            handler = self.chat if kind == 'message' else self.edit
+            self.current = asyncio.ensure_future(self._guard(handler(payload)))
+        else:
+            await self.push('error', f'Unknown message type: {kind}')
+
+    async def _guard(self, coroutine):
+        """
+        执行一轮处理，被取消时通知客户端，出错时推送错误
+
+        长连接不经过Django的请求周期，每轮开始前和断开时关闭超时或出错的数据库连接，
+        避免持有数据库已断开的连接（CONN_MAX_AGE）
+        """
+        from django.db import close_old_connections
+
+        await sync_to_async(close_old_connections)()
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            await self.push('cancelled')
+        except Exception as e:
+            logger.warning(f"WebSocket会话处理失败: {e}")
+            await self.push('error', str(e))
+
+    async def chat(self, payload: Dict[str, Any]):
+        from .initialization import lazy_get_agent_manager
+        from .streaming import coalesce_deltas
+        from .utils import markdown_to_plain_text
+        from .views import persist_agent_response
+
+        content = payload.get('message')
+        if not isinstance(content, str) or not content.strip():
+            await self.push('error', 'message is required')
+            return
+        agent_type = self.agent_type
+        if payload.get('agent_type'):
+            try:
+                agent_type = self.agent_type = AgentType(payload['agent_type'])
+            except ValueError:
+                await self.push('error', f"Invalid agent type: {payload['agent_type']}")
+                return
+        metadata = {key: payload[key] for key in ('generation_id', 'dataset_id', 'bypass_cache') if payload.get(key)} or None
+
+        await sync_to_async(self._save_user_message)(content, agent_type.value)
+        # 历史上下文由连接内缓存的摘要和消息组装，不再查询数据库
+        history = build_memory(self.turns, MEMORY_TOKEN_BUDGET, self.summary)
+
+        final_response = None
+        agent_manager = lazy_get_agent_manager()
+        async for event in coalesce_deltas(
+            agent_manager.stream_message(content, agent_type, metadata, self.conversation.id, history)
+        ):
+            if event.type == 'delta':
+                await self.push('content', event.delta)
+            elif event.type == 'progress':
+                await self.push('progress', event.response)
+            else:
+                final_response = event.response
+
+        document_id = await sync_to_async(persist_agent_response)(self.conversation.id, agent_type.value, final_response)
+        self._remember(ConversationTurn(role='user', content=content))
+        self._remember(ConversationTurn(role='assistant', content=final_response.content, agent_type=agent_type.value))
+        if final_response.success:
+            await self.push('complete', {
+                'raw_content': final_response.content,
+                'formatted_content': markdown_to_plain_text(final_response.content),
+                'document_id': document_id,
+                'metadata': final_response.metadata
+            })
+        else:
+            await self.push('error', final_response.content)
+
+    def _save_user_message(self, content: str, agent_type: str):
+        from .models import Message
+
+        Message.objects.create(
+            conversation_id=self.conversation.id,
+            content=content,
+            agent_type=agent_type,
+            is_user_message=True
+        )
+
+    def _owns_document(self, document_id: int) -> bool:
+        from .models import Document
+        from .write_behind import ensure_persisted
+
+        ensure_persisted(document_id=document_id)
+        return Document.objects.filter(id=document_id, conversation_id=self.conversation.id).exists()
+
+    def _remember(self, turn: ConversationTurn):
+        self.turns.append(turn)
+        if len(self.turns) > MEMORY_MAX_MESSAGES:
+            self.turns = self.turns[-MEMORY_MAX_MESSAGES:]
+
+    async def edit(self, payload: Dict[str, Any]):
+        from .models import Document
+        from .serializers import DocumentEditRequestSerializer
+        from .views import edit_document
+
+        serializer = DocumentEditRequestSerializer(data=payload)
+        if not serializer.is_valid():
+            await self.push('error', serializer.errors)
+            return
+        data = serializer.validated_data
+        if not await sync_to_async(self._owns_document)(data['document_id']):
+            await self.push('error', 'Document not found')
+            return
+        try:
+            result = await edit_document(
+                data['document_id'], data['operation'], data['instruction'], data.get('target_version')
+            )
+        except Document.DoesNotExist:
+            await self.push('error', 'Document not found')
+            return
+        await self.push('edit_result', result)
+
+
+class WebSocketRouter:
+    """ASGI入口：WebSocket聊天路径交给ChatSession，其余WebSocket连接拒绝，HTTP请求交给Django"""
+
+    def __init__(self, http_app):
+        self.http_app = http_app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            return await self.http_app(scope, receive, send)
+        if scope.get('path') != WS_CHAT_PATH:
+            await receive()
+            await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+            return
+        await ChatSession(scope, receive, send).run()
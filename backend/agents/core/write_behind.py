@@ -0,0 +1,429 @@
+"""
+消息和文档版本的延迟写入
+开启后聊天接口把本轮的两条消息和文档版本放入队列即返回，响应耗时不再包含数据库提交；
+后台写入线程按批在一个事务中bulk_create。读取对话消息或文档之前，先把该对话/文档尚未写库的记录写入（读己之写）
+
+队列可选进程内或Redis：进程内队列在进程崩溃时丢失尚未写库的记录（最多一个写入周期）；
+Redis队列中的记录在Web进程重启后由任一进程继续写库，包括崩溃时已取出但尚未提交的记录
+"""
+
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 所有记录都计入的待写键，不指定对话和文档时等待全部记录写库
+ALL_KEY = '*'
+
+
+def conversation_key(conversation_id: int) -> str:
+    return f"conversation:{conversation_id}"
+
+
+def document_key(document_id: int) -> str:
+    return f"document:{document_id}"
+
+
+def message_item(**fields) -> Dict[str, Any]:
+    """待写入的消息，字段与Message模型相同"""
+    keys = [ALL_KEY, conversation_key(fields['conversation_id'])]
+    if fields.get('document_id'):
+        keys.append(document_key(fields['document_id']))
+    return {'kind': 'message', 'fields': fields, 'keys': keys}
+
+
+def version_item(document_id: int, content: str, version_number: Optional[int] = None,
+                 operation_type: Optional[str] = None) -> Dict[str, Any]:
+    """待写入的文档版本，未指定版本号时写库时取文档当前版本加一"""
+    fields = {'document_id': document_id, 'content': content, 'version_number': version_number,
+              'operation_type': operation_type}
+    return {'kind': 'version', 'fields': fields, 'keys': [ALL_KEY, document_key(document_id)]}
+
+
+class MemoryWriteQueue:
+    """进程内写入队列"""
+
+    def __init__(self):
+        self._items = deque()
+        self._pending = Counter()
+        self._condition = threading.Condition()
+
+    def push(self, items: List[dict]):
+        with self._condition:
+            for item in items:
+                self._items.append(item)
+                self._pending.update(item['keys'])
+            self._condition.notify_all()
+
+    def take(self, limit: int) -> List[dict]:
+        """取出最多limit条记录"""
+        with self._condition:
+            return [self._items.popleft() for _ in range(min(limit, len(self._items)))]
+
+    def wait(self, timeout: float) -> bool:
+        """等待队列中出现记录，不取出"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._items, timeout)
+
+    def requeue(self, items: List[dict]):
+        """写库失败的记录放回队首"""
+        with self._condition:
+            self._items.extendleft(reversed(items))
+            self._condition.notify_all()
+
+    def done(self, items: List[dict]):
+        with self._condition:
+            for item in items:
+                self._pending.subtract(item['keys'])
+            self._pending = +self._pending
+            self._condition.notify_all()
+
+    def pending(self, keys: Iterable[str]) -> bool:
+        with self._condition:
+            return any(self._pending.get(key) for key in keys)
+
+    def wait_done(self, keys: List[str], timeout: float) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: not self.pending(keys), timeout)
+
+
+class RedisWriteQueue:
+    """
+    基于Redis列表的写入队列，各进程共享，需要Redis 6.2及以上（LMOVE/BLMOVE）
+
+    取出的记录原子地移入本进程的处理中列表，写库提交后才删除。进程定期续期自己的存活键，
+    存活键已过期的处理中列表视为崩溃遗留，在启动时及之后每个存活周期放回队首由其他进程写库。
+    待写键的计数带过期时间，写入进程崩溃后计数不会永久阻塞读取
+    """
+
+    KEY = 'agents:write_behind'
+    MIN_REDIS_VERSION = (6, 2)
+    PENDING_TTL = 300
+    # 存活键的有效期，应明显长于写入一批记录的耗时，否则仍在写库的记录可能被其他进程重复写入
+    WORKER_TTL = 30
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, client, key: str = KEY):
+        self.client = client
+        self.key = key
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.processing_key = self._processing_key(self.worker_id)
+        # wait()阻塞取得、尚未交给take()的记录，以及已取出记录对应的原始JSON，写库后按原值从处理中列表删除
+        self._claimed = deque()
+        self._raw: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._heartbeat_at = 0.0
+        self._recovered_at = 0.0
+        self.recover_stale()
+
+    def _pending_key(self, key: str) -> str:
+        return f"{self.key}:pending:{key}"
+
+    def _processing_key(self, worker_id: str) -> str:
+        return f"{self.key}:processing:{worker_id}"
+
+    def _worker_key(self, worker_id: str) -> str:
+        return f"{self.key}:worker:{worker_id}"
+
+    def _heartbeat(self):
+        """续期存活键，须在记录移入处理中列表之前调用"""
+        now = time.monotonic()
+        if now - self._heartbeat_at >= self.WORKER_TTL / 3:
+            self.client.set(self._worker_key(self.worker_id), 1, ex=self.WORKER_TTL)
+            self._heartbeat_at = now
+        if now - self._recovered_at >= self.WORKER_TTL:
+            self.recover_stale()
+
+    def recover_stale(self) -> int:
+        """把存活键已过期的处理中列表按原顺序放回队首，返回放回的记录数"""
+        self._recovered_at = time.monotonic()
+        prefix = self._processing_key('')
+        recovered = 0
+        for processing_key in self.client.scan_iter(match=f"{prefix}*"):
+            worker_id = processing_key[len(prefix):]
+            if worker_id == self.worker_id or self.client.exists(self._worker_key(worker_id)):
+                continue
+            # 从尾部逐条移到队首，多个进程同时恢复时每条记录也只会移动一次
+            while self.client.lmove(processing_key, self.key, 'RIGHT', 'LEFT') is not None:
+                recovered += 1
+        if recovered:
+            logger.warning(f"{recovered}条未提交的延迟写入记录已放回队列")
+        return recovered
+
+    def _count(self, pipeline, items: List[dict], amount: int):
+        for key, count in Counter(key for item in items for key in item['keys']).items():
+            pipeline.incrby(self._pending_key(key), count * amount)
+            pipeline.expire(self._pending_key(key), self.PENDING_TTL)
+
+    def _load(self, raw: str) -> dict:
+        item = json.loads(raw)
+        self._raw[id(item)] = raw
+        return item
+
+    def _dump(self, items: List[dict]) -> List[str]:
+        return [self._raw.pop(id(item), None) or json.dumps(item, ensure_ascii=False) for item in items]
+
+    def push(self, items: List[dict]):
+        # 先登记待写计数再入队，读者不会错过已入队的记录
+        pipeline = self.client.pipeline(transaction=False)
+        self._count(pipeline, items, 1)
+        pipeline.rpush(self.key, *[json.dumps(item, ensure_ascii=False) for item in items])
+        pipeline.execute()
+
+    def take(self, limit: int) -> List[dict]:
+        """取出最多limit条记录，取出的记录留在处理中列表直到done或requeue"""
+        self._heartbeat()
+        with self._lock:
+            raws = [self._claimed.popleft() for _ in range(min(limit, len(self._claimed)))]
+        if len(raws) < limit:
+            pipeline = self.client.pipeline(transaction=False)
+            for _ in range(limit - len(raws)):
+                pipeline.lmove(self.key, self.processing_key, 'LEFT', 'RIGHT')
+            raws.extend(raw for raw in pipeline.execute() if raw is not None)
+        return [self._load(raw) for raw in raws]
+
+    def wait(self, timeout: float) -> bool:
+        """
+        用BLMOVE阻塞等待队首记录并移入处理中列表，留给随后的take
+
+        取得的记录在本进程写库前，其他进程的读者只能等待而不能代为写入（最多一个写入周期）
+        """
+        self._heartbeat()
+        with self._lock:
+            if self._claimed:
+                return True
+        raw = self.client.blmove(self.key, self.processing_key, timeout, 'LEFT', 'RIGHT')
+        if raw is None:
+            return False
+        with self._lock:
+            self._claimed.append(raw)
+        return True
+
+    def requeue(self, items: List[dict]):
+        """写库失败的记录从处理中列表原子地放回队首"""
+        raws = self._dump(items)
+        pipeline = self.client.pipeline()
+        for raw in raws:
+            pipeline.lrem(self.processing_key, 1, raw)
+        pipeline.lpush(self.key, *reversed(raws))
+        pipeline.execute()
+
+    def done(self, items: List[dict]):
+        """写库提交后删除处理中的记录并减少待写计数"""
+        pipeline = self.client.pipeline()
+        for raw in self._dump(items):
+            pipeline.lrem(self.processing_key, 1, raw)
+        self._count(pipeline, items, -1)
+        pipeline.execute()
+
+    def pending(self, keys: Iterable[str]) -> bool:
+        values = self.client.mget([self._pending_key(key) for key in keys])
+        return any(int(value or 0) > 0 for value in values)
+
+    def wait_done(self, keys: List[str], timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.pending(keys):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL)
+        return True
+
+
+def write_items(items: List[dict]):
+    """在一个事务中写入一批记录：消息bulk_create；文档加锁后分配版本号，版本bulk_create，当前版本bulk_update"""
+    from django.db import transaction
+    from django.utils import timezone
+    from .models import Document, DocumentVersion, Message
+    from .utils import markdown_to_plain_text
+
+    versions = [item['fields'] for item in items if item['kind'] == 'version']
+    messages = [Message(**item['fields']) for item in items if item['kind'] == 'message']
+    with transaction.atomic():
+        if versions:
+            documents = Document.objects.select_for_update().in_bulk({fields['document_id'] for fields in versions})
+            now = timezone.now()
+            rows = []
+            for fields in versions:
+                document = documents.get(fields['document_id'])
+                if document is None:
+                    logger.warning(f"文档 {fields['document_id']} 不存在，丢弃延迟写入的版本")
+                    continue
+                number = fields['version_number'] or document.current_version + 1
+                document.current_version = max(document.current_version, number)
+                document.updated_at = now
+                rows.append(DocumentVersion(
+                    document_id=document.id,
+                    version_number=number,
+                    content=fields['content'],
+                    raw_content=fields['content'],
+                    formatted_content=markdown_to_plain_text(fields['content']),
+                    operation_type=fields['operation_type'] or ('create' if number == 1 else 'edit')
+                ))
+            DocumentVersion.objects.bulk_create(rows)
+            Document.objects.bulk_update(list(documents.values()), ['current_version', 'updated_at'])
+        Message.objects.bulk_create(messages)
+
+
+class WriteBehindWriter:
+    """后台写入线程：攒够batch_size条或等待flush_interval秒后批量写库，数据库暂时不可用时放回队列重试"""
+
+    RETRY_DELAY = 1.0
+
+    def __init__(self, queue, batch_size: int = 200, flush_interval: float = 0.05, wait_timeout: float = 5):
+        self.queue = queue
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.wait_timeout = wait_timeout
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def submit(self, items: List[dict]):
+        """记录入队，由后台线程写库"""
+        self.queue.push(items)
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='agent-write-behind', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        from django.db import close_old_connections
+
+        while not self._stopped.is_set():
+            try:
+                if not self.queue.wait(1.0):
+                    continue
+                # 等待一个写入周期，把随后到达的记录合并进同一批；等待期间记录留在队列中，读者可以直接取走写库
+                time.sleep(self.flush_interval)
+                items = self.queue.take(self.batch_size)
+                if items and not self.write(items):
+                    time.sleep(self.RETRY_DELAY)
+            except Exception as e:
+                logger.warning(f"延迟写入线程出错: {e}")
+                time.sleep(self.RETRY_DELAY)
+            finally:
+                close_old_connections()
+
+    def write(self, items: List[dict]) -> bool:
+        """写入一批记录；数据库不可用时放回队列并返回False，单条记录无法写入时丢弃该条"""
+        from django.db import InterfaceError, OperationalError
+        from .summaries import schedule_summary_refresh
+
+        try:
+            write_items(items)
+        except (OperationalError, InterfaceError) as e:
+            logger.warning(f"延迟写入失败，{len(items)}条记录稍后重试: {e}")
+            self.queue.requeue(items)
+            return False
+        except Exception as e:
+            logger.warning(f"延迟写入整批失败，逐条重试: {e}")
+            for item in items:
+                try:
+                    write_items([item])
+                except Exception as item_error:
+                    logger.error(f"丢弃无法写入的{item['kind']}记录 {item['fields']}: {item_error}")
+        self.queue.done(items)
+        # 消息写库后再更新滚动摘要
+        for conversation_id in {item['fields']['conversation_id'] for item in items if item['kind'] == 'message'}:
+            schedule_summary_refresh(conversation_id)
+        return True
+
+    def flush(self, keys: Optional[List[str]] = None, timeout: Optional[float] = None) -> bool:
+        """读己之写：等待keys对应的记录写库（不指定时等待全部记录），超时返回False"""
+        keys = keys or [ALL_KEY]
+        if not self.queue.pending(keys):
+            return True
+        # 在调用方线程中直接写入队列中的记录，不必等待后台线程的下一个写入周期
+        while True:
+            items = self.queue.take(self.batch_size)
+            if not items or not self.write(items):
+                break
+        return self.queue.wait_done(keys, self.wait_timeout if timeout is None else timeout)
+
+    def close(self):
+        """进程退出前写入剩余记录"""
+        self._stopped.set()
+        try:
+            self.flush(timeout=self.wait_timeout)
+        except Exception as e:
+            logger.warning(f"退出前写入剩余记录失败: {e}")
+
+
+# 全局延迟写入实例，未开启时为None
+_writer: Optional[WriteBehindWriter] = None
+_configured = False
+_writer_lock = threading.Lock()
+
+
+def get_write_behind() -> Optional[WriteBehindWriter]:
+    """获取延迟写入实例：按PERSIST_WRITE_BEHIND配置创建，未开启时返回None，Redis不可用或低于6.2时退回进程内队列"""
+    global _writer, _configured
+    if not _configured:
+        with _writer_lock:
+            if not _configured:
+                from django.conf import settings
+
+                mode = settings.PERSIST_WRITE_BEHIND
+                if mode in ('memory', 'redis'):
+                    queue = None
+                    if mode == 'redis':
+                        try:
+                            import redis
+                            client = redis.Redis.from_url(settings.PERSIST_WRITE_BEHIND_REDIS_URL,
+                                                          decode_responses=True)
+                            version = client.info('server')['redis_version']
+                            major_minor = tuple(int(part) for part in version.split('.')[:2])
+                            if major_minor < RedisWriteQueue.MIN_REDIS_VERSION:
+                                raise RuntimeError(f"Redis版本 {version} 低于6.2，不支持LMOVE/BLMOVE")
+                            queue = RedisWriteQueue(client)
+                        except Exception as e:
+                            logger.warning(f"Redis不可用，延迟写入退回进程内队列: {e}")
+                    _writer = WriteBehindWriter(
+                        queue or MemoryWriteQueue(),
+                        settings.PERSIST_WRITE_BEHIND_BATCH_SIZE,
+                        settings.PERSIST_WRITE_BEHIND_FLUSH_MS / 1000,
+                        settings.PERSIST_READ_YOUR_WRITES_TIMEOUT
+                    )
+                    atexit.register(_writer.close)
+                _configured = True
+    return _writer
+
+
+def set_write_behind(writer: Optional[WriteBehindWriter]):
+    """替换全局延迟写入实例，传入None表示关闭"""
+    global _writer, _configured
+    _writer = writer
+    _configured = True
+
+
+def reset_after_fork():
+    """fork出的子进程不继承写入线程，重新按配置创建"""
+    global _writer, _configured, _writer_lock
+    _writer = None
+    _configured = False
+    _writer_lock = threading.Lock()
+
+
+def ensure_persisted(conversation_id: Optional[int] = None, document_id: Optional[int] = None):
+    """读取对话消息或文档前调用，确保该对话/文档延迟写入的记录已写库；未开启延迟写入时直接返回"""
+    keys = [conversation_key(conversation_id)] if conversation_id is not None else []
+    if document_id is not None:
+        keys.append(document_key(document_id))
+    try:
+        writer = get_write_behind()
+        if writer is not None and not writer.flush(keys or None):
+            logger.warning(f"等待延迟写入超时: {keys or ALL_KEY}")
+    except Exception as e:
+        logger.warning(f"等待延迟写入失败: {e}")
@@ -1,9 +1,13 @@
 from agents.core.base import BaseAgent, AgentType, AgentMessage, AgentResponse
-from agents.core.llm_manager import get_llm
-from langchain.schema import HumanMessage, SystemMessage
-from typing import List, Dict
+from agents.core.cache import cached_process
+from typing import List, Dict, Optional
+import asyncio
+import os
 import time
 import re
+from .datasets import get_dataset_store
+from .profiling import render_profile
+from .sandbox import get_sandbox_pool, SandboxResult
 
 
 class DataAnalysisAgent(BaseAgent):
@@ -13,9 +17,6 @@ class DataAnalysisAgent(BaseAgent):
             name="数据分析智能体",
             description="专业的数据分析助手，支持数据处理、分析和可视化"
         )
-        # 使用统一的LLM管理器
-        self.llm = get_llm()
-        
         # 分析类型模板
         self.analysis_types = {
             "描述性分析": ["描述", "统计", "汇总", "概览"],
@@ -32,7 +33,11 @@ class DataAnalysisAgent(BaseAgent):
             "运营数据": ["运营", "效率", "流程", "KPI"],
             "市场数据": ["市场", "竞争", "份额", "调研"]
         }
+        
+        # 上传了数据集时，是否在沙箱中执行生成的代码并附上结果；代码可能受数据集内容注入，默认关闭
+        self.execute_code = os.getenv('DATA_ANALYSIS_EXECUTE_CODE', 'false').lower() == 'true'
 
+    @cached_process
     async def process(self, message: AgentMessage) -> AgentResponse:
         start_time = time.time()
         
@@ -49,19 +54,31 @@ class DataAnalysisAgent(BaseAgent):
             # 分析用户需求
             analysis_info = self._analyze_data_request(message.content)
             
+            # 加载上传数据集的画像（按内容哈希缓存）
+            dataset_profile = await self._load_dataset_profile(message)
+            analysis_info["has_dataset"] = dataset_profile is not None
+            
             # 构建专业的系统提示
             system_prompt = self._build_system_prompt(analysis_info)
+            
+            user_content = message.content
+            if dataset_profile:
+                user_content += f"\n\n已上传数据集概况（本地统计）：\n{render_profile(dataset_profile)}"
 
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=message.content)
-            ]
+            messages = self._build_messages(system_prompt, user_content, message.history)
 
-            response = await self.llm.ainvoke(messages)
+            response = await self._generate(messages)
             
             # 后处理：格式化数据分析输出
             formatted_content = self._format_analysis_output(response.content, analysis_info)
             
+            # 在沙箱中针对数据集运行生成的代码，结果直接附在回答中
+            execution = None
+            if dataset_profile and self.execute_code and (message.metadata or {}).get("execute_code", True):
+                execution = await self._execute_generated_code(formatted_content, dataset_profile["dataset_id"])
+                if execution:
+                    formatted_content += self._render_execution(execution)
+            
             return AgentResponse(
                 success=True,
                 content=formatted_content,
@@ -71,7 +88,10 @@ class DataAnalysisAgent(BaseAgent):
                     "analysis_type": analysis_info.get("type", "通用数据分析"),
                     "data_type": analysis_info.get("data_type", "未指定"),
                     "complexity": analysis_info.get("complexity", "中等"),
-                    "tools_suggested": analysis_info.get("tools", [])
+                    "tools_suggested": analysis_info.get("tools", []),
+                    "dataset_id": dataset_profile.get("dataset_id") if dataset_profile else None,
+                    "code_executed": execution is not None,
+                    "execution_success": execution.success if execution else None
                 }
             )
 
@@ -84,6 +104,42 @@ class DataAnalysisAgent(BaseAgent):
                 error=str(e)
             )
 
+    async def _load_dataset_profile(self, message: AgentMessage) -> Optional[Dict]:
+        """读取消息关联数据集的画像"""
+        dataset_id = (message.metadata or {}).get("dataset_id")
+        if not dataset_id:
+            return None
+        try:
+            return await asyncio.to_thread(get_dataset_store().get_profile, dataset_id)
+        except KeyError:
+            raise ValueError(f"数据集不存在: {dataset_id}")
+
+    async def _execute_generated_code(self, content: str, dataset_id: str) -> Optional[SandboxResult]:
+        """提取回答中的Python代码块，在沙箱中针对数据集执行"""
+        code_blocks = re.findall(r'```python\n(.*?)```', content, re.DOTALL)
+        if not code_blocks:
+            return None
+        location = get_dataset_store().locate(dataset_id)
+        if location is None:
+            return None
+        dataset_path, dataset_format = location
+        return await get_sandbox_pool().run("\n\n".join(code_blocks), dataset_path, dataset_format)
+
+    def _render_execution(self, execution: SandboxResult) -> str:
+        """将沙箱执行结果渲染为Markdown"""
+        parts = ["\n\n## 执行结果\n"]
+        if execution.stdout.strip():
+            parts.append(f"```text\n{execution.stdout.strip()}\n```\n")
+        for table in execution.tables:
+            parts.append(f"**{table['name']}**\n\n```text\n{table['table']}\n```\n")
+        if not execution.success:
+            parts.append(f"代码执行失败：\n\n```text\n{execution.error}\n```\n")
+        parts.append(f"*执行耗时：{execution.execution_time:.2f}秒*")
+        return "\n".join(parts)
+
+    def cache_analysis(self, message: AgentMessage) -> Dict:
+        return self._analyze_data_request(message.content)
+
     def _analyze_data_request(self, content: str) -> Dict:
         """分析数据分析请求"""
         content_lower = content.lower()
@@ -161,6 +217,9 @@ class DataAnalysisAgent(BaseAgent):
         if analysis_info.get("tools"):
             base_prompt += f"推荐工具：{', '.join(analysis_info['tools'])}\n"
         
+        if analysis_info.get("has_dataset"):
+            base_prompt += "用户已上传数据集，下方附有本地计算的数据概况与样本；代码示例中可直接使用已加载的DataFrame变量 df。\n"
+        
         base_prompt += "\n请根据用户需求提供专业的数据分析解决方案。"
         
         return base_prompt
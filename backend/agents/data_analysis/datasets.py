@@ -0,0 +1,119 @@
+"""
+数据集存储
+按内容哈希保存上传的数据文件，并缓存其画像，同一数据集的后续提问无需重复计算
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .profiling import detect_format, load_dataframe, profile_dataframe
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetStore:
+    """本地数据集存储，文件名为内容的SHA-256哈希"""
+
+    def __init__(self, root: str, max_cached_profiles: int = 128):
+        self.root = Path(root)
+        self.max_cached_profiles = max_cached_profiles
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, data: bytes, filename: str) -> str:
+        """保存数据文件，返回数据集ID（内容哈希）"""
+        file_format = detect_format(filename)
+        if not file_format:
+            raise ValueError(f"不支持的数据文件类型: {filename}")
+
+        dataset_id = hashlib.sha256(data).hexdigest()
+        self.root.mkdir(parents=True, exist_ok=True)
+        data_path = self._data_path(dataset_id, file_format)
+        if not data_path.exists():
+            tmp_path = data_path.with_suffix('.tmp')
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, data_path)
+        return dataset_id
+
+    def discard(self, dataset_id: str):
+        """删除数据文件及其画像缓存，用于无法解析的上传"""
+        with self._lock:
+            self._profiles.pop(dataset_id, None)
+        location = self.locate(dataset_id)
+        if location is not None:
+            Path(location[0]).unlink(missing_ok=True)
+        (self.root / f"{dataset_id}.profile.json").unlink(missing_ok=True)
+
+    def exists(self, dataset_id: str) -> bool:
+        return self.locate(dataset_id) is not None
+
+    def locate(self, dataset_id: str) -> Optional[tuple]:
+        """返回数据文件路径与格式"""
+        if not self._is_valid_id(dataset_id):
+            return None
+        for file_format in ('csv', 'tsv', 'excel', 'parquet'):
+            data_path = self._data_path(dataset_id, file_format)
+            if data_path.exists():
+                return str(data_path), file_format
+        return None
+
+    def get_profile(self, dataset_id: str) -> Dict[str, Any]:
+        """获取数据集画像，依次查询进程内缓存、磁盘缓存，最后才计算"""
+        with self._lock:
+            if dataset_id in self._profiles:
+                self._profiles.move_to_end(dataset_id)
+                return self._profiles[dataset_id]
+
+        location = self.locate(dataset_id)
+        if location is None:
+            raise KeyError(f"数据集不存在: {dataset_id}")
+
+        profile_path = self.root / f"{dataset_id}.profile.json"
+        if profile_path.exists():
+            profile = json.loads(profile_path.read_text(encoding='utf-8'))
+        else:
+            data_path, file_format = location
+            profile = profile_dataframe(load_dataframe(data_path, file_format))
+            profile['dataset_id'] = dataset_id
+            profile['format'] = file_format
+            tmp_path = profile_path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(profile, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp_path, profile_path)
+
+        with self._lock:
+            self._profiles[dataset_id] = profile
+            while len(self._profiles) > self.max_cached_profiles:
+                self._profiles.popitem(last=False)
+        return profile
+
+    def _data_path(self, dataset_id: str, file_format: str) -> Path:
+        return self.root / f"{dataset_id}.{file_format}"
+
+    @staticmethod
+    def _is_valid_id(dataset_id: str) -> bool:
+        return len(dataset_id) == 64 and all(c in '0123456789abcdef' for c in dataset_id)
+
+
+# 全局数据集存储实例
+_dataset_store: Optional[DatasetStore] = None
+
+
+def get_dataset_store() -> DatasetStore:
+    """获取全局数据集存储"""
+    global _dataset_store
+    if _dataset_store is None:
+        from django.conf import settings
+        _dataset_store = DatasetStore(settings.DATASET_STORAGE_DIR)
+    return _dataset_store
+
+
+def set_dataset_store(store: Optional[DatasetStore]):
+    """替换全局数据集存储"""
+    global _dataset_store
+    _dataset_store = store
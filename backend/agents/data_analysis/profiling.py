@@ -0,0 +1,210 @@
+"""
+数据集画像
+在本地对上传的数据集做向量化统计，只把紧凑的画像和少量样本送入提示词
+"""
+
+import math
+from typing import Any, Dict, List, Optional
+
+# 支持的数据文件格式
+SUPPORTED_FORMATS = {
+    '.csv': 'csv',
+    '.tsv': 'tsv',
+    '.xlsx': 'excel',
+    '.xls': 'excel',
+    '.parquet': 'parquet',
+}
+
+
+def _require_pandas():
+    try:
+        import pandas as pd
+        return pd
+    except ImportError:
+        raise ImportError("请先安装 pandas: pip install pandas")
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """根据文件名识别数据格式"""
+    lowered = filename.lower()
+    for extension, file_format in SUPPORTED_FORMATS.items():
+        if lowered.endswith(extension):
+            return file_format
+    return None
+
+
+def load_dataframe(path, file_format: str):
+    """按格式读取数据文件（路径或文件对象）为DataFrame"""
+    pd = _require_pandas()
+    if file_format == 'csv':
+        return pd.read_csv(path)
+    if file_format == 'tsv':
+        return pd.read_csv(path, sep='\t')
+    if file_format == 'excel':
+        try:
+            return pd.read_excel(path)
+        except ImportError:
+            # .xls由xlrd读取，.xlsx由openpyxl读取
+            engine = 'xlrd' if str(path).lower().endswith('.xls') else 'openpyxl'
+            raise ImportError(f"请先安装 {engine}: pip install {engine}")
+    if file_format == 'parquet':
+        try:
+            return pd.read_parquet(path)
+        except ImportError:
+            raise ImportError("请先安装 pyarrow: pip install pyarrow")
+    raise ValueError(f"不支持的数据格式: {file_format}")
+
+
+def _round(value: Any, digits: int = 4) -> Any:
+    """将numpy标量转换为可JSON序列化的Python值"""
+    if value is None:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) else round(value, digits)
+    return value
+
+
+def _detect_datetime_columns(df) -> List[str]:
+    """识别日期时间列，字符串列按前若干行尝试解析"""
+    pd = _require_pandas()
+    columns = list(df.select_dtypes(include=['datetime', 'datetimetz']).columns)
+    for column in df.select_dtypes(include=['object']).columns:
+        sample = df[column].dropna().head(50)
+        if sample.empty:
+            continue
+        parsed = pd.to_datetime(sample, errors='coerce', format='mixed')
+        if parsed.notna().mean() >= 0.9:
+            columns.append(column)
+    return columns
+
+
+def _resample_rule(span_days: float) -> str:
+    """根据时间跨度选择重采样粒度"""
+    if span_days <= 60:
+        return 'D'
+    if span_days <= 730:
+        return 'W'
+    return 'MS'
+
+
+def profile_dataframe(df, top_k: int = 5, sample_rows: int = 5,
+                      max_correlations: int = 10, max_periods: int = 12) -> Dict[str, Any]:
+    """
+    计算数据集画像
+
+    返回字段：行列数、各列类型与缺失率、数值分位数、高频取值、强相关列对、
+    时间序列重采样结果以及少量样本行
+    """
+    pd = _require_pandas()
+
+    null_rates = df.isna().mean()
+    numeric = df.select_dtypes(include=['number'])
+    quantiles = numeric.quantile([0, 0.25, 0.5, 0.75, 1.0]) if not numeric.empty else None
+    means = numeric.mean() if not numeric.empty else None
+
+    columns = []
+    for column in df.columns:
+        info = {
+            'name': str(column),
+            'dtype': str(df[column].dtype),
+            'null_rate': _round(null_rates[column]),
+            'unique': int(df[column].nunique(dropna=True)),
+        }
+        if quantiles is not None and column in numeric.columns:
+            info['mean'] = _round(means[column])
+            info['quantiles'] = {
+                label: _round(quantiles.at[q, column])
+                for q, label in zip([0, 0.25, 0.5, 0.75, 1.0], ['min', 'p25', 'p50', 'p75', 'max'])
+            }
+        else:
+            counts = df[column].value_counts(dropna=True).head(top_k)
+            info['top_values'] = [
+                {'value': str(value), 'count': int(count)} for value, count in counts.items()
+            ]
+        columns.append(info)
+
+    correlations = []
+    if numeric.shape[1] >= 2:
+        import numpy as np
+        matrix = numeric.corr()
+        # 只取上三角，避免重复列对和自相关
+        upper = np.triu(np.ones(matrix.shape, dtype=bool), k=1)
+        pairs = matrix.where(upper).stack()
+        pairs = pairs.reindex(pairs.abs().sort_values(ascending=False).index).head(max_correlations)
+        correlations = [
+            {'columns': [str(a), str(b)], 'corr': _round(value, 3)}
+            for (a, b), value in pairs.items()
+        ]
+
+    time_series = None
+    datetime_columns = _detect_datetime_columns(df)
+    if datetime_columns and not numeric.empty:
+        time_column = datetime_columns[0]
+        timestamps = pd.to_datetime(df[time_column], errors='coerce', format='mixed')
+        series = numeric.set_index(timestamps)
+        series = series[series.index.notna()].sort_index()
+        if not series.empty:
+            span_days = (series.index.max() - series.index.min()).total_seconds() / 86400
+            rule = _resample_rule(span_days)
+            resampled = series.resample(rule).mean().tail(max_periods)
+            time_series = {
+                'time_column': str(time_column),
+                'start': str(series.index.min()),
+                'end': str(series.index.max()),
+                'rule': rule,
+                'periods': [
+                    {'period': str(index.date()), **{str(k): _round(v, 3) for k, v in row.items()}}
+                    for index, row in resampled.iterrows()
+                ]
+            }
+
+    sample = df.head(sample_rows).astype(str).to_dict(orient='records')
+
+    return {
+        'rows': int(df.shape[0]),
+        'columns_count': int(df.shape[1]),
+        'columns': columns,
+        'correlations': correlations,
+        'time_series': time_series,
+        'sample': sample,
+    }
+
+
+def render_profile(profile: Dict[str, Any]) -> str:
+    """将数据集画像渲染为紧凑的提示词文本"""
+    lines = [f"数据规模：{profile['rows']} 行 × {profile['columns_count']} 列", "字段概况："]
+    for column in profile['columns']:
+        # 没有数据行时缺失率为None
+        null_rate = '—' if column['null_rate'] is None else f"{column['null_rate']:.1%}"
+        line = f"- {column['name']}（{column['dtype']}，缺失率{null_rate}，去重值{column['unique']}）"
+        if 'quantiles' in column:
+            q = column['quantiles']
+            line += f" 均值={column['mean']} 最小={q['min']} P25={q['p25']} 中位数={q['p50']} P75={q['p75']} 最大={q['max']}"
+        elif column.get('top_values'):
+            top = '、'.join(f"{item['value']}({item['count']})" for item in column['top_values'])
+            line += f" 高频取值：{top}"
+        lines.append(line)
+
+    if profile.get('correlations'):
+        lines.append("相关性最强的数值列：")
+        for item in profile['correlations']:
+            lines.append(f"- {item['columns'][0]} ~ {item['columns'][1]}: {item['corr']}")
+
+    time_series = profile.get('time_series')
+    if time_series:
+        lines.append(
+            f"时间序列：{time_series['time_column']} 从 {time_series['start']} 到 {time_series['end']}，"
+            f"按 {time_series['rule']} 重采样的均值（最近{len(time_series['periods'])}期）："
+        )
+        for period in time_series['periods']:
+            values = '，'.join(f"{k}={v}" for k, v in period.items() if k != 'period')
+            lines.append(f"- {period['period']}: {values}")
+
+    if profile.get('sample'):
+        lines.append("样本数据：")
+        for row in profile['sample']:
+            lines.append("- " + "，".join(f"{k}={v}" for k, v in row.items()))
+
+    return '\n'.join(lines)
@@ -0,0 +1,544 @@
+"""
+数据分析代码沙箱
+由预热的工作进程池执行智能体生成的Python代码，进程内已导入pandas和NumPy，
+每次执行受CPU时间、内存和墙钟时间限制
+
+生成的代码来自包含上传数据的提示词，视为不可信代码。工作进程以空环境变量启动，
+预热后切换到受限用户，并由seccomp在内核层面禁止创建套接字、执行程序和派生进程；
+无法施加这些限制的平台上沙箱拒绝执行
+"""
+
+import ast
+import asyncio
+import contextlib
+import ctypes
+import dataclasses
+import io
+import json
+import logging
+import os
+import platform
+import queue
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 工作进程的启动脚本：不读取PYTHON*环境变量，只把后端目录加入导入路径
+_WORKER_BOOT = (
+    "import sys; sys.path.insert(0, sys.argv[1]); "
+    "from agents.data_analysis.sandbox import _worker_main; _worker_main(*sys.argv[2:])"
+)
+
+# 切换用户前执行一遍常用操作，使pandas按需导入的子模块在受限用户无法读取代码目录时也已加载
+_WARMUP_CODE = """
+frame = pd.DataFrame({'k': ['a', 'b', 'a'], 'v': [1.0, 2.0, None], 't': pd.date_range('2024-01-01', periods=3)})
+grouped = frame.groupby('k')['v'].agg(['sum', 'mean', 'count'])
+pivot = frame.pivot_table(index='k', values='v', aggfunc='sum')
+frame.describe(include='all')
+frame.set_index('t').resample('D').sum(numeric_only=True)
+frame.corr(numeric_only=True)
+frame.sort_values('v').fillna(0).merge(grouped, left_on='k', right_index=True).to_string()
+pd.to_datetime(frame['t']).dt.month.value_counts()
+np.percentile(np.arange(10), [25, 50, 75])
+"""
+
+# 工作进程回传结果的大小上限
+MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+# 工作进程导入依赖、完成预热的最长等待秒数
+SPAWN_TIMEOUT = 60.0
+
+
+@dataclass
+class SandboxLimits:
+    """沙箱资源限制"""
+    cpu_seconds: int = 10
+    memory_mb: int = 2048
+    wall_seconds: float = 15.0
+    max_output_chars: int = 8000
+    max_tables: int = 5
+    table_rows: int = 20
+    # 每个工作进程缓存的数据集个数，超出时淘汰最久未用的
+    cached_datasets: int = 4
+
+
+@dataclass
+class SandboxResult:
+    """沙箱执行结果"""
+    success: bool
+    stdout: str = ''
+    tables: List[Dict[str, str]] = field(default_factory=list)
+    error: Optional[str] = None
+    execution_time: float = 0.0
+
+
+class SandboxUnavailable(RuntimeError):
+    """当前平台或权限下无法施加沙箱限制"""
+
+
+# seccomp过滤规则用到的系统调用号，按架构区分
+_SYSCALLS = {
+    'x86_64': {
+        'audit_arch': 0xc000003e, 'seccomp': 317,
+        'socket': 41, 'socketpair': 53, 'fork': 57, 'vfork': 58, 'execve': 59, 'execveat': 322,
+        'ptrace': 101, 'process_vm_readv': 310, 'process_vm_writev': 311, 'io_uring_setup': 425,
+        'clone': 56, 'clone3': 435, 'kill': 62, 'tkill': 200, 'tgkill': 234,
+    },
+    'aarch64': {
+        'audit_arch': 0xc00000b7, 'seccomp': 277,
+        'socket': 198, 'socketpair': 199, 'execve': 221, 'execveat': 281,
+        'ptrace': 117, 'process_vm_readv': 270, 'process_vm_writev': 271, 'io_uring_setup': 425,
+        'clone': 220, 'clone3': 435, 'kill': 129, 'tkill': 130, 'tgkill': 131,
+    },
+}
+# 直接拒绝的系统调用：网络、执行程序、派生进程、读写其他进程内存
+_DENIED_SYSCALLS = ('socket', 'socketpair', 'fork', 'vfork', 'execve', 'execveat', 'ptrace',
+                    'process_vm_readv', 'process_vm_writev', 'io_uring_setup', 'tkill')
+
+_EPERM = 1
+_ENOSYS = 38
+_CLONE_THREAD = 0x00010000
+_SECCOMP_RET_ALLOW = 0x7fff0000
+_SECCOMP_RET_ERRNO = 0x00050000
+_SECCOMP_RET_KILL_PROCESS = 0x80000000
+_BPF_LD_ABS = 0x20
+_BPF_JEQ = 0x15
+_BPF_JGE = 0x35
+_BPF_JSET = 0x45
+_BPF_RET = 0x06
+_PR_SET_NO_NEW_PRIVS = 38
+_SECCOMP_SET_MODE_FILTER = 1
+_SECCOMP_FILTER_FLAG_TSYNC = 1
+
+
+def _bpf(code: int, k: int, jt: int = 0, jf: int = 0) -> bytes:
+    return struct.pack('HBBI', code, jt, jf, k)
+
+
+def _seccomp_program(syscalls: Dict[str, int], pid: int) -> List[bytes]:
+    """
+    构造seccomp过滤程序
+
+    非本架构的调用直接终止进程；clone只允许创建线程（带CLONE_THREAD），clone3返回ENOSYS使glibc退回clone；
+    kill/tgkill只允许发给自身
+    """
+    deny = _bpf(_BPF_RET, _SECCOMP_RET_ERRNO | _EPERM)
+    allow = _bpf(_BPF_RET, _SECCOMP_RET_ALLOW)
+    program = [
+        _bpf(_BPF_LD_ABS, 4),  # seccomp_data.arch
+        _bpf(_BPF_JEQ, syscalls['audit_arch'], jt=1),
+        _bpf(_BPF_RET, _SECCOMP_RET_KILL_PROCESS),
+        _bpf(_BPF_LD_ABS, 0),  # seccomp_data.nr
+    ]
+    if platform.machine() == 'x86_64':
+        # 拒绝x32 ABI的调用号
+        program += [_bpf(_BPF_JGE, 0x40000000, jf=1), _bpf(_BPF_RET, _SECCOMP_RET_KILL_PROCESS)]
+    for name in _DENIED_SYSCALLS:
+        if name in syscalls:
+            program += [_bpf(_BPF_JEQ, syscalls[name], jf=1), deny]
+    program += [_bpf(_BPF_JEQ, syscalls['clone3'], jf=1), _bpf(_BPF_RET, _SECCOMP_RET_ERRNO | _ENOSYS)]
+    # 以下规则读取第一个参数，各分支都直接返回，无需重新加载调用号
+    program += [
+        _bpf(_BPF_JEQ, syscalls['clone'], jf=4),
+        _bpf(_BPF_LD_ABS, 16),  # seccomp_data.args[0]
+        _bpf(_BPF_JSET, _CLONE_THREAD, jf=1),
+        allow, deny,
+    ]
+    program += [
+        _bpf(_BPF_JEQ, syscalls['kill'], jf=5),
+        _bpf(_BPF_LD_ABS, 16),
+        _bpf(_BPF_JEQ, pid, jt=1),
+        _bpf(_BPF_JEQ, 0, jf=1),  # 工作进程独占进程组，kill(0)只作用于自身
+        allow, deny,
+    ]
+    program += [
+        _bpf(_BPF_JEQ, syscalls['tgkill'], jf=4),
+        _bpf(_BPF_LD_ABS, 16),
+        _bpf(_BPF_JEQ, pid, jf=1),
+        allow, deny,
+    ]
+    program.append(allow)
+    return program
+
+
+def _install_seccomp():
+    """对进程内全部线程安装seccomp过滤器，之后无法撤销"""
+    syscalls = _SYSCALLS.get(platform.machine())
+    if not sys.platform.startswith('linux') or syscalls is None:
+        raise SandboxUnavailable(f"沙箱需要Linux x86_64/aarch64，当前为 {sys.platform}/{platform.machine()}")
+
+    class SockFprog(ctypes.Structure):
+        _fields_ = [('len', ctypes.c_ushort), ('filter', ctypes.c_void_p)]
+
+    program = _seccomp_program(syscalls, os.getpid())
+    buffer = ctypes.create_string_buffer(b''.join(program))
+    fprog = SockFprog(len(program), ctypes.cast(buffer, ctypes.c_void_p))
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(_PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) != 0:
+        raise SandboxUnavailable(f"设置no_new_privs失败: {os.strerror(ctypes.get_errno())}")
+    if libc.syscall(syscalls['seccomp'], _SECCOMP_SET_MODE_FILTER, _SECCOMP_FILTER_FLAG_TSYNC,
+                    ctypes.byref(fprog)) != 0:
+        raise SandboxUnavailable(f"安装seccomp过滤器失败: {os.strerror(ctypes.get_errno())}")
+
+
+def _resolve_user(user: str) -> Optional[Tuple[int, int]]:
+    """解析沙箱用户的uid/gid；user为空表示不切换用户（已由容器等外部机制隔离）"""
+    if not user:
+        return None
+    import pwd
+    try:
+        entry = pwd.getpwnam(user)
+    except KeyError:
+        raise SandboxUnavailable(f"沙箱用户不存在: {user}")
+    if os.geteuid() != 0 and os.geteuid() != entry.pw_uid:
+        raise SandboxUnavailable(f"切换到沙箱用户 {user} 需要以root启动后端，或将DATA_ANALYSIS_SANDBOX_USER置空并在容器中运行")
+    return entry.pw_uid, entry.pw_gid
+
+
+def _drop_privileges(uid: int, gid: int):
+    if os.geteuid() == uid:
+        return
+    os.setgroups([])
+    os.setresgid(gid, gid, gid)
+    os.setresuid(uid, uid, uid)
+    if os.getuid() != uid or os.geteuid() != uid:
+        raise SandboxUnavailable("切换沙箱用户失败")
+
+
+def _apply_memory_limit(limits: SandboxLimits):
+    try:
+        import resource
+        limit = limits.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"无法设置沙箱内存限制: {e}")
+
+
+def _arm_cpu_limit(limits: SandboxLimits):
+    """按本进程已用CPU时间加上单次额度设置软限制，超限时进程收到SIGXCPU退出"""
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime) + 1
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + limits.cpu_seconds, hard))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"无法设置沙箱CPU限制: {e}")
+
+
+def _write_frame(fd: int, header: Dict[str, Any], payload: bytes = b''):
+    """帧格式：4字节头部长度 + JSON头部 + 头部中payload_size指定长度的原始数据"""
+    data = json.dumps({**header, 'payload_size': len(payload)}, ensure_ascii=False).encode('utf-8')
+    view = memoryview(struct.pack('>I', len(data)) + data + payload)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _read_exact(fd: int, size: int, deadline: Optional[float]) -> bytes:
+    chunks = []
+    while size:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError
+        chunk = os.read(fd, min(size, 1024 * 1024))
+        if not chunk:
+            raise EOFError
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_frame(fd: int, deadline: Optional[float] = None,
+                max_size: Optional[int] = None) -> Tuple[Dict[str, Any], bytes]:
+    size = struct.unpack('>I', _read_exact(fd, 4, deadline))[0]
+    if max_size is not None and size > max_size:
+        raise ValueError(f"沙箱返回的数据过大: {size}")
+    header = json.loads(_read_exact(fd, size, deadline))
+    payload_size = header.get('payload_size', 0)
+    if max_size is not None and payload_size > max_size:
+        raise ValueError(f"沙箱返回的数据过大: {payload_size}")
+    return header, _read_exact(fd, payload_size, deadline)
+
+
+def _render_value(value: Any, limits: SandboxLimits) -> Optional[str]:
+    """将DataFrame/Series等结果渲染为文本表格"""
+    import pandas as pd
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.head(limits.table_rows).to_string()
+    return None
+
+
+def _execute(code: str, df: Any, limits: SandboxLimits) -> Dict[str, Any]:
+    """在独立命名空间中执行代码，最后一个表达式的值按交互式环境的方式展示"""
+    import numpy as np
+    import pandas as pd
+
+    namespace: Dict[str, Any] = {'__name__': '__sandbox__', 'pd': pd, 'np': np}
+    if df is not None:
+        namespace['df'] = df.copy()
+    preset = set(namespace)
+
+    tree = ast.parse(code, mode='exec')
+    last_expr = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last_expr = ast.Expression(tree.body.pop().value)
+
+    stdout = io.StringIO()
+    tables: List[Dict[str, str]] = []
+    with contextlib.redirect_stdout(stdout):
+        exec(compile(tree, '<sandbox>', 'exec'), namespace)
+        if last_expr is not None:
+            value = eval(compile(last_expr, '<sandbox>', 'eval'), namespace)
+            rendered = _render_value(value, limits)
+            if rendered is not None:
+                tables.append({'name': '结果', 'table': rendered})
+            elif value is not None:
+                print(repr(value))
+
+    for name, value in namespace.items():
+        if name in preset or name.startswith('_') or len(tables) >= limits.max_tables:
+            continue
+        rendered = _render_value(value, limits)
+        if rendered is not None:
+            tables.append({'name': name, 'table': rendered})
+
+    return {'stdout': stdout.getvalue()[:limits.max_output_chars], 'tables': tables}
+
+
+def _confine(user: Optional[Tuple[int, int]], limits: SandboxLimits):
+    """预热后切换到受限用户并安装seccomp过滤器，此后进程无法访问网络、执行程序或派生子进程"""
+    from .profiling import load_dataframe
+
+    _execute(_WARMUP_CODE, load_dataframe(io.BytesIO(b"a,b\n1,x\n"), 'csv'), limits)
+    if user is not None:
+        _drop_privileges(*user)
+    _apply_memory_limit(limits)
+    _install_seccomp()
+
+
+def _worker_main(request_fd: str, response_fd: str, user: str, limits: str):
+    """工作进程主循环：导入依赖、施加限制后等待执行请求"""
+    import pandas  # noqa: F401  预热导入
+    import numpy  # noqa: F401
+    from .profiling import load_dataframe
+
+    request_fd, response_fd = int(request_fd), int(response_fd)
+    limits = SandboxLimits(**json.loads(limits))
+    try:
+        _confine(tuple(json.loads(user)) if user else None, limits)
+    except Exception as e:
+        _write_frame(response_fd, {'ready': False, 'error': str(e)})
+        return
+    _write_frame(response_fd, {'ready': True})
+    datasets: "OrderedDict[str, Any]" = OrderedDict()
+
+    while True:
+        try:
+            request, payload = _read_frame(request_fd)
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request.get('stop'):
+            break
+
+        start_time = time.time()
+        try:
+            df = None
+            if request.get('dataset'):
+                key = request['dataset']
+                if key not in datasets:
+                    # 先淘汰再加载，新数据集不与被淘汰的同时占用内存
+                    while len(datasets) >= max(1, limits.cached_datasets):
+                        datasets.popitem(last=False)
+                    datasets[key] = load_dataframe(io.BytesIO(payload), request['dataset_format'])
+                datasets.move_to_end(key)
+                df = datasets[key]
+            _arm_cpu_limit(limits)
+            output = _execute(request['code'], df, limits)
+            result = {'success': True, **output}
+        except MemoryError:
+            # 内存已接近上限，由进程池替换该进程，后续请求不受残留占用影响
+            datasets.clear()
+            result = {'success': False, 'error': '超出沙箱内存限制', 'recycle': True}
+        except Exception:
+            result = {'success': False, 'error': traceback.format_exc(limit=3)[-limits.max_output_chars:]}
+        result['id'] = request['id']
+        # 告知进程池当前缓存的数据集，未缓存的数据集下次随请求发送
+        result['datasets'] = list(datasets)
+        result['execution_time'] = time.time() - start_time
+        _write_frame(response_fd, result)
+
+
+class _Worker:
+    def __init__(self, process, request_fd: int, response_fd: int):
+        self.process = process
+        self.request_fd = request_fd
+        self.response_fd = response_fd
+        self.ready = False
+        # 该进程已缓存的数据集（以其最近一次回复为准），避免重复传输
+        self.datasets = set()
+
+    def kill(self):
+        for fd in (self.request_fd, self.response_fd):
+            with contextlib.suppress(OSError):
+                os.close(fd)
+        if self.process.poll() is None:
+            self.process.kill()
+        with contextlib.suppress(subprocess.TimeoutExpired):
+            self.process.wait(timeout=1)
+
+
+class SandboxPool:
+    """预热的沙箱工作进程池"""
+
+    def __init__(self, size: int = 2, limits: Optional[SandboxLimits] = None, user: str = 'nobody'):
+        self.size = max(1, size)
+        self.limits = limits or SandboxLimits()
+        self.user = user
+        # 无法施加沙箱限制的原因，非空时拒绝执行
+        self.unavailable: Optional[str] = None
+        self._user_ids: Optional[Tuple[int, int]] = None
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._request_ids = iter(range(1, sys.maxsize))
+
+    def start(self):
+        """启动全部工作进程"""
+        with self._lock:
+            if self._started:
+                return
+            try:
+                self._user_ids = _resolve_user(self.user)
+            except SandboxUnavailable as e:
+                self.unavailable = str(e)
+                logger.error(f"数据分析沙箱不可用: {e}")
+            else:
+                for _ in range(self.size):
+                    self._idle.put(self._spawn())
+            self._started = True
+
+    def _spawn(self) -> _Worker:
+        """以空环境变量启动工作进程，独占进程组，只继承通信管道"""
+        request_read, request_write = os.pipe()
+        response_read, response_write = os.pipe()
+        try:
+            process = subprocess.Popen(
+                [sys.executable, '-I', '-c', _WORKER_BOOT, BACKEND_DIR, str(request_read), str(response_write),
+                 json.dumps(self._user_ids) if self._user_ids else '', json.dumps(dataclasses.asdict(self.limits))],
+                env={}, cwd='/', stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                pass_fds=(request_read, response_write), start_new_session=True
+            )
+        finally:
+            os.close(request_read)
+            os.close(response_write)
+        return _Worker(process, request_write, response_read)
+
+    def _ensure_ready(self, worker: _Worker):
+        """等待工作进程完成预热和限制；平台不支持时记录原因"""
+        if worker.ready:
+            return
+        header, _ = _read_frame(worker.response_fd, time.monotonic() + SPAWN_TIMEOUT, MAX_RESPONSE_BYTES)
+        if not header.get('ready'):
+            self.unavailable = header.get('error') or '沙箱初始化失败'
+            logger.error(f"数据分析沙箱不可用: {self.unavailable}")
+            raise SandboxUnavailable(self.unavailable)
+        worker.ready = True
+
+    def execute(self, code: str, dataset_path: Optional[str] = None,
+                dataset_format: Optional[str] = None) -> SandboxResult:
+        """同步执行代码，超时或进程异常退出时替换工作进程"""
+        self.start()
+        if self.unavailable:
+            return SandboxResult(success=False, error=f"沙箱不可用: {self.unavailable}")
+        worker = self._idle.get()
+        start_time = time.time()
+        healthy = False
+        try:
+            self._ensure_ready(worker)
+            request_id = next(self._request_ids)
+            request = {'id': request_id, 'code': code}
+            payload = b''
+            if dataset_path:
+                request.update(dataset=dataset_path, dataset_format=dataset_format)
+                if dataset_path not in worker.datasets:
+                    # 工作进程无法读取数据目录，数据集内容随请求发送
+                    with open(dataset_path, 'rb') as f:
+                        payload = f.read()
+            _write_frame(worker.request_fd, request, payload)
+            result, _ = _read_frame(worker.response_fd, time.monotonic() + self.limits.wall_seconds,
+                                    MAX_RESPONSE_BYTES)
+            if result.get('id') != request_id:
+                raise ValueError("沙箱返回了不匹配的结果")
+            worker.datasets = set(result.get('datasets', []))
+            healthy = not result.get('recycle')
+            return SandboxResult(
+                success=bool(result.get('success')),
+                stdout=str(result.get('stdout', '')),
+                tables=list(result.get('tables', [])),
+                error=result.get('error'),
+                execution_time=float(result.get('execution_time', time.time() - start_time))
+            )
+        except SandboxUnavailable as e:
+            return SandboxResult(success=False, error=f"沙箱不可用: {e}")
+        except TimeoutError:
+            return SandboxResult(success=False, error=f"执行超时（{self.limits.wall_seconds}秒）",
+                                 execution_time=time.time() - start_time)
+        except (EOFError, OSError, ValueError, KeyError, TypeError, struct.error):
+            return SandboxResult(success=False, error="沙箱进程异常退出（可能超出CPU或内存限制）",
+                                 execution_time=time.time() - start_time)
+        finally:
+            if healthy:
+                self._idle.put(worker)
+            else:
+                worker.kill()
+                if not self.unavailable:
+                    self._idle.put(self._spawn())
+
+    async def run(self, code: str, dataset_path: Optional[str] = None,
+                  dataset_format: Optional[str] = None) -> SandboxResult:
+        """在线程中执行，避免阻塞事件循环"""
+        return await asyncio.to_thread(self.execute, code, dataset_path, dataset_format)
+
+    def shutdown(self):
+        """关闭全部工作进程"""
+        with self._lock:
+            while not self._idle.empty():
+                worker = self._idle.get_nowait()
+                with contextlib.suppress(Exception):
+                    _write_frame(worker.request_fd, {'stop': True})
+                worker.kill()
+            self._started = False
+
+
+# 全局沙箱进程池
+_sandbox_pool: Optional[SandboxPool] = None
+_sandbox_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """获取全局沙箱进程池"""
+    global _sandbox_pool
+    with _sandbox_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = SandboxPool(
+                size=int(os.getenv('DATA_ANALYSIS_SANDBOX_WORKERS', '2')),
+                limits=SandboxLimits(
+                    cpu_seconds=int(os.getenv('DATA_ANALYSIS_SANDBOX_CPU_SECONDS', '10')),
+                    memory_mb=int(os.getenv('DATA_ANALYSIS_SANDBOX_MEMORY_MB', '2048')),
+                    wall_seconds=float(os.getenv('DATA_ANALYSIS_SANDBOX_WALL_SECONDS', '15')),
+                    cached_datasets=int(os.getenv('DATA_ANALYSIS_SANDBOX_CACHED_DATASETS', '4'))
+                ),
+                user=os.getenv('DATA_ANALYSIS_SANDBOX_USER', 'nobody')
+            )
+        return _sandbox_pool
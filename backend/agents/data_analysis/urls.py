@@ -1,5 +1,7 @@
 from django.urls import path
+from .views import DatasetUploadView, DatasetProfileView
 
 urlpatterns = [
-    # data_analysis specific endpoints can be added here
+    path('datasets/', DatasetUploadView.as_view(), name='data_analysis_dataset_upload'),
+    path('datasets/<str:dataset_id>/', DatasetProfileView.as_view(), name='data_analysis_dataset_profile'),
 ]
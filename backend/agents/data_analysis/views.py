@@ -0,0 +1,59 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from .datasets import get_dataset_store
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class DatasetUploadView(APIView):
+    permission_classes = [AllowAny]
+    
+    def post(self, request):
+        """上传CSV/Excel/Parquet数据集，返回数据集ID和画像"""
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if upload.size > settings.DATASET_MAX_UPLOAD_MB * 1024 * 1024:
+            return Response(
+                {'error': f'File exceeds {settings.DATASET_MAX_UPLOAD_MB}MB limit'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        store = get_dataset_store()
+        try:
+            dataset_id = store.save(upload.read(), upload.name)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            profile = store.get_profile(dataset_id)
+        except ImportError as e:
+            store.discard(dataset_id)
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            # 无法解析的文件不保留在磁盘上
+            store.discard(dataset_id)
+            return Response({'error': f'Failed to parse dataset: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'dataset_id': dataset_id,
+            'filename': upload.name,
+            'profile': profile
+        })
+
+
+class DatasetProfileView(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request, dataset_id):
+        """获取数据集画像"""
+        try:
+            profile = get_dataset_store().get_profile(dataset_id)
+        except KeyError:
+            return Response({'error': 'Dataset not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(profile)
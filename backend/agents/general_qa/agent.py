@@ -1,9 +1,10 @@
 from agents.core.base import BaseAgent, AgentType, AgentMessage, AgentResponse
-from agents.core.llm_manager import get_llm
-from langchain.schema import HumanMessage, SystemMessage
-from langgraph.graph import StateGraph, END
+from agents.core.cache import cached_process
+from agents.core.streaming import DeltaBuffer, current_delta_sink, with_delta_sink
 from typing import List, Dict, Any, TypedDict
+import os
 import time
+from .speculation import SpeculationBudget, parse_route_decision, run_speculatively, score_intent
 
 
 class ConversationState(TypedDict):
@@ -14,6 +15,7 @@ class ConversationState(TypedDict):
     needs_specialist: bool
     specialist_type: str
     user_intent: str
+    routing_confidence: float
 
 
 class GeneralQAAgent(BaseAgent):
@@ -23,13 +25,27 @@ class GeneralQAAgent(BaseAgent):
             name="通用问答助手",
             description="基于LangGraph的智能通用问答助手，支持复杂对话流程和专业智能体路由"
         )
-        # 使用核心的统一LLM管理器
-        self.llm = get_llm()
         self.specialist_agents = {}
-        self.graph = self._build_graph()
+        self._graph = None
+        # 路由置信度低于该值且推测预算允许时，确认路由的同时推测执行通用回答和专业智能体
+        self.speculation_threshold = float(os.getenv('GENERAL_QA_SPECULATION_THRESHOLD', '0.7'))
+        # 每分钟最多推测执行的次数，0表示关闭推测执行
+        self.speculation_budget = SpeculationBudget(int(os.getenv('GENERAL_QA_SPECULATION_PER_MINUTE', '30')))
+
+    @property
+    def graph(self):
+        """对话流程图在首次使用时构建，避免启动时导入LangGraph"""
+        if self._graph is None:
+            self._graph = self._build_graph()
+        return self._graph
+
+    def warm_up(self):
+        self.graph
 
     def _build_graph(self):
         """构建对话流程图"""
+        from langgraph.graph import StateGraph, END
+
         workflow = StateGraph(ConversationState)
         
         # 添加节点
@@ -73,18 +89,25 @@ class GeneralQAAgent(BaseAgent):
         specialist_type = ""
         
         content_lower = latest_message.lower()
-        for keyword, agent_type in specialist_keywords.items():
-            if keyword in content_lower:
-                needs_specialist = True
-                specialist_type = agent_type.value
-                break
+        hits = [agent_type for keyword, agent_type in specialist_keywords.items() if keyword in content_lower]
+        if hits:
+            needs_specialist = True
+            specialist_type = hits[0].value
         
         state["needs_specialist"] = needs_specialist
         state["specialist_type"] = specialist_type
         state["user_intent"] = latest_message
+        state["routing_confidence"] = score_intent(latest_message, len(set(hits)))
         
         return state
     
+    def cache_analysis(self, message: AgentMessage) -> Dict[str, Any]:
+        """路由决策参与缓存键：同一消息路由到不同智能体时不共用缓存"""
+        state = self._analyze_intent({"messages": [{"role": "user", "content": message.content}]})
+        return {
+            "specialist_type": state["specialist_type"] if self._should_route_specialist(state) else ""
+        }
+
     def _should_route_specialist(self, state: ConversationState) -> bool:
         """判断是否需要路由到专业智能体"""
         return state["needs_specialist"] and state["specialist_type"] in [agent.value for agent in self.specialist_agents.keys()]
@@ -107,6 +130,7 @@ class GeneralQAAgent(BaseAgent):
     def register_specialist_agent(self, agent_type: AgentType, agent: BaseAgent):
         self.specialist_agents[agent_type] = agent
 
+    @cached_process
     async def process(self, message: AgentMessage) -> AgentResponse:
         start_time = time.time()
         
@@ -138,12 +162,82 @@ class GeneralQAAgent(BaseAgent):
                 # 需要专业智能体处理
                 specialist_type = AgentType(result["specialist_type"])
                 if specialist_type in self.specialist_agents:
-                    specialist_agent = self.specialist_agents[specialist_type]
-                    return await specialist_agent.process(message)
+                    if result["routing_confidence"] >= self.speculation_threshold:
+                        return await self.specialist_agents[specialist_type].process(message)
+                    return await self._resolve_uncertain_route(
+                        message, specialist_type, result["routing_confidence"], start_time
+                    )
                 else:
                     content = f"您的请求需要{result['specialist_type']}专业智能体处理，但该智能体尚未注册。我将为您提供通用回答。"
-            
-            # 通用问答处理
+
+            return await self._answer_general(message, start_time)
+
+        except Exception as e:
+            return AgentResponse(
+                success=False,
+                content=f"处理请求时发生错误: {str(e)}",
+                agent_type=self.agent_type,
+                execution_time=time.time() - start_time,
+                error=str(e)
+            )
+
+    async def _resolve_uncertain_route(self, message: AgentMessage, specialist_type: AgentType,
+                                       confidence: float, start_time: float) -> AgentResponse:
+        """
+        意图不明确时由模型确认是否交给专业智能体
+
+        预算允许时确认路由的同时启动通用回答和专业智能体，确认后保留选中的一方并取消另一方，
+        耗时取两者中较长者而非先后之和；预算耗尽时不再确认，与改造前一样按关键词直接交给专业智能体，
+        避免在回答之前串行多一次模型调用
+        """
+        specialist = self.specialist_agents[specialist_type]
+        speculative = self.speculation_budget.try_acquire()
+        if speculative:
+            decision = self._confirm_specialist_route(message.content, specialist)
+            general = lambda: self._answer_general(message, start_time)
+            special = lambda: specialist.process(message)
+            on_decision = None
+            parent_sink = current_delta_sink()
+            if parent_sink is not None:
+                # 流式请求中两方的输出先各自暂存，路由确认后只转发选中的一方
+                general_buffer, specialist_buffer = DeltaBuffer(), DeltaBuffer()
+                general = lambda: with_delta_sink(general_buffer.push, self._answer_general(message, start_time))
+                special = lambda: with_delta_sink(specialist_buffer.push, specialist.process(message))
+                on_decision = lambda chosen: (specialist_buffer if chosen else general_buffer).attach(parent_sink)
+            use_specialist, response = await run_speculatively(decision, general, special, on_decision)
+            self.speculation_budget.record(use_specialist)
+        else:
+            use_specialist = True
+            response = await specialist.process(message)
+
+        response.metadata = {
+            **(response.metadata or {}),
+            "routing": {
+                "specialist_type": specialist_type.value,
+                "confidence": confidence,
+                "decision": specialist_type.value if use_specialist else self.agent_type.value,
+                "speculative": speculative
+            }
+        }
+        return response
+
+    async def _confirm_specialist_route(self, content: str, specialist: BaseAgent) -> bool:
+        """请模型判断请求是否需要专业智能体生成完整产出，无法判断时按关键词路由"""
+        prompt = (
+            f"用户请求：{content}\n\n"
+            f"请判断该请求是否需要交给「{specialist.name}」（{specialist.description}）处理："
+            "需要其生成完整的文稿、代码或分析结果时回答“是”，只是咨询相关概念或知识时回答“否”。只回答是或否。"
+        )
+        try:
+            response = await self.llm.ainvoke(self._build_messages("你是请求路由助手。", prompt))
+            decision = parse_route_decision(response.content)
+        except Exception:
+            decision = None
+        return True if decision is None else decision
+
+    async def _answer_general(self, message: AgentMessage, start_time: float) -> AgentResponse:
+        """通用问答处理"""
+        try:
             system_prompt = """你是一个专业的通用问答助手。你可以：
 1. 回答各种通用知识问题
 2. 提供建议和指导
@@ -152,12 +246,9 @@ class GeneralQAAgent(BaseAgent):
 
 请用中文回答，保持专业和友好的语调。"""
 
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=message.content)
-            ]
+            messages = self._build_messages(system_prompt, message.content, message.history)
 
-            response = await self.llm.ainvoke(messages)
+            response = await self._generate(messages)
             
             return AgentResponse(
                 success=True,
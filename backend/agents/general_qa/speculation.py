@@ -0,0 +1,118 @@
+"""
+推测执行
+意图不明确时同时启动通用回答和候选专业智能体，路由确认后保留选中的结果并取消另一个。
+推测执行会多消耗一次模型调用，由预算限制其频率
+"""
+
+import asyncio
+import re
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+# 表示需要生成完整文稿/代码等产出的动作词
+ACTION_PATTERN = re.compile(r'写|撰写|起草|生成|拟|草拟|帮我|给我|做一份|出一份|整理|修改|润色|审查|调试|重构|实现|分析一下')
+# 表示只是咨询相关知识的提问方式
+QUESTION_PATTERN = re.compile(r'什么是|是什么|什么叫|如何|怎么|怎样|为什么|有哪些|区别|吗[？?]?$|[？?]$')
+
+
+def score_intent(content: str, keyword_hits: int) -> float:
+    """
+    估计命中关键词时路由到专业智能体的置信度（0-1）
+
+    有明确的写作/处理动作时置信度高；以提问方式提及关键词，或同时命中多个专业领域时置信度低
+    """
+    if keyword_hits == 0:
+        return 0.0
+    confidence = 0.5
+    if ACTION_PATTERN.search(content):
+        confidence += 0.4
+    if QUESTION_PATTERN.search(content.strip()):
+        confidence -= 0.3
+    if keyword_hits > 1:
+        confidence -= 0.2
+    return min(max(confidence, 0.0), 1.0)
+
+
+def parse_route_decision(answer: str) -> Optional[bool]:
+    """解析路由确认的回答，无法判断时返回None"""
+    answer = answer.strip()
+    if answer.startswith('是'):
+        return True
+    if answer.startswith('否'):
+        return False
+    return None
+
+
+class SpeculationBudget:
+    """
+    推测执行预算：令牌桶，每分钟最多推测执行per_minute次
+
+    预算耗尽时不确认路由，按关键词直接交给专业智能体
+    """
+
+    def __init__(self, per_minute: int):
+        self.per_minute = max(per_minute, 0)
+        self._tokens = float(self.per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.speculated = 0
+        self.declined = 0
+        self.specialist_chosen = 0
+        self.general_chosen = 0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.per_minute <= 0:
+                self.declined += 1
+                return False
+            now = time.monotonic()
+            self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * self.per_minute / 60)
+            self._updated = now
+            if self._tokens < 1:
+                self.declined += 1
+                return False
+            self._tokens -= 1
+            self.speculated += 1
+            return True
+
+    def record(self, use_specialist: bool):
+        with self._lock:
+            if use_specialist:
+                self.specialist_chosen += 1
+            else:
+                self.general_chosen += 1
+
+    def stats(self) -> dict:
+        return {
+            'per_minute': self.per_minute,
+            'speculated': self.speculated,
+            'declined': self.declined,
+            'specialist_chosen': self.specialist_chosen,
+            'general_chosen': self.general_chosen
+        }
+
+
+async def run_speculatively(decision, general_factory, specialist_factory,
+                            on_decision: Optional[Callable[[bool], None]] = None) -> Tuple[bool, object]:
+    """
+    同时启动路由确认、通用回答和专业智能体，路由确认后取消未选中的一方
+
+    返回（是否选中专业智能体，选中一方的结果）；on_decision在路由确认后、等待选中一方之前调用。
+    调用被取消时所有任务一并取消
+    """
+    decision_task = asyncio.ensure_future(decision)
+    general_task = asyncio.ensure_future(general_factory())
+    specialist_task = asyncio.ensure_future(specialist_factory())
+    tasks = (decision_task, general_task, specialist_task)
+    try:
+        use_specialist = await decision_task
+        chosen, discarded = (specialist_task, general_task) if use_specialist else (general_task, specialist_task)
+        discarded.cancel()
+        if on_decision is not None:
+            on_decision(use_specialist)
+        return use_specialist, await chosen
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -6,13 +6,12 @@ import json
 import asyncio
 from asgiref.sync import sync_to_async
 from agents.core.base import AgentMessage, AgentType
-from .agent import GeneralQAAgent
+from agents.core.pool import AgentEndpointMixin, get_agent_pool
 
 
-class GeneralQAView(View):
-    def __init__(self):
-        super().__init__()
-        self.agent = GeneralQAAgent()
+class GeneralQAView(AgentEndpointMixin, View):
+    # 使用智能体管理器中共享的通用问答智能体，不在每个请求中创建
+    agent_type = AgentType.GENERAL_QA
 
     @method_decorator(csrf_exempt)
     def dispatch(self, *args, **kwargs):
@@ -51,12 +50,7 @@ class GeneralQAView(View):
 
     async def get(self, request):
         """获取智能体信息"""
-        return JsonResponse({
-            'agent_type': 'general_qa',
-            'name': '通用问答助手',
-            'description': '基于LangGraph的智能通用问答助手',
-            'capabilities': self.agent.get_capabilities()
-        })
+        return JsonResponse(get_agent_pool().describe(self.agent_type))
 
 
 @sync_to_async
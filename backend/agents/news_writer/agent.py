@@ -1,6 +1,5 @@
 from agents.core.base import BaseAgent, AgentType, AgentMessage, AgentResponse
-from agents.core.llm_manager import get_llm
-from langchain.schema import HumanMessage, SystemMessage
+from agents.core.cache import cached_process
 from typing import List, Dict
 import time
 import re
@@ -14,9 +13,6 @@ class NewsWriterAgent(BaseAgent):
             name="新闻稿智能体",
             description="专业的新闻稿撰写助手，支持各类新闻稿件的创作"
         )
-        # 使用统一的LLM管理器
-        self.llm = get_llm()
-        
         # 新闻稿类型模板
         self.news_types = {
             "企业新闻": {
@@ -45,6 +41,7 @@ class NewsWriterAgent(BaseAgent):
             }
         }
 
+    @cached_process
     async def process(self, message: AgentMessage) -> AgentResponse:
         start_time = time.time()
         
@@ -64,12 +61,9 @@ class NewsWriterAgent(BaseAgent):
             # 构建专业的系统提示
             system_prompt = self._build_system_prompt(news_info)
             
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=message.content)
-            ]
+            messages = self._build_messages(system_prompt, message.content, message.history)
 
-            response = await self.llm.ainvoke(messages)
+            response = await self._generate(messages)
             
             # 后处理：格式化新闻稿输出
             formatted_content = self._format_news_output(response.content, news_info)
@@ -96,6 +90,9 @@ class NewsWriterAgent(BaseAgent):
                 error=str(e)
             )
 
+    def cache_analysis(self, message: AgentMessage) -> Dict:
+        return self._analyze_news_requirements(message.content)
+
     def _analyze_news_requirements(self, content: str) -> Dict:
         """分析新闻稿需求"""
         content_lower = content.lower()
@@ -1,6 +1,5 @@
 from agents.core.base import BaseAgent, AgentType, AgentMessage, AgentResponse
-from agents.core.llm_manager import get_llm
-from langchain.schema import HumanMessage, SystemMessage
+from agents.core.cache import cached_process
 from typing import List, Dict
 import time
 import re
@@ -14,9 +13,6 @@ class OfficialDocumentAgent(BaseAgent):
             name="智能公文智能体",
             description="专业的公文撰写助手，支持各类公文格式的标准化创作"
         )
-        # 使用统一的LLM管理器
-        self.llm = get_llm()
-        
         # 公文类型模板库
         self.document_types = {
             "通知": {
@@ -68,6 +64,7 @@ class OfficialDocumentAgent(BaseAgent):
             "普通": ["常规", "一般", "按时"]
         }
 
+    @cached_process
     async def process(self, message: AgentMessage) -> AgentResponse:
         start_time = time.time()
         
@@ -87,12 +84,9 @@ class OfficialDocumentAgent(BaseAgent):
             # 构建专业的系统提示
             system_prompt = self._build_system_prompt(doc_info)
             
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=message.content)
-            ]
+            messages = self._build_messages(system_prompt, message.content, message.history)
 
-            response = await self.llm.ainvoke(messages)
+            response = await self._generate(messages)
             
             # 后处理：格式化公文输出
             formatted_content = self._format_document_output(response.content, doc_info)
@@ -119,6 +113,9 @@ class OfficialDocumentAgent(BaseAgent):
                 error=str(e)
             )
 
+    def cache_analysis(self, message: AgentMessage) -> Dict:
+        return self._analyze_document_requirements(message.content)
+
     def _analyze_document_requirements(self, content: str) -> Dict:
         """分析公文撰写需求"""
         content_lower = content.lower()
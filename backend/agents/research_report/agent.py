@@ -1,11 +1,16 @@
 from agents.core.base import BaseAgent, AgentType, AgentMessage, AgentResponse
-from agents.core.llm_manager import get_llm
-from langchain.schema import HumanMessage, SystemMessage
+from agents.core.cache import cached_process
+from agents.core.concurrency import gather_bounded
+from agents.core.checkpoints import open_checkpoint, SectionCheckpointer
 from typing import List, Dict
+import os
 import time
 import re
 from datetime import datetime
 
+# 由摘要轮生成、需在正文章节完成后再撰写的章节
+SUMMARY_SECTIONS = ("执行摘要", "投资要点")
+
 
 class ResearchReportAgent(BaseAgent):
     def __init__(self):
@@ -14,9 +19,6 @@ class ResearchReportAgent(BaseAgent):
             name="智能研报智能体",
             description="专业的研究报告撰写助手，支持各类研究报告的深度分析和撰写"
         )
-        # 使用统一的LLM管理器
-        self.llm = get_llm()
-        
         # 研报类型模板库
         self.report_types = {
             "市场调研报告": {
@@ -57,7 +59,13 @@ class ResearchReportAgent(BaseAgent):
             "标准": ["标准", "常规", "一般", "基础"],
             "深度": ["深度", "详细", "全面", "深入", "完整"]
         }
+        
+        # 生成模式：sectioned 为先定大纲再并行扩写章节，single 为单次整篇生成
+        self.generation_mode = os.getenv('RESEARCH_REPORT_GENERATION_MODE', 'sectioned')
+        # 章节并行生成的并发上限
+        self.section_concurrency = int(os.getenv('RESEARCH_REPORT_SECTION_CONCURRENCY', '4'))
 
+    @cached_process
     async def process(self, message: AgentMessage) -> AgentResponse:
         start_time = time.time()
         
@@ -70,22 +78,30 @@ class ResearchReportAgent(BaseAgent):
                 error="Invalid input"
             )
 
+        checkpointer = None
         try:
             # 分析研报需求
             report_info = self._analyze_research_requirements(message.content)
+            generation_mode = self._resolve_generation_mode(message, report_info)
             
-            # 构建专业的系统提示
-            system_prompt = self._build_system_prompt(report_info)
-            
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=message.content)
-            ]
+            if generation_mode == "sectioned":
+                # 先定大纲，再并行扩写各章节，已完成章节写入检查点
+                checkpointer = await open_checkpoint(message, self.agent_type)
+                raw_content = await self._generate_sectioned_report(
+                    message.content, report_info, checkpointer, message.history
+                )
+                await checkpointer.complete()
+            else:
+                # 构建专业的系统提示
+                system_prompt = self._build_system_prompt(report_info)
+                
+                messages = self._build_messages(system_prompt, message.content, message.history)
 
-            response = await self.llm.ainvoke(messages)
+                response = await self._generate(messages)
+                raw_content = response.content
             
             # 后处理：格式化研报输出
-            formatted_content = self._format_research_output(response.content, report_info)
+            formatted_content = self._format_research_output(raw_content, report_info)
             
             return AgentResponse(
                 success=True,
@@ -96,19 +112,27 @@ class ResearchReportAgent(BaseAgent):
                     "report_type": report_info.get("type", "通用研究报告"),
                     "research_depth": report_info.get("depth", "标准"),
                     "estimated_pages": self._estimate_pages(formatted_content),
-                    "methodology": report_info.get("methodology", "综合分析")
+                    "methodology": report_info.get("methodology", "综合分析"),
+                    "generation_mode": generation_mode,
+                    "generation": checkpointer.progress() if checkpointer else None
                 }
             )
 
         except Exception as e:
+            if checkpointer:
+                await checkpointer.fail(str(e))
             return AgentResponse(
                 success=False,
                 content=f"生成研究报告时发生错误: {str(e)}",
                 agent_type=self.agent_type,
                 execution_time=time.time() - start_time,
+                metadata={"generation": checkpointer.progress()} if checkpointer else None,
                 error=str(e)
             )
 
+    def cache_analysis(self, message: AgentMessage) -> Dict:
+        return self._analyze_research_requirements(message.content)
+
     def _analyze_research_requirements(self, content: str) -> Dict:
         """分析研究报告需求"""
         content_lower = content.lower()
@@ -225,6 +249,102 @@ class ResearchReportAgent(BaseAgent):
         
         return base_prompt
 
+    def _resolve_generation_mode(self, message: AgentMessage, report_info: Dict) -> str:
+        """确定生成模式，没有章节结构的报告只能整篇生成"""
+        mode = (message.metadata or {}).get("generation_mode", self.generation_mode)
+        if mode == "sectioned" and report_info.get("structure"):
+            return "sectioned"
+        return "single"
+
+    def _split_sections(self, structure: List[str]) -> tuple:
+        """拆分摘要章节与正文章节"""
+        if structure and structure[0] in SUMMARY_SECTIONS:
+            return structure[0], structure[1:]
+        return SUMMARY_SECTIONS[0], list(structure)
+
+    async def _generate_sectioned_report(self, content: str, report_info: Dict,
+                                         checkpointer: SectionCheckpointer, history=None) -> str:
+        """大纲-扩写模式：一次短调用确定大纲，正文章节有界并行生成，摘要最后生成"""
+        summary_title, body_sections = self._split_sections(report_info.get("structure", []))
+        system_prompt = self._build_system_prompt(report_info)
+        await checkpointer.plan(["大纲"] + body_sections + [summary_title])
+        
+        outline = await checkpointer.step(
+            "大纲", lambda: self._generate_outline(system_prompt, content, body_sections, history)
+        )
+        
+        # 单个章节失败时其余章节继续完成并写入检查点，重试时只需补齐失败章节
+        section_bodies = await gather_bounded(
+            [
+                (lambda section=section: checkpointer.step(
+                    section, lambda: self._generate_section(system_prompt, content, outline, section)
+                ))
+                for section in body_sections
+            ],
+            self.section_concurrency,
+            return_exceptions=True
+        )
+        errors = [body for body in section_bodies if isinstance(body, Exception)]
+        if errors:
+            raise errors[0]
+        sections = list(zip(body_sections, section_bodies))
+        
+        summary = await checkpointer.step(
+            summary_title, lambda: self._generate_summary(system_prompt, content, summary_title, sections)
+        )
+        
+        return self._stitch_sections(report_info, [(summary_title, summary)] + sections)
+
+    async def _generate_outline(self, system_prompt: str, content: str, sections: List[str],
+                                history=None) -> str:
+        """生成报告大纲与关键事实，作为各章节共享的上下文"""
+        outline_prompt = (
+            f"用户需求：{content}\n\n"
+            f"报告正文章节：{' -> '.join(sections)}\n\n"
+            "请先给出简明的报告大纲：为每个章节列出2-3个核心要点，"
+            "并统一列出全文共用的关键事实、数据口径和核心结论。"
+            "只输出大纲，控制在500字以内，不要展开正文。"
+        )
+        # 提纲决定全文走向，带上对话历史；各部分依据提纲扩写
+        response = await self.llm.ainvoke(self._build_messages(system_prompt, outline_prompt, history))
+        return response.content.strip()
+
+    async def _generate_section(self, system_prompt: str, content: str, outline: str, section: str) -> str:
+        """依据共享大纲撰写单个章节正文"""
+        section_prompt = (
+            f"用户需求：{content}\n\n"
+            f"报告大纲与关键事实：\n{outline}\n\n"
+            f"请只撰写「{section}」章节的正文，与大纲中的关键事实和数据口径保持一致，"
+            "不要重复其他章节的内容，不要输出章节标题。"
+        )
+        response = await self.llm.ainvoke(self._build_messages(system_prompt, section_prompt))
+        return response.content.strip()
+
+    async def _generate_summary(self, system_prompt: str, content: str, summary_title: str, sections: List[tuple]) -> str:
+        """在正文章节完成后撰写摘要"""
+        digest = "\n\n".join(f"【{title}】\n{body[:800]}" for title, body in sections)
+        summary_prompt = (
+            f"用户需求：{content}\n\n"
+            f"以下是报告各章节内容：\n{digest}\n\n"
+            f"请据此撰写「{summary_title}」，提炼核心观点和关键结论，控制在300字以内，不要输出章节标题。"
+        )
+        response = await self.llm.ainvoke(self._build_messages(system_prompt, summary_prompt))
+        return response.content.strip()
+
+    def _stitch_sections(self, report_info: Dict, sections: List[tuple]) -> str:
+        """按章节顺序拼接报告"""
+        industry = report_info.get("industry", "通用行业")
+        report_type = report_info.get("type", "研究报告")
+        title = f"{industry}{report_type}" if industry != "通用行业" else report_type
+        
+        parts = [title, ""]
+        for section_title, body in sections:
+            parts.append(f"## {section_title}")
+            parts.append("")
+            parts.append(body)
+            parts.append("")
+        return "\n".join(parts)
+
     def _format_research_output(self, content: str, report_info: Dict) -> str:
         """格式化研究报告输出"""
         lines = content.split('\n')
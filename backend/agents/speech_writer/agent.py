@@ -1,7 +1,9 @@
 from agents.core.base import BaseAgent, AgentType, AgentMessage, AgentResponse
-from agents.core.llm_manager import get_llm
-from langchain.schema import HumanMessage, SystemMessage
+from agents.core.cache import cached_process
+from agents.core.concurrency import gather_bounded
+from agents.core.checkpoints import open_checkpoint, SectionCheckpointer
 from typing import List, Dict
+import os
 import time
 import re
 
@@ -13,9 +15,6 @@ class SpeechWriterAgent(BaseAgent):
             name="发言稿智能体",
             description="专业的发言稿撰写助手，支持各类正式场合的发言稿创作"
         )
-        # 使用统一的LLM管理器
-        self.llm = get_llm()
-        
         # 发言稿模板库
         self.templates = {
             "会议致辞": {
@@ -99,7 +98,15 @@ class SpeechWriterAgent(BaseAgent):
                 "tone": "专业、兴奋"
             }
         }
+        
+        # 生成模式：auto 为长篇发言稿按结构分段生成，sectioned 总是分段，single 总是整篇生成
+        self.generation_mode = os.getenv('SPEECH_WRITER_GENERATION_MODE', 'auto')
+        # auto 模式下启用分段生成的最短时长（分钟）
+        self.sectioned_min_duration = int(os.getenv('SPEECH_WRITER_SECTIONED_MIN_DURATION', '10'))
+        # 分段并行生成的并发上限
+        self.section_concurrency = int(os.getenv('SPEECH_WRITER_SECTION_CONCURRENCY', '4'))
 
+    @cached_process
     async def process(self, message: AgentMessage) -> AgentResponse:
         start_time = time.time()
         
@@ -112,22 +119,30 @@ class SpeechWriterAgent(BaseAgent):
                 error="Invalid input"
             )
 
+        checkpointer = None
         try:
             # 分析用户需求
             speech_info = self._analyze_speech_requirements(message.content)
+            generation_mode = self._resolve_generation_mode(message, speech_info)
             
-            # 构建专业的系统提示
-            system_prompt = self._build_system_prompt(speech_info)
-            
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=message.content)
-            ]
+            if generation_mode == "sectioned":
+                # 长篇发言稿按结构分段生成，已完成段落写入检查点
+                checkpointer = await open_checkpoint(message, self.agent_type)
+                raw_content = await self._generate_sectioned_speech(
+                    message.content, speech_info, checkpointer, message.history
+                )
+                await checkpointer.complete()
+            else:
+                # 构建专业的系统提示
+                system_prompt = self._build_system_prompt(speech_info)
+                
+                messages = self._build_messages(system_prompt, message.content, message.history)
 
-            response = await self.llm.ainvoke(messages)
+                response = await self._generate(messages)
+                raw_content = response.content
             
             # 后处理：格式化输出
-            formatted_content = self._format_speech_output(response.content)
+            formatted_content = self._format_speech_output(raw_content)
             
             return AgentResponse(
                 success=True,
@@ -137,19 +152,99 @@ class SpeechWriterAgent(BaseAgent):
                 metadata={
                     "speech_type": speech_info.get("type", "通用发言稿"),
                     "estimated_duration": self._estimate_speech_duration(formatted_content),
-                    "structure": speech_info.get("structure", [])
+                    "structure": speech_info.get("structure", []),
+                    "generation_mode": generation_mode,
+                    "generation": checkpointer.progress() if checkpointer else None
                 }
             )
 
         except Exception as e:
+            if checkpointer:
+                await checkpointer.fail(str(e))
             return AgentResponse(
                 success=False,
                 content=f"生成发言稿时发生错误: {str(e)}",
                 agent_type=self.agent_type,
                 execution_time=time.time() - start_time,
+                metadata={"generation": checkpointer.progress()} if checkpointer else None,
                 error=str(e)
             )
 
+    def _resolve_generation_mode(self, message: AgentMessage, speech_info: Dict) -> str:
+        """确定生成模式，没有结构模板的发言稿只能整篇生成"""
+        mode = (message.metadata or {}).get("generation_mode", self.generation_mode)
+        if not speech_info.get("structure"):
+            return "single"
+        if mode == "sectioned":
+            return "sectioned"
+        if mode == "auto" and speech_info.get("duration", 0) >= self.sectioned_min_duration:
+            return "sectioned"
+        return "single"
+
+    async def _generate_sectioned_speech(self, content: str, speech_info: Dict,
+                                         checkpointer: SectionCheckpointer, history=None) -> str:
+        """先定提纲，再按结构有界并行生成各部分，按顺序拼接"""
+        structure = speech_info["structure"]
+        system_prompt = self._build_system_prompt(speech_info)
+        await checkpointer.plan(["提纲"] + structure)
+        
+        outline = await checkpointer.step(
+            "提纲", lambda: self._generate_outline(system_prompt, content, structure, history)
+        )
+        
+        # 按总时长平均分配每部分字数
+        section_words = max(100, speech_info.get("duration", 5) * 225 // len(structure))
+        bodies = await gather_bounded(
+            [
+                (lambda index=index, section=section: checkpointer.step(
+                    section,
+                    lambda: self._generate_section(system_prompt, content, outline, structure, index, section_words)
+                ))
+                for index, section in enumerate(structure)
+            ],
+            self.section_concurrency,
+            return_exceptions=True
+        )
+        errors = [body for body in bodies if isinstance(body, Exception)]
+        if errors:
+            raise errors[0]
+        
+        return "\n\n".join([speech_info.get("type", "发言稿")] + list(bodies))
+
+    async def _generate_outline(self, system_prompt: str, content: str, structure: List[str],
+                                history=None) -> str:
+        """生成发言提纲，作为各部分共享的上下文"""
+        outline_prompt = (
+            f"用户需求：{content}\n\n"
+            f"发言稿结构：{' -> '.join(structure)}\n\n"
+            "请先给出简明的发言提纲：为每个部分列出核心观点和需要提及的关键事实、数字与人名，"
+            "只输出提纲，控制在400字以内。"
+        )
+        # 提纲决定全文走向，带上对话历史；各部分依据提纲扩写
+        response = await self.llm.ainvoke(self._build_messages(system_prompt, outline_prompt, history))
+        return response.content.strip()
+
+    async def _generate_section(self, system_prompt: str, content: str, outline: str,
+                                structure: List[str], index: int, words: int) -> str:
+        """依据提纲撰写发言稿的一个部分"""
+        if index == 0:
+            position = "这是发言稿的开头部分，需要以合适的称呼和问候开场。"
+        elif index == len(structure) - 1:
+            position = "这是发言稿的结尾部分，需要总结全文并自然收尾。"
+        else:
+            position = f"这是发言稿的中间部分，前一部分是「{structure[index - 1]}」，需要自然衔接。"
+        section_prompt = (
+            f"用户需求：{content}\n\n"
+            f"发言提纲：\n{outline}\n\n"
+            f"请只撰写「{structure[index]}」部分，约{words}字。{position}"
+            "不要输出小标题，不要重复其他部分的内容。"
+        )
+        response = await self.llm.ainvoke(self._build_messages(system_prompt, section_prompt))
+        return response.content.strip()
+
+    def cache_analysis(self, message: AgentMessage) -> Dict:
+        return self._analyze_speech_requirements(message.content)
+
     def _analyze_speech_requirements(self, content: str) -> Dict:
         """分析发言稿需求"""
         content_lower = content.lower()
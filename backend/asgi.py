@@ -0,0 +1,17 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+from agents.core.disconnect import DisconnectWatchMiddleware
+from agents.core.websocket import WebSocketRouter
+
+# Django 4.2不会把流式响应期间的http.disconnect通知视图，由中间件转交给流式视图；
+# WebSocket聊天（/ws/agents/chat/）不经过Django的请求处理
+application = WebSocketRouter(DisconnectWatchMiddleware(get_asgi_application()))
+
+from django.conf import settings
+
+if settings.AGENT_PREFORK_WARMUP:
+    from agents.core.warmup import warm_up
+    warm_up()
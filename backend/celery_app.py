@@ -0,0 +1,15 @@
+"""
+Celery应用
+启动工作进程：celery -A celery_app worker -Q generation -l info（在backend目录下执行）
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+app = Celery('agentics')
+# 读取settings.py中以CELERY_开头的配置
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
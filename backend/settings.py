@@ -71,6 +71,7 @@ TEMPLATES = [
 
 # WSGI 与数据库配置
 WSGI_APPLICATION = 'wsgi.application'
+ASGI_APPLICATION = 'asgi.application'
 
 DATABASES = {
     'default': {
@@ -161,6 +162,45 @@ CSRF_TRUSTED_ORIGINS = [
 # Celery 配置
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# 长文生成任务耗时较长：执行完才确认，工作进程崩溃后任务重新投递并从检查点续跑；每次只预取一个任务
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ROUTES = {'agents.core.tasks.*': {'queue': 'generation'}}
+# 任务未确认超过该秒数时Redis会重新投递，需长于最长的生成耗时
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': int(os.getenv('CELERY_VISIBILITY_TIMEOUT', '7200'))}
+# 未部署工作进程时（开发、测试）在提交请求中直接执行任务
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'false').lower() == 'true'
+GENERATION_JOB_POLL_INTERVAL = float(os.getenv('GENERATION_JOB_POLL_INTERVAL', '1'))  # 帧缓冲不可用时SSE订阅轮询任务状态的间隔秒数
+# 数据分析数据集配置
+DATASET_STORAGE_DIR = os.getenv('DATASET_STORAGE_DIR', str(BASE_DIR / 'data' / 'datasets'))
+DATASET_MAX_UPLOAD_MB = int(os.getenv('DATASET_MAX_UPLOAD_MB', '50'))  # 仅由数据集上传接口校验，文件部分不计入DATA_UPLOAD_MAX_MEMORY_SIZE
+# 批量生成配置
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+BATCH_FLUSH_SIZE = int(os.getenv('BATCH_FLUSH_SIZE', '20'))  # 每累计多少条结果批量写库一次
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv('BATCH_DEFAULT_CONCURRENCY', '4'))
+# 各模型提供商的并发上限，格式：openai=8,ollama=2
+BATCH_PROVIDER_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (item.split('=') for item in os.getenv('BATCH_PROVIDER_CONCURRENCY', '').split(',') if '=' in item)
+}
+# 可续传的流式生成：帧缓冲在Redis Stream中（redis/memory），断线重连时按Last-Event-ID补发
+STREAM_BUFFER_BACKEND = os.getenv('STREAM_BUFFER_BACKEND', 'redis')
+STREAM_BUFFER_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+STREAM_BUFFER_TTL = int(os.getenv('STREAM_BUFFER_TTL', '600'))  # 帧缓冲最后一次写入后保留的秒数
+STREAM_RESUME_GRACE = int(os.getenv('STREAM_RESUME_GRACE', '30'))  # 所有客户端断开后等待重连的秒数，超时取消生成
+# ASGI下读取同步流式响应（多智能体、批量生成、任务轮询）的专用线程数，即这类响应的并发上限，用尽时返回503
+STREAM_READER_THREADS = int(os.getenv('STREAM_READER_THREADS', '64'))
+# 消息和文档版本的延迟写入：off（同步写库）、memory（进程内队列，进程崩溃时丢失尚未写库的记录）、
+# redis（Redis 6.2+队列，Web进程重启后由任一进程继续写库）
+PERSIST_WRITE_BEHIND = os.getenv('PERSIST_WRITE_BEHIND', 'off')
+PERSIST_WRITE_BEHIND_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+PERSIST_WRITE_BEHIND_FLUSH_MS = int(os.getenv('PERSIST_WRITE_BEHIND_FLUSH_MS', '50'))  # 记录入队后最多延迟的毫秒数
+PERSIST_WRITE_BEHIND_BATCH_SIZE = int(os.getenv('PERSIST_WRITE_BEHIND_BATCH_SIZE', '200'))
+PERSIST_READ_YOUR_WRITES_TIMEOUT = float(os.getenv('PERSIST_READ_YOUR_WRITES_TIMEOUT', '5'))  # 读取前等待待写记录写库的最长秒数
+# 以gunicorn --preload启动时在主进程中预热智能体，子进程以写时复制共享预热好的只读状态
+AGENT_PREFORK_WARMUP = os.getenv('AGENT_PREFORK_WARMUP', 'false').lower() == 'true'
+
 # 第三方 API 配置
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 LANGCHAIN_TRACING_V2 = os.getenv('LANGCHAIN_TRACING_V2', 'false')
@@ -3,4 +3,14 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+from django.conf import settings
+from agents.core.concurrency import enable_loop_bridge_for_async_views
+
+# WSGI下所有视图的智能体调用都提交到进程级后台事件循环，模型客户端和连接池在请求之间复用
+enable_loop_bridge_for_async_views()
+
+if settings.AGENT_PREFORK_WARMUP:
+    from agents.core.warmup import warm_up
+    warm_up()
@@ -0,0 +1,63 @@
+"""测试共用的模型替身和消息构造"""
+
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from agents.core.base import AgentMessage, AgentType
+
+
+class Reply:
+    """模型返回的消息或流式增量，与LangChain消息一样通过content读取文本"""
+
+    def __init__(self, content):
+        self.content = content
+
+
+class StreamingLLM:
+    """
+    流式输出的模型替身
+
+    依次输出pieces中的增量，未指定时回显最后一条消息；endless为True时循环输出直到流被关闭。
+    记录每次调用收到的消息、非流式调用次数、已输出的增量数、流是否已开始以及是否被关闭
+    """
+
+    def __init__(self, pieces=None, delay=0.0, endless=False):
+        self.pieces = pieces
+        self.delay = delay
+        self.endless = endless
+        self.received = []
+        self.ainvoke_calls = 0
+        self.emitted = 0
+        self.started = threading.Event()
+        self.closed = threading.Event()
+
+    def _pieces(self, messages):
+        return self.pieces if self.pieces is not None else ["回答：", messages[-1].content]
+
+    async def ainvoke(self, messages):
+        self.received.append(messages)
+        self.ainvoke_calls += 1
+        return Reply("".join(self._pieces(messages)))
+
+    async def astream(self, messages):
+        self.received.append(messages)
+        self.started.set()
+        try:
+            while True:
+                for piece in self._pieces(messages):
+                    await asyncio.sleep(self.delay)
+                    self.emitted += 1
+                    yield Reply(piece)
+                if not self.endless:
+                    return
+        finally:
+            self.closed.set()
+
+
+def agent_message(content, agent_type=AgentType.GENERAL_QA, metadata=None, history=None):
+    return AgentMessage(id="test", content=content, agent_type=agent_type, timestamp=None, metadata=metadata,
+                        history=history)
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+from django.test import RequestFactory
+
+from agents.core.base import AgentResponse, AgentType, BaseAgent
+from agents.core.manager import AgentManager
+from agents.core.pool import AgentPool, get_agent_pool, set_agent_pool
+
+
+class CountingAgent(BaseAgent):
+    instances = 0
+
+    def __init__(self):
+        super().__init__(agent_type=AgentType.GENERAL_QA, name="通用问答助手", description="测试")
+        CountingAgent.instances += 1
+        self.calls = 0
+
+    def get_capabilities(self):
+        return ["问答"]
+
+    async def process(self, message):
+        self.calls += 1
+        return AgentResponse(success=True, content=f"回答{self.calls}", agent_type=self.agent_type, execution_time=0)
+
+
+@pytest.fixture
+def agent():
+    CountingAgent.instances = 0
+    manager = AgentManager()
+    manager.register_agent(CountingAgent())
+    set_agent_pool(AgentPool(lambda: manager))
+    yield manager.get_agent(AgentType.GENERAL_QA)
+    set_agent_pool(None)
+
+
+def test_pool_returns_shared_instance(agent):
+    pool = get_agent_pool()
+
+    assert pool.get(AgentType.GENERAL_QA) is agent
+    assert AgentType.GENERAL_QA in pool
+
+
+def test_pool_raises_for_unregistered_agent(agent):
+    with pytest.raises(KeyError):
+        AgentPool(lambda: AgentManager()).get(AgentType.NEWS_WRITER)
+
+
+def test_general_qa_view_reuses_agent_across_requests(agent):
+    from agents.general_qa.views import GeneralQAView
+
+    view = GeneralQAView.as_view()
+    factory = RequestFactory()
+    for _ in range(3):
+        request = factory.post('/api/agents/general-qa/chat/', data=json.dumps({'message': '你好'}),
+                               content_type='application/json')
+        response = asyncio.run(view(request))
+        assert response.status_code == 200
+
+    assert CountingAgent.instances == 1
+    assert agent.calls == 3
+    assert json.loads(response.content)['content'] == "回答3"
+
+    info = json.loads(asyncio.run(view(factory.get('/api/agents/general-qa/chat/'))).content)
+    assert info['agent_type'] == 'general_qa'
+    assert info['capabilities'] == ["问答"]
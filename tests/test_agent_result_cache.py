@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from conftest import Reply, agent_message
+
+from agents.core.base import AgentType
+from agents.core.cache import ResultCache, set_result_cache
+from agents.official_document.agent import OfficialDocumentAgent
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        return Reply(f"关于召开年度工作会议的通知（第{self.calls}版）")
+
+
+@pytest.fixture
+def cache():
+    cache = ResultCache(ttls={"official_document": 60})
+    set_result_cache(cache)
+    yield cache
+    set_result_cache(None)
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = OfficialDocumentAgent()
+    agent.llm = CountingLLM()
+    agent.format_calls = 0
+    original = agent._format_document_output
+
+    def counting_format(content, doc_info):
+        agent.format_calls += 1
+        return original(content, doc_info)
+
+    monkeypatch.setattr(agent, "_format_document_output", counting_format)
+    return agent
+
+
+def make_message(content, metadata=None):
+    return agent_message(content, AgentType.OFFICIAL_DOCUMENT, metadata)
+
+
+@pytest.mark.asyncio
+async def test_repeated_input_skips_llm_and_formatting(cache, agent):
+    first = await agent.process(make_message("起草一份召开年度工作会议的通知"))
+    second = await agent.process(make_message("  起草一份召开年度工作会议的通知 "))
+
+    assert agent.llm.calls == 1
+    assert agent.format_calls == 1
+    assert second.content == first.content
+    assert second.metadata["cache_hit"] is True
+    assert "cache_hit" not in first.metadata
+
+
+@pytest.mark.asyncio
+async def test_bypass_regenerates_and_refreshes(cache, agent):
+    await agent.process(make_message("起草一份召开年度工作会议的通知"))
+    refreshed = await agent.process(make_message("起草一份召开年度工作会议的通知", {"bypass_cache": True}))
+    cached = await agent.process(make_message("起草一份召开年度工作会议的通知"))
+
+    assert agent.llm.calls == 2
+    assert cached.content == refreshed.content
+
+
+@pytest.mark.asyncio
+async def test_cache_is_opt_in_per_agent(agent):
+    set_result_cache(ResultCache(ttls={"news_writer": 60}))
+    try:
+        await agent.process(make_message("起草一份召开年度工作会议的通知"))
+        await agent.process(make_message("起草一份召开年度工作会议的通知"))
+    finally:
+        set_result_cache(None)
+
+    assert agent.llm.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_entries_expire(agent):
+    set_result_cache(ResultCache(ttls={"official_document": 0.05}))
+    try:
+        await agent.process(make_message("起草一份召开年度工作会议的通知"))
+        time.sleep(0.1)
+        await agent.process(make_message("起草一份召开年度工作会议的通知"))
+    finally:
+        set_result_cache(None)
+
+    assert agent.llm.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_cached(cache, agent):
+    class BrokenLLM:
+        async def ainvoke(self, messages):
+            raise RuntimeError("timeout")
+
+    agent.llm = BrokenLLM()
+    failed = await agent.process(make_message("起草一份召开年度工作会议的通知"))
+    agent.llm = CountingLLM()
+    recovered = await agent.process(make_message("起草一份召开年度工作会议的通知"))
+
+    assert failed.success is False
+    assert recovered.success is True
+    assert agent.llm.calls == 1
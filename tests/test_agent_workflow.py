@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from agents.core.base import AgentResponse, AgentType, BaseAgent
+from agents.core.manager import AgentManager
+
+
+class EchoAgent(BaseAgent):
+    def __init__(self, agent_type, fail=False):
+        super().__init__(agent_type=agent_type, name=agent_type.value, description="")
+        self.fail = fail
+        self.received = []
+
+    def get_capabilities(self):
+        return []
+
+    async def process(self, message):
+        self.received.append(message.content)
+        return AgentResponse(
+            success=not self.fail,
+            content=f"{self.agent_type.value}输出",
+            agent_type=self.agent_type,
+            execution_time=0
+        )
+
+
+def test_registration_does_not_compile_graphs(monkeypatch):
+    manager = AgentManager()
+    compiled = []
+    monkeypatch.setattr(manager, '_build_workflow_graph', lambda steps: compiled.append(steps))
+
+    manager.register_agents([EchoAgent(AgentType.RESEARCH_REPORT), EchoAgent(AgentType.SPEECH_WRITER)])
+    manager.register_agent(EchoAgent(AgentType.NEWS_WRITER))
+
+    assert compiled == []
+    assert len(manager.agents) == 3
+
+
+def test_workflow_hands_output_to_next_step_and_compiles_once():
+    manager = AgentManager()
+    report = EchoAgent(AgentType.RESEARCH_REPORT)
+    speech = EchoAgent(AgentType.SPEECH_WRITER)
+    manager.register_agents([report, speech])
+    steps = [AgentType.RESEARCH_REPORT, AgentType.SPEECH_WRITER]
+
+    response = asyncio.run(manager.run_workflow("新能源市场", steps))
+
+    assert response.success
+    assert response.agent_type == AgentType.SPEECH_WRITER
+    assert [step["agent_type"] for step in response.metadata["workflow_steps"]] == ["research_report", "speech_writer"]
+    assert report.received == ["新能源市场"]
+    assert "research_report输出" in speech.received[0]
+
+    graph = manager.get_workflow_graph(steps)
+    asyncio.run(manager.run_workflow("再来一次", steps))
+    assert manager.get_workflow_graph(steps) is graph
+
+
+def test_workflow_stops_at_failed_step():
+    manager = AgentManager()
+    report = EchoAgent(AgentType.RESEARCH_REPORT, fail=True)
+    speech = EchoAgent(AgentType.SPEECH_WRITER)
+    manager.register_agents([report, speech])
+
+    response = asyncio.run(manager.run_workflow("新能源市场", [AgentType.RESEARCH_REPORT, AgentType.SPEECH_WRITER]))
+
+    assert not response.success
+    assert response.agent_type == AgentType.RESEARCH_REPORT
+    assert speech.received == []
+
+
+def test_workflow_with_unregistered_agent_fails():
+    manager = AgentManager()
+    manager.register_agent(EchoAgent(AgentType.RESEARCH_REPORT))
+
+    response = asyncio.run(manager.run_workflow("x", [AgentType.RESEARCH_REPORT, AgentType.DATA_ANALYSIS]))
+
+    assert not response.success
+    assert response.agent_type == AgentType.DATA_ANALYSIS
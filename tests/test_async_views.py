@@ -0,0 +1,47 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+
+django.setup()
+
+from django.test import AsyncRequestFactory
+
+from agents.core.views import ChatView, DocumentEditView
+
+
+def post(view_class, body):
+    request = AsyncRequestFactory().post('/', data=body, content_type='application/json')
+    return asyncio.run(view_class.as_view()(request))
+
+
+def test_chat_and_edit_views_are_async():
+    assert ChatView.view_is_async
+    assert DocumentEditView.view_is_async
+    assert asyncio.iscoroutinefunction(ChatView.as_view())
+
+
+def test_chat_view_rejects_invalid_json():
+    response = post(ChatView, 'not json')
+
+    assert response.status_code == 400
+
+
+def test_chat_view_rejects_unknown_agent_type():
+    response = post(ChatView, json.dumps({'message': '你好', 'agent_type': 'unknown'}))
+
+    assert response.status_code == 400
+    assert 'Invalid agent type' in json.loads(response.content)['error']
+
+
+def test_document_edit_view_validates_request():
+    response = post(DocumentEditView, json.dumps({'document_id': 1}))
+
+    assert response.status_code == 400
+    assert 'instruction' in json.loads(response.content)
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+
+django.setup()
+
+from rest_framework.test import APIRequestFactory
+
+from agents.core.base import AgentResponse, AgentType
+from agents.core.batch import BatchEntry, ProviderLimiter, run_batch
+import agents.core.views as views
+
+
+class CountingManager:
+    """记录各提供商同时运行的请求数"""
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.active = {}
+        self.peak = {}
+
+    async def process_message(self, content, agent_type=AgentType.GENERAL_QA, metadata=None):
+        provider = PROVIDERS[agent_type]
+        self.active[provider] = self.active.get(provider, 0) + 1
+        self.peak[provider] = max(self.peak.get(provider, 0), self.active[provider])
+        try:
+            await asyncio.sleep(self.delays.get(content, 0.05))
+            if content == "boom":
+                raise RuntimeError("provider down")
+            return AgentResponse(True, f"# {content}", agent_type, 0.05)
+        finally:
+            self.active[provider] -= 1
+
+
+PROVIDERS = {AgentType.NEWS_WRITER: "openai", AgentType.OFFICIAL_DOCUMENT: "ollama"}
+
+
+def entries(count):
+    return [
+        BatchEntry(index=i, agent_type=AgentType.NEWS_WRITER if i % 2 else AgentType.OFFICIAL_DOCUMENT, prompt=f"第{i}条")
+        for i in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped_per_provider():
+    manager = CountingManager()
+    limiter = ProviderLimiter({"openai": 3, "ollama": 1}, default_limit=2)
+    results = [result async for result in run_batch(manager, entries(12), limiter, PROVIDERS.get)]
+
+    assert sorted(result.entry.index for result in results) == list(range(12))
+    # 两个提供商各自跑满上限，互不等待
+    assert manager.peak == {"openai": 3, "ollama": 1}
+
+
+@pytest.mark.asyncio
+async def test_results_arrive_as_they_finish_and_errors_are_isolated():
+    manager = CountingManager(delays={"slow": 0.3, "fast": 0.01, "boom": 0.02})
+    batch = [
+        BatchEntry(index=0, agent_type=AgentType.NEWS_WRITER, prompt="slow"),
+        BatchEntry(index=1, agent_type=AgentType.NEWS_WRITER, prompt="boom"),
+        BatchEntry(index=2, agent_type=AgentType.NEWS_WRITER, prompt="fast"),
+    ]
+    results = [result async for result in run_batch(manager, batch, ProviderLimiter(default_limit=3), PROVIDERS.get)]
+
+    assert [result.entry.index for result in results] == [2, 1, 0]
+    assert results[1].response.success is False
+    assert "provider down" in results[1].response.error
+
+
+def test_existing_batch_id_with_new_items_is_rejected(monkeypatch):
+    class ExistingJobs:
+        @staticmethod
+        def filter(**kwargs):
+            class Query:
+                @staticmethod
+                def first():
+                    return object()
+            return Query()
+
+    monkeypatch.setattr(views.BatchJob, 'objects', ExistingJobs())
+    monkeypatch.setattr(views, 'claim_batch', lambda batch_id: pytest.fail('不应续跑'))
+    request = APIRequestFactory().post('/batch/', {
+        'batch_id': 'existing',
+        'items': [{'message': '写稿', 'agent_type': 'news_writer'}]
+    }, format='json')
+
+    response = views.BatchView.as_view()(request)
+
+    assert response.status_code == 409
+
+
+def test_batch_is_rejected_before_writing_when_stream_threads_are_busy(monkeypatch):
+    from agents.core.disconnect import StreamExecutor, set_stream_executor
+
+    executor = StreamExecutor(max_streams=1)
+    held = executor.reserve()
+    set_stream_executor(executor)
+    monkeypatch.setattr(views.BatchJob, 'objects', None)
+    request = APIRequestFactory().post('/batch/', {
+        'items': [{'message': '写稿', 'agent_type': 'news_writer'}]
+    }, format='json')
+    request.scope = {'type': 'http'}
+    try:
+        response = views.BatchView.as_view()(request)
+    finally:
+        set_stream_executor(None)
+        held.release()
+
+    assert response.status_code == 503
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from conftest import Reply, StreamingLLM, agent_message
+
+from agents.core.base import AgentType
+from agents.code_assistant.agent import CodeAssistantAgent
+from agents.code_assistant.chunking import split_code
+
+
+def make_python_code(functions=12, body_lines=30):
+    parts = ["import os", ""]
+    for i in range(functions):
+        parts.append(f"def handler_{i}(value):")
+        parts.extend(f"    value = value + {j}" for j in range(body_lines))
+        parts.append("    return value")
+        parts.append("")
+    return "\n".join(parts)
+
+
+class ReviewLLM:
+    """每个块都报告一个相同的问题和一个块内独有的问题"""
+
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.05)
+        self.active -= 1
+        prompt = messages[-1].content
+        start = prompt.split("原文第")[1].split("-")[0]
+        return Reply(
+            f"- [一般] 第{start}行: 缺少类型注解 —— 补充参数类型\n"
+            f"- [严重] 第{start}行: 块{start}中存在未处理的异常\n"
+        )
+
+
+def test_split_python_by_function_boundaries():
+    code = make_python_code()
+    chunks = split_code(code, "python", max_lines=100)
+
+    assert len(chunks) > 1
+    assert all(chunk.line_count <= 100 for chunk in chunks)
+    lines = code.split("\n")
+    for chunk in chunks[1:]:
+        # 每个块都从函数定义开始，不会把函数拦腰截断
+        assert lines[chunk.start_line - 1].startswith("def ")
+
+
+def test_python_is_split_by_ast_even_when_language_is_misdetected():
+    code = make_python_code()
+    # 语言识别按子串匹配，Python代码常被识别为其他语言
+    chunks = split_code(code, "cpp", max_lines=100)
+
+    assert chunks == split_code(code, "python", max_lines=100)
+
+
+def test_split_brace_language():
+    code = "\n".join(
+        f"function f{i}(a) {{\n  if (a) {{\n    return '}}';\n  }}\n  return 1;\n}}\n" for i in range(40)
+    )
+    chunks = split_code(code, "javascript", max_lines=50)
+
+    assert all(chunk.line_count <= 50 for chunk in chunks)
+    assert all(chunk.text.lstrip().startswith("function") for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_large_review_is_chunked_and_deduplicated():
+    agent = CodeAssistantAgent()
+    agent.chunked_review_min_lines = 100
+    agent.chunk_max_lines = 100
+    agent.llm = ReviewLLM()
+
+    response = await agent.process(agent_message(
+        f"请审查这段代码\n```python\n{make_python_code()}\n```", AgentType.CODE_ASSISTANT
+    ))
+
+    chunks = response.metadata["review_chunks"]
+    assert response.success is True
+    assert chunks > 1
+    assert agent.llm.calls == chunks
+    assert agent.llm.max_active > 1
+    # 相同的问题只保留一条，块内独有的问题全部保留
+    assert response.content.count("缺少类型注解") == 1
+    assert response.content.count("未处理的异常") == chunks
+    assert response.content.index("## 严重问题") < response.content.index("## 一般问题")
+
+
+@pytest.mark.asyncio
+async def test_small_review_uses_single_call():
+    agent = CodeAssistantAgent()
+    agent.llm = StreamingLLM(["代码整体良好"])
+
+    response = await agent.process(agent_message(
+        "请审查这段代码\n```python\ndef add(a, b):\n    return a + b\n```", AgentType.CODE_ASSISTANT
+    ))
+
+    assert response.success is True
+    assert response.metadata["review_chunks"] is None
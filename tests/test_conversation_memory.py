@@ -0,0 +1,67 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+from conftest import StreamingLLM, agent_message
+
+from agents.core.base import AgentType
+from agents.core.memory import ConversationTurn, build_memory, estimate_tokens
+from agents.news_writer.agent import NewsWriterAgent
+
+
+def make_turns(count, length=200):
+    turns = []
+    for i in range(count):
+        turns.append(ConversationTurn("user", f"第{i}轮提问：" + "问" * length))
+        turns.append(ConversationTurn("assistant", f"# 第{i}轮回答\n" + "答" * length, "news_writer"))
+    return turns
+
+
+def test_estimate_tokens_counts_chinese_per_character():
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("hello world!") == 3
+
+
+@pytest.mark.parametrize("rounds", [1, 10, 200])
+def test_memory_stays_within_budget(rounds):
+    memory = build_memory(make_turns(rounds), budget=1000)
+
+    assert memory.token_count <= 1000
+
+
+def test_newest_turns_verbatim_and_older_summarized():
+    turns = make_turns(10)
+    memory = build_memory(turns, budget=1000)
+
+    assert memory.recent[-1] == turns[-1]
+    assert memory.omitted_turns > 0
+    assert "第9轮回答" in memory.recent[-1].content
+    # 更早的轮次以逐条要点的形式出现在摘要中
+    assert "- 助手（news_writer）：第" in memory.summary
+    assert "问" * 200 not in memory.summary
+
+
+def test_oversized_latest_turn_is_truncated():
+    memory = build_memory([ConversationTurn("assistant", "长" * 5000)], budget=500)
+
+    assert memory.token_count <= 500
+    assert memory.recent[0].content.endswith("（已截断）")
+
+
+@pytest.mark.asyncio
+async def test_agent_prompt_includes_history():
+    agent = NewsWriterAgent()
+    agent.llm = StreamingLLM(["# 新闻稿"])
+    history = build_memory([
+        ConversationTurn("user", "帮我写一篇发布会新闻稿"),
+        ConversationTurn("assistant", "# 新品发布会圆满举行", "news_writer"),
+    ])
+    await agent.process(agent_message("把标题改得更吸引人", AgentType.NEWS_WRITER, history=history))
+
+    messages = agent.llm.received[-1]
+    assert [type(message) for message in messages] == [SystemMessage, HumanMessage, AIMessage, HumanMessage]
+    assert messages[-1].content == "把标题改得更吸引人"
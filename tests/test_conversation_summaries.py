@@ -0,0 +1,77 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from conftest import Reply
+
+from agents.core import summaries
+from agents.core.memory import ConversationTurn, build_memory
+
+
+class FakeStore:
+    """以内存代替数据库，模拟消息表和摘要表"""
+
+    def __init__(self, count):
+        self.messages = [
+            (i + 1, ConversationTurn("user" if i % 2 == 0 else "assistant", f"消息{i + 1}"))
+            for i in range(count)
+        ]
+        self.state = summaries.SummaryState()
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(summaries, "load_summary_state", lambda conversation_id: self.state)
+        monkeypatch.setattr(summaries, "count_unsummarized", lambda conversation_id, after_id: len(
+            [1 for message_id, _ in self.messages if message_id > after_id]))
+        monkeypatch.setattr(summaries, "load_unsummarized", lambda conversation_id, after_id, limit=None: [
+            item for item in self.messages if item[0] > after_id][:limit])
+        monkeypatch.setattr(summaries, "save_summary", self.save)
+
+    def save(self, conversation_id, summary, summarized_until, summarized_messages, expected_until):
+        self.state = summaries.SummaryState(summary, summarized_until, summarized_messages)
+
+
+class SummaryLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[-1].content)
+        return Reply(f"摘要第{len(self.prompts)}版")
+
+
+@pytest.mark.asyncio
+async def test_below_threshold_does_nothing(monkeypatch):
+    store = FakeStore(summaries.SUMMARY_TRIGGER_MESSAGES)
+    store.install(monkeypatch)
+    llm = SummaryLLM()
+
+    assert await summaries.fold_conversation(1, llm) is False
+    assert llm.prompts == []
+
+
+@pytest.mark.asyncio
+async def test_each_message_is_folded_once(monkeypatch):
+    store = FakeStore(20)
+    store.install(monkeypatch)
+    llm = SummaryLLM()
+
+    assert await summaries.fold_conversation(1, llm) is True
+    assert store.state.summarized_until == 20 - summaries.SUMMARY_KEEP_RECENT
+    assert "：消息1\n" in llm.prompts[0]
+
+    # 新消息超过阈值后，只把新增部分与已有摘要合并
+    store.messages += [(i, ConversationTurn("user", f"消息{i}")) for i in range(21, 31)]
+    assert await summaries.fold_conversation(1, llm) is True
+    assert "摘要第1版" in llm.prompts[1]
+    assert "：消息1\n" not in llm.prompts[1]
+    assert store.state.summarized_messages == 30 - summaries.SUMMARY_KEEP_RECENT
+
+
+def test_memory_reuses_stored_summary():
+    turns = [ConversationTurn("user", "最近的问题"), ConversationTurn("assistant", "最近的回答")]
+    memory = build_memory(turns, budget=500, stored_summary="用户在筹备新品发布会")
+
+    assert memory.summary == "用户在筹备新品发布会"
+    assert [turn.content for turn in memory.recent] == ["最近的问题", "最近的回答"]
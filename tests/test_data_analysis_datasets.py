@@ -0,0 +1,115 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+import django
+
+django.setup()
+
+pd = pytest.importorskip("pandas")
+
+from conftest import StreamingLLM, agent_message
+
+from agents.core.base import AgentType
+from agents.data_analysis.agent import DataAnalysisAgent
+from agents.data_analysis.datasets import DatasetStore, set_dataset_store
+from agents.data_analysis.profiling import profile_dataframe, render_profile
+
+
+CSV = (
+    "date,region,sales,cost\n"
+    "2024-01-01,华东,100,60\n"
+    "2024-01-02,华北,120,70\n"
+    "2024-01-03,华东,,65\n"
+    "2024-01-04,华南,140,80\n"
+    "2024-01-05,华东,160,90\n"
+).encode("utf-8")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    set_dataset_store(store)
+    yield store
+    set_dataset_store(None)
+
+
+def test_profile_contains_vectorized_statistics():
+    df = pd.DataFrame({
+        "date": pd.date_range("2024-01-01", periods=6, freq="D").astype(str),
+        "sales": [1.0, 2.0, None, 4.0, 5.0, 6.0],
+        "cost": [2.0, 4.0, 6.0, 8.0, 10.0, 12.0],
+        "region": ["a", "a", "b", "a", "c", "b"],
+    })
+
+    profile = profile_dataframe(df)
+    columns = {column["name"]: column for column in profile["columns"]}
+
+    assert profile["rows"] == 6
+    assert columns["sales"]["null_rate"] == pytest.approx(1 / 6, abs=1e-3)
+    assert columns["cost"]["quantiles"]["p50"] == 7.0
+    assert columns["region"]["top_values"][0] == {"value": "a", "count": 3}
+    assert profile["correlations"][0]["columns"] == ["sales", "cost"]
+    assert profile["time_series"]["time_column"] == "date"
+    assert profile["time_series"]["rule"] == "D"
+    assert len(profile["sample"]) == 5
+
+
+def test_header_only_csv_is_profiled_and_rendered(store):
+    dataset_id = store.save(b"date,region,sales\n", "empty.csv")
+
+    profile = store.get_profile(dataset_id)
+    text = render_profile(profile)
+
+    assert profile["rows"] == 0
+    assert "- sales（object，缺失率—，去重值0）" in text
+
+
+def test_store_deduplicates_by_content_hash(store):
+    first = store.save(CSV, "sales.csv")
+    second = store.save(CSV, "copy.csv")
+
+    assert first == second
+    profile = store.get_profile(first)
+    # 画像命中缓存时返回同一对象，不重复计算
+    assert store.get_profile(first) is profile
+    assert os.path.exists(os.path.join(store.root, f"{first}.profile.json"))
+
+
+def test_store_rejects_unknown_format(store):
+    with pytest.raises(ValueError):
+        store.save(b"hello", "notes.txt")
+
+
+def test_unparseable_upload_is_removed(store):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from rest_framework.test import APIRequestFactory
+    from agents.data_analysis.views import DatasetUploadView
+
+    request = APIRequestFactory().post(
+        "/datasets/", {"file": SimpleUploadedFile("broken.parquet", b"not a parquet file")}, format="multipart"
+    )
+    response = DatasetUploadView.as_view()(request)
+
+    assert response.status_code == 400
+    assert os.listdir(store.root) == []
+
+
+@pytest.mark.asyncio
+async def test_agent_sends_profile_instead_of_raw_table(store):
+    dataset_id = store.save(CSV, "sales.csv")
+    agent = DataAnalysisAgent()
+    agent.llm = StreamingLLM(["# 分析结果"])
+
+    response = await agent.process(agent_message("分析各地区销售趋势", AgentType.DATA_ANALYSIS,
+                                                 {"dataset_id": dataset_id}))
+
+    assert response.success is True
+    assert response.metadata["dataset_id"] == dataset_id
+    user_prompt = agent.llm.received[-1][-1].content
+    assert render_profile(store.get_profile(dataset_id)) in user_prompt
+    assert "df" in agent.llm.received[-1][0].content
@@ -0,0 +1,132 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+pytest.importorskip("pandas")
+
+from agents.data_analysis.datasets import DatasetStore
+from agents.data_analysis.sandbox import SandboxPool, SandboxLimits
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = SandboxPool(size=1, limits=SandboxLimits(cpu_seconds=2, wall_seconds=3))
+    pool.execute("1")
+    if pool.unavailable:
+        pool.shutdown()
+        pytest.skip(pool.unavailable)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    dataset_id = store.save(b"region,sales\nA,1\nB,2\nA,3\n", "sales.csv")
+    return store.locate(dataset_id)
+
+
+def test_runs_code_against_dataset(pool, dataset):
+    path, file_format = dataset
+    result = pool.execute("summary = df.groupby('region')['sales'].sum()\nprint(len(df))", path, file_format)
+
+    assert result.success is True
+    assert result.stdout.strip() == "3"
+    assert result.tables[0]["name"] == "summary"
+    assert "A" in result.tables[0]["table"]
+
+
+def test_last_expression_is_rendered(pool):
+    result = pool.execute("pd.DataFrame({'a': [1, 2]}).sum()")
+
+    assert result.success is True
+    assert result.tables[0]["name"] == "结果"
+
+
+def test_errors_are_reported(pool):
+    result = pool.execute("raise ValueError('bad')")
+
+    assert result.success is False
+    assert "ValueError" in result.error
+
+
+@pytest.mark.parametrize("code", [
+    "import socket\nsocket.socket().connect(('127.0.0.1', 80))",
+    "import _socket\n_socket.socket()",
+    "import subprocess\nsubprocess.run(['id'])",
+    "import os\nos.fork()",
+])
+def test_network_and_process_creation_are_blocked(pool, code):
+    result = pool.execute(code)
+
+    assert result.success is False
+    assert "PermissionError" in result.error
+
+
+def test_shell_commands_cannot_run(pool):
+    result = pool.execute("import os\nprint(os.system('true'))")
+
+    assert result.stdout.strip() != "0"
+
+
+def test_worker_has_no_secrets_in_environment(pool):
+    os.environ["SANDBOX_TEST_SECRET"] = "leaked"
+    try:
+        pool.shutdown()
+        result = pool.execute("import os\nprint(sorted(os.environ))")
+        proc = pool.execute("import os\nprint(open('/proc/%d/environ' % os.getppid()).read())")
+    finally:
+        del os.environ["SANDBOX_TEST_SECRET"]
+
+    assert result.success is True
+    assert "SANDBOX_TEST_SECRET" not in result.stdout
+    assert "leaked" not in proc.stdout
+
+
+def test_worker_does_not_run_as_root(pool):
+    result = pool.execute("import os\nprint(os.getuid(), os.geteuid())")
+
+    assert result.success is True
+    assert "0" not in result.stdout.split()
+
+
+def test_wall_time_limit_replaces_worker(pool):
+    result = pool.execute("import time\ntime.sleep(10)")
+
+    assert result.success is False
+    assert "超时" in result.error
+    # 被替换的工作进程可以继续提供服务
+    assert pool.execute("1 + 1").stdout.strip() == "2"
+
+
+def test_dataset_cache_is_bounded(tmp_path):
+    pool = SandboxPool(size=1, limits=SandboxLimits(cpu_seconds=2, wall_seconds=3, cached_datasets=1))
+    try:
+        store = DatasetStore(str(tmp_path))
+        first = store.locate(store.save(b"a\n1\n", "first.csv"))
+        second = store.locate(store.save(b"a\n1\n2\n", "second.csv"))
+        pool.execute("1")
+        if pool.unavailable:
+            pytest.skip(pool.unavailable)
+
+        results = [pool.execute("print(len(df))", *dataset) for dataset in (first, second, first)]
+        worker = pool._idle.get()
+        pool._idle.put(worker)
+    finally:
+        pool.shutdown()
+
+    assert [result.stdout.strip() for result in results] == ["1", "2", "1"]
+    # 只保留最近使用的数据集，被淘汰的数据集再次使用时重新发送
+    assert worker.datasets == {first[0]}
+
+
+def test_memory_error_replaces_worker(pool):
+    before = pool.execute("import os\nprint(os.getpid())").stdout.strip()
+
+    result = pool.execute("raise MemoryError")
+
+    assert result.success is False
+    assert "内存" in result.error
+    assert pool.execute("import os\nprint(os.getpid())").stdout.strip() != before
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from conftest import Reply, agent_message
+
+from agents.core.base import AgentResponse, AgentType, BaseAgent
+from agents.general_qa.agent import GeneralQAAgent
+from agents.general_qa.speculation import SpeculationBudget, score_intent
+
+
+class RouterLLM:
+    """路由确认返回固定答案，通用回答耗时general_delay秒"""
+
+    def __init__(self, decision, decision_delay=0.2, general_delay=0.3):
+        self.decision = decision
+        self.decision_delay = decision_delay
+        self.general_delay = general_delay
+        self.general_started = 0
+        self.general_cancelled = 0
+        self.decisions = 0
+        # 路由确认返回时已启动的通用回答数
+        self.general_started_before_decision = None
+
+    async def ainvoke(self, messages):
+        if messages[0].content == "你是请求路由助手。":
+            self.decisions += 1
+            await asyncio.sleep(self.decision_delay)
+            self.general_started_before_decision = self.general_started
+            return Reply(self.decision)
+        self.general_started += 1
+        try:
+            await asyncio.sleep(self.general_delay)
+        except asyncio.CancelledError:
+            self.general_cancelled += 1
+            raise
+        return Reply("通用回答")
+
+
+class SlowSpecialist(BaseAgent):
+    def __init__(self, delay=0.3):
+        super().__init__(agent_type=AgentType.SPEECH_WRITER, name="发言稿写作助手", description="撰写发言稿")
+        self.delay = delay
+        self.started = 0
+        self.cancelled = 0
+
+    def get_capabilities(self):
+        return []
+
+    async def process(self, message):
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return AgentResponse(success=True, content="发言稿正文", agent_type=self.agent_type, execution_time=self.delay)
+
+
+def make_agent(decision, per_minute=30):
+    agent = GeneralQAAgent()
+    agent.llm = RouterLLM(decision)
+    agent.speculation_budget = SpeculationBudget(per_minute)
+    specialist = SlowSpecialist()
+    agent.register_specialist_agent(AgentType.SPEECH_WRITER, specialist)
+    return agent, specialist
+
+
+def ask(agent, content):
+    return asyncio.run(agent.process(agent_message(content)))
+
+
+def test_intent_confidence():
+    assert score_intent("帮我写一篇年会发言稿", 1) >= 0.7
+    assert score_intent("发言稿和演讲稿有什么区别？", 1) < 0.7
+    assert score_intent("今天天气如何", 0) == 0.0
+
+
+def test_confident_route_goes_straight_to_specialist():
+    agent, specialist = make_agent("否")
+
+    response = ask(agent, "帮我写一篇年会发言稿")
+
+    assert response.content == "发言稿正文"
+    assert agent.llm.general_started == 0
+    assert "routing" not in (response.metadata or {})
+
+
+def test_speculation_commits_general_and_cancels_specialist():
+    agent, specialist = make_agent("否")
+
+    response = ask(agent, "发言稿和演讲稿有什么区别？")
+
+    assert response.content == "通用回答"
+    assert response.metadata["routing"]["decision"] == "general_qa"
+    assert response.metadata["routing"]["speculative"] is True
+    assert specialist.started == 1 and specialist.cancelled == 1
+    # 路由确认与通用回答并行：确认返回前通用回答已经开始
+    assert agent.llm.general_started_before_decision == 1
+
+
+def test_speculation_commits_specialist_and_cancels_general():
+    agent, specialist = make_agent("是")
+
+    response = ask(agent, "发言稿和演讲稿有什么区别？")
+
+    assert response.content == "发言稿正文"
+    assert response.metadata["routing"]["decision"] == "speech_writer"
+    assert agent.llm.general_cancelled == 1
+    assert agent.speculation_budget.stats()["specialist_chosen"] == 1
+
+
+def test_exhausted_budget_routes_by_keyword_without_confirmation():
+    agent, specialist = make_agent("否", per_minute=0)
+
+    response = ask(agent, "发言稿和演讲稿有什么区别？")
+
+    assert response.content == "发言稿正文"
+    assert response.metadata["routing"]["speculative"] is False
+    assert response.metadata["routing"]["decision"] == "speech_writer"
+    # 不在回答之前串行调用模型确认路由
+    assert agent.llm.decisions == 0
+    assert agent.llm.general_started == 0
+    assert agent.speculation_budget.stats()["declined"] == 1
+
+
+def test_budget_limits_speculation_rate():
+    budget = SpeculationBudget(per_minute=2)
+
+    assert [budget.try_acquire() for _ in range(3)] == [True, True, False]
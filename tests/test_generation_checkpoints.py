@@ -0,0 +1,93 @@
+import os
+import sys
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from conftest import Reply, agent_message
+
+from agents.core.base import AgentType
+from agents.core.checkpoints import InMemoryCheckpointStore, set_checkpoint_store
+from agents.research_report.agent import ResearchReportAgent
+from agents.speech_writer.agent import SpeechWriterAgent
+
+
+class FlakyLLM:
+    """对指定章节抛出超时的模拟LLM"""
+
+    def __init__(self, failing_sections=()):
+        self.failing_sections = set(failing_sections)
+        self.calls = []
+
+    async def ainvoke(self, messages):
+        prompt = messages[-1].content
+        section = prompt.split("「")[1].split("」")[0] if "「" in prompt else "大纲"
+        self.calls.append(section)
+        await asyncio.sleep(0)
+        if section in self.failing_sections:
+            raise TimeoutError(f"{section} 生成超时")
+        return Reply(f"{section}的内容")
+
+
+@pytest.fixture(autouse=True)
+def memory_store():
+    store = InMemoryCheckpointStore()
+    set_checkpoint_store(store)
+    yield store
+    set_checkpoint_store(None)
+
+
+@pytest.mark.asyncio
+async def test_report_retry_only_regenerates_missing_sections():
+    agent = ResearchReportAgent()
+    agent.llm = FlakyLLM(failing_sections={"竞争格局"})
+    content = "请写一份市场调研报告"
+
+    failed = await agent.process(agent_message(content, AgentType.RESEARCH_REPORT))
+    assert failed.success is False
+    progress = failed.metadata["generation"]
+    assert progress["status"] == "failed"
+    assert "市场概况" in progress["completed_steps"]
+    assert "竞争格局" not in progress["completed_steps"]
+
+    agent.llm = FlakyLLM()
+    retried = await agent.process(agent_message(
+        content, AgentType.RESEARCH_REPORT, {"generation_id": progress["generation_id"]}
+    ))
+    assert retried.success is True
+    # 只补齐失败章节和依赖全部正文的摘要
+    assert agent.llm.calls == ["竞争格局", "执行摘要"]
+    assert retried.metadata["generation"]["status"] == "completed"
+
+
+@pytest.mark.asyncio
+async def test_changed_request_discards_checkpoint():
+    agent = ResearchReportAgent()
+    agent.llm = FlakyLLM()
+    first = await agent.process(agent_message("请写一份市场调研报告", AgentType.RESEARCH_REPORT))
+    generation_id = first.metadata["generation"]["generation_id"]
+
+    agent.llm = FlakyLLM()
+    await agent.process(agent_message(
+        "请写一份详细的市场调研报告", AgentType.RESEARCH_REPORT, {"generation_id": generation_id}
+    ))
+    assert "大纲" in agent.llm.calls
+
+
+@pytest.mark.asyncio
+async def test_long_speech_is_sectioned_and_resumable():
+    agent = SpeechWriterAgent()
+    agent.llm = FlakyLLM(failing_sections={"成果展示"})
+    content = "请写一份20分钟的年会发言稿"
+
+    failed = await agent.process(agent_message(content, AgentType.SPEECH_WRITER))
+    assert failed.success is False
+    generation_id = failed.metadata["generation"]["generation_id"]
+
+    agent.llm = FlakyLLM()
+    retried = await agent.process(agent_message(content, AgentType.SPEECH_WRITER, {"generation_id": generation_id}))
+    assert retried.success is True
+    assert retried.metadata["generation_mode"] == "sectioned"
+    assert agent.llm.calls == ["成果展示"]
+    assert retried.content.index("新年问候的内容") < retried.content.index("祝福致辞的内容")
@@ -0,0 +1,184 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+
+django.setup()
+
+import agents.core.jobs as jobs
+import agents.core.views as views
+from agents.core import initialization
+from agents.core.base import AgentResponse, AgentType, BaseAgent
+from agents.core.cache import set_result_cache
+from agents.core.checkpoints import InMemoryCheckpointStore, open_checkpoint, set_checkpoint_store
+from agents.core.manager import AgentManager
+from agents.core.stream_buffer import MemoryStreamBuffer, set_stream_buffer, tail_stream
+from agents.core.tasks import run_generation_job
+
+
+class SectionedAgent(BaseAgent):
+    """分两个章节生成，succeed为False时返回失败响应"""
+
+    def __init__(self, succeed=True):
+        super().__init__(AgentType.RESEARCH_REPORT, "测试研报", "测试")
+        self.succeed = succeed
+        self.generation_ids = []
+
+    async def process(self, message):
+        checkpointer = await open_checkpoint(message, self.agent_type)
+        self.generation_ids.append(checkpointer.generation_id)
+        await checkpointer.plan(['大纲', '正文'])
+        outline = await checkpointer.step('大纲', self._section('大纲内容'))
+        body = await checkpointer.step('正文', self._section('正文内容'))
+        await checkpointer.complete()
+        if not self.succeed:
+            return AgentResponse(success=False, content="生成失败", agent_type=self.agent_type, execution_time=0)
+        return AgentResponse(success=True, content=f"{outline}\n{body}", agent_type=self.agent_type,
+                             execution_time=0)
+
+    @staticmethod
+    def _section(content):
+        async def generate():
+            return content
+        return generate
+
+    def get_capabilities(self):
+        return []
+
+
+class FakeJobs:
+    """以内存中的任务记录替代数据库"""
+
+    def __init__(self, monkeypatch, **fields):
+        self.job = SimpleNamespace(job_id='job1', conversation_id=3, agent_type='research_report',
+                                   prompt='写一份研报', metadata={}, status='queued', progress={},
+                                   document_id=None, error='')
+        self.job.__dict__.update(fields)
+        self.updates = []
+        monkeypatch.setattr(jobs, '_load_job', lambda job_id: self.job if job_id == self.job.job_id else None)
+        monkeypatch.setattr(jobs, '_update_job', self.update)
+
+    def update(self, job_id, **fields):
+        self.updates.append(fields)
+        self.job.__dict__.update(fields)
+
+
+def install_agent(agent):
+    manager = AgentManager()
+    manager.register_agent(agent)
+    initialization._agent_manager = manager
+
+
+def read_events(buffer, job_id):
+    return [json.loads(frame.split('data: ', 1)[1]) for frame in tail_stream(buffer, job_id)]
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    set_result_cache(None)
+    set_checkpoint_store(InMemoryCheckpointStore())
+    monkeypatch.setattr(views, 'persist_agent_response', lambda conversation_id, agent_type, response: 9)
+    monkeypatch.setattr(initialization, '_agent_manager', None)
+    buffer = MemoryStreamBuffer()
+    set_stream_buffer(buffer)
+    yield buffer
+    set_stream_buffer(None)
+    set_checkpoint_store(None)
+
+
+def test_job_publishes_progress_sections_and_result(monkeypatch, offline):
+    fake = FakeJobs(monkeypatch)
+    agent = SectionedAgent()
+    install_agent(agent)
+
+    jobs.run_job('job1')
+
+    events = read_events(offline, 'job1')
+    sections = [event['data'] for event in events if event['type'] == 'section']
+    assert sections == [{'name': '大纲', 'content': '大纲内容'}, {'name': '正文', 'content': '正文内容'}]
+    assert 'progress' in [event['type'] for event in events]
+    assert events[-1]['type'] == 'complete'
+    assert events[-1]['data']['document_id'] == 9
+    assert events[-1]['data']['raw_content'] == '大纲内容\n正文内容'
+    # job_id即生成检查点ID，重新投递时从检查点续跑
+    assert agent.generation_ids == ['job1']
+    assert fake.updates[0] == {'status': 'running'}
+    assert fake.job.status == 'completed' and fake.job.document_id == 9
+    assert fake.job.progress['completed_steps'] == ['大纲', '正文']
+
+
+def test_failed_response_marks_job_failed(monkeypatch, offline):
+    fake = FakeJobs(monkeypatch)
+    install_agent(SectionedAgent(succeed=False))
+
+    jobs.run_job('job1')
+
+    assert fake.job.status == 'failed'
+    assert fake.job.error == '生成失败'
+    assert read_events(offline, 'job1')[-1] == {'type': 'error', 'data': '生成失败'}
+
+
+def test_redelivered_finished_job_is_skipped(monkeypatch, offline):
+    fake = FakeJobs(monkeypatch, status='completed')
+    agent = SectionedAgent()
+    install_agent(agent)
+
+    jobs.run_job('job1')
+
+    assert agent.generation_ids == []
+    assert fake.updates == []
+
+
+def test_celery_task_routes_to_generation_queue_and_runs_job(monkeypatch, offline):
+    from celery_app import app
+
+    fake = FakeJobs(monkeypatch)
+    install_agent(SectionedAgent())
+
+    run_generation_job.apply(args=['job1']).get()
+
+    assert app.conf.task_routes['agents.core.tasks.*'] == {'queue': 'generation'}
+    assert fake.job.status == 'completed'
+
+
+def test_poll_frames_follow_job_record_without_buffer(monkeypatch):
+    fake = FakeJobs(monkeypatch, status='running', progress={'completed_steps': ['大纲'], 'total_steps': 2})
+    frames = jobs.poll_job_frames('job1', interval=0)
+
+    first = json.loads(next(frames)[len('data: '):])
+    fake.job.status = 'completed'
+    fake.job.document_id = 4
+    rest = [json.loads(frame[len('data: '):]) for frame in frames]
+
+    assert first == {'type': 'progress', 'data': {'completed_steps': ['大纲'], 'total_steps': 2}}
+    assert rest == [{'type': 'complete', 'data': {'job_id': 'job1', 'status': 'completed', 'document_id': 4}}]
+
+
+def test_job_for_other_users_conversation_is_not_found(monkeypatch):
+    from rest_framework.test import APIRequestFactory
+
+    from agents.core.models import Conversation
+
+    class Conversations:
+        """对话5属于用户7"""
+
+        def get(self, **kwargs):
+            if kwargs['id'] != 5 or kwargs.get('user_id', 7) != 7:
+                raise Conversation.DoesNotExist
+            return SimpleNamespace(id=5)
+
+    monkeypatch.setattr(Conversation, 'objects', Conversations())
+    request = APIRequestFactory().post('/jobs/', {'message': '写一份研报', 'agent_type': 'research_report',
+                                                  'conversation_id': 5}, format='json')
+
+    response = views.GenerationJobView.as_view()(request)
+
+    assert response.status_code == 404
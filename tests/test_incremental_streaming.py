@@ -0,0 +1,100 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from conftest import Reply, StreamingLLM
+
+from agents.core.base import AgentType
+from agents.core.cache import set_result_cache
+from agents.core.manager import AgentManager
+from agents.core.streaming import DeltaBuffer
+from agents.general_qa.agent import GeneralQAAgent
+from agents.general_qa.speculation import SpeculationBudget
+from agents.news_writer.agent import NewsWriterAgent
+
+
+class NonStreamingLLM:
+    async def ainvoke(self, messages):
+        return Reply("完整回答")
+
+
+def collect(manager, content, agent_type):
+    async def run():
+        return [event async for event in manager.stream_message(content, agent_type)]
+    return asyncio.run(run())
+
+
+def setup_function():
+    set_result_cache(None)
+
+
+def test_stream_forwards_model_deltas_before_formatted_result():
+    agent = NewsWriterAgent()
+    agent.llm = StreamingLLM(["新品发布会", "今日举行，", "现场反响热烈。"])
+    manager = AgentManager()
+    manager.register_agent(agent)
+
+    events = collect(manager, "写一篇新闻稿", AgentType.NEWS_WRITER)
+
+    assert [event.delta for event in events if event.type == 'delta'] == ["新品发布会", "今日举行，", "现场反响热烈。"]
+    assert events[-1].type == 'complete'
+    assert events[-1].response.success
+    assert "新品发布会今日举行" in events[-1].response.content
+    assert agent.llm.ainvoke_calls == 0
+
+
+def test_non_streaming_process_is_unchanged():
+    agent = NewsWriterAgent()
+    agent.llm = StreamingLLM(["完整", "新闻稿"])
+    manager = AgentManager()
+    manager.register_agent(agent)
+
+    response = asyncio.run(manager.process_message("写一篇新闻稿", AgentType.NEWS_WRITER))
+
+    assert response.success
+    assert agent.llm.ainvoke_calls == 1
+
+
+def test_model_without_astream_yields_only_final_response():
+    agent = NewsWriterAgent()
+    agent.llm = NonStreamingLLM()
+    manager = AgentManager()
+    manager.register_agent(agent)
+
+    events = collect(manager, "写一篇新闻稿", AgentType.NEWS_WRITER)
+
+    assert [event.type for event in events] == ['complete']
+
+
+def test_speculative_route_streams_only_the_chosen_side():
+    class RouterLLM(StreamingLLM):
+        async def ainvoke(self, messages):
+            await asyncio.sleep(0.05)
+            return Reply("否")
+
+    general = GeneralQAAgent()
+    general.llm = RouterLLM(["通用", "回答"], delay=0.02)
+    general.speculation_budget = SpeculationBudget(10)
+    specialist = NewsWriterAgent()
+    specialist.llm = StreamingLLM(["新闻", "正文"], delay=0.01)
+    general.register_specialist_agent(AgentType.NEWS_WRITER, specialist)
+    manager = AgentManager()
+    manager.register_agent(general)
+
+    events = collect(manager, "新闻稿和通讯稿有什么区别？", AgentType.GENERAL_QA)
+
+    assert "".join(event.delta for event in events if event.type == 'delta') == "通用回答"
+    assert events[-1].response.metadata["routing"]["decision"] == "general_qa"
+
+
+def test_delta_buffer_replays_pending_deltas_on_attach():
+    received = []
+    buffer = DeltaBuffer()
+    buffer.push("a")
+    buffer.push("b")
+    buffer.attach(received.append)
+    buffer.push("c")
+
+    assert received == ["a", "b", "c"]
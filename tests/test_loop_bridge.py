@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from agents.core.concurrency import LoopBridge, LoopBridgeBusy
+
+
+@pytest.fixture
+def bridge():
+    bridge = LoopBridge(max_in_flight=2, acquire_timeout=0.05, lag_interval=0.02)
+    yield bridge
+    bridge.shutdown()
+
+
+def test_coroutines_share_one_persistent_loop(bridge):
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    loops = {bridge.run(current_loop()) for _ in range(3)}
+
+    assert len(loops) == 1
+    assert bridge.stats()['submitted'] == 3
+    assert bridge.stats()['in_flight'] == 0
+
+
+def test_concurrent_callers_overlap(bridge):
+    arrived = []
+    results = []
+
+    async def rendezvous():
+        # 两个调用都进入事件循环后才返回，串行执行时第一个调用等不到第二个
+        arrived.append(1)
+        while len(arrived) < 2:
+            await asyncio.sleep(0.01)
+        return 1
+
+    def call():
+        results.append(bridge.run(asyncio.wait_for(rendezvous(), 2)))
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [1, 1]
+
+
+def test_in_flight_limit_rejects_excess_work(bridge):
+    futures = [bridge.submit(asyncio.sleep(0.3)) for _ in range(2)]
+
+    with pytest.raises(LoopBridgeBusy):
+        bridge.submit(asyncio.sleep(0))
+    assert bridge.stats()['rejected'] == 1
+
+    for future in futures:
+        future.result()
+    assert bridge.run(asyncio.sleep(0, result='ok')) == 'ok'
+
+
+def test_iterate_streams_items_and_cancels_on_close(bridge):
+    cancelled = threading.Event()
+
+    async def numbers():
+        try:
+            for number in range(100):
+                yield number
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    iterator = bridge.iterate(numbers)
+    assert [next(iterator) for _ in range(3)] == [0, 1, 2]
+    iterator.close()
+
+    assert cancelled.wait(1)
+    assert bridge.stats()['in_flight'] == 0
+
+
+def test_run_async_from_another_loop(bridge):
+    async def on_bridge():
+        return threading.current_thread().name
+
+    assert asyncio.run(bridge.run_async(on_bridge())) == 'agent-event-loop'
+
+
+def test_lag_metrics_and_shutdown(bridge):
+    async def block():
+        time.sleep(0.15)
+
+    bridge.run(block())
+    time.sleep(0.05)
+
+    assert bridge.stats()['lag_max_ms'] >= 100
+
+    pending = bridge.submit(asyncio.sleep(10))
+    bridge.shutdown()
+    assert pending.cancelled()
+    assert not bridge.is_running()
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from agents.core.base import AgentResponse, AgentType, BaseAgent
+from agents.core.manager import AgentManager
+
+
+class SleepyAgent(BaseAgent):
+    def __init__(self, agent_type, delay, events=None):
+        super().__init__(agent_type, agent_type.value, "测试智能体")
+        self.delay = delay
+        self.events = events if events is not None else []
+
+    async def process(self, message):
+        self.events.append(("started", self.agent_type))
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.events.append(("cancelled", self.agent_type))
+            raise
+        self.events.append(("finished", self.agent_type))
+        return AgentResponse(True, f"{self.agent_type.value}: {message.content}", self.agent_type, self.delay)
+
+    def get_capabilities(self):
+        return []
+
+
+def make_manager(events=None):
+    manager = AgentManager()
+    manager.register_agent(SleepyAgent(AgentType.SPEECH_WRITER, 0.3, events))
+    manager.register_agent(SleepyAgent(AgentType.NEWS_WRITER, 0.1, events))
+    manager.register_agent(SleepyAgent(AgentType.OFFICIAL_DOCUMENT, 0.2, events))
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_results_stream_in_completion_order():
+    events = []
+    manager = make_manager(events)
+    results = [
+        response.agent_type
+        async for response in manager.process_many(
+            "新品发布", [AgentType.SPEECH_WRITER, AgentType.NEWS_WRITER, AgentType.OFFICIAL_DOCUMENT]
+        )
+    ]
+
+    # 三个智能体同时开始，而不是逐个执行
+    assert [event for event, _ in events[:3]] == ["started"] * 3
+    assert results == [AgentType.NEWS_WRITER, AgentType.OFFICIAL_DOCUMENT, AgentType.SPEECH_WRITER]
+
+
+@pytest.mark.asyncio
+async def test_unregistered_agent_reports_failure():
+    manager = make_manager()
+    results = [
+        response async for response in manager.process_many("新品发布", [AgentType.NEWS_WRITER, AgentType.CODE_ASSISTANT])
+    ]
+
+    failed = [response for response in results if not response.success]
+    assert len(results) == 2
+    assert failed[0].agent_type == AgentType.CODE_ASSISTANT
+
+
+@pytest.mark.asyncio
+async def test_stopping_early_cancels_pending_agents():
+    events = []
+    manager = make_manager(events)
+    stream = manager.process_many(
+        "新品发布", [AgentType.SPEECH_WRITER, AgentType.NEWS_WRITER, AgentType.OFFICIAL_DOCUMENT]
+    )
+    first = await stream.__anext__()
+    await stream.aclose()
+
+    assert first.agent_type == AgentType.NEWS_WRITER
+    cancelled = [agent_type.value for event, agent_type in events if event == "cancelled"]
+    assert sorted(cancelled) == ["official_document", "speech_writer"]
@@ -0,0 +1,159 @@
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend')
+
+# 各接口的查询预算，不计事务控制语句（BEGIN/COMMIT）
+QUERY_BUDGET = {
+    'chat_new_conversation': 4,
+    'chat_follow_up': 7,
+    'document_edit': 4,
+}
+
+# 在临时文件数据库上迁移，测试不接触开发数据库；等待写锁的超时足够长，并发写入排队而不是报错
+SETUP_SCRIPT = """
+import json, os, sys, tempfile
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'rest_framework', 'agents.core'],
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+                           'NAME': os.path.join(tempfile.mkdtemp(), 'queries.sqlite3'),
+                           'OPTIONS': {'timeout': 30}}},
+    ROOT_URLCONF='agents.core.urls', USE_TZ=True, ALLOWED_HOSTS=['*'], SECRET_KEY='query-budget',
+    PERSIST_WRITE_BEHIND='off',
+)
+import django
+django.setup()
+from django.core.management import call_command
+
+call_command('migrate', verbosity=0)
+"""
+
+QUERY_COUNT_SCRIPT = SETUP_SCRIPT + """
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from agents.core import initialization
+from agents.core.base import AgentResponse, AgentType, BaseAgent
+from agents.core.manager import AgentManager
+from agents.core.models import DocumentVersion, Message
+
+
+class EchoAgent(BaseAgent):
+    def __init__(self, agent_type):
+        super().__init__(agent_type, 'echo', 'echo')
+
+    async def process(self, message):
+        return AgentResponse(True, '# 标题\\n' + message.content[:20], self.agent_type, 0)
+
+    def get_capabilities(self):
+        return []
+
+
+manager = AgentManager()
+manager.register_agent(EchoAgent(AgentType.NEWS_WRITER))
+manager.register_agent(EchoAgent(AgentType.GENERAL_QA))
+initialization._agent_manager = manager
+client = Client()
+
+
+def measure(method, path, payload):
+    with CaptureQueriesContext(connection) as queries:
+        response = getattr(client, method)(path, payload, content_type='application/json')
+    assert response.status_code == 200, response.content
+    return response.json(), len([query for query in queries if query['sql'] not in ('BEGIN', 'COMMIT')])
+
+
+counts = {}
+first, counts['chat_new_conversation'] = measure('post', '/chat/', {'message': '写一篇新闻稿', 'agent_type': 'news_writer'})
+_, counts['chat_follow_up'] = measure('post', '/chat/', {
+    'message': '再改一版', 'agent_type': 'news_writer',
+    'conversation_id': first['conversation_id'], 'document_id': first['document_id']
+})
+edit, counts['document_edit'] = measure('post', '/documents/edit/', {
+    'document_id': first['document_id'], 'operation': 'polish', 'instruction': '更正式'
+})
+print(json.dumps({
+    'counts': counts,
+    'versions': sorted(DocumentVersion.objects.values_list('version_number', flat=True)),
+    'edit_version': edit['new_version'],
+    'messages': list(Message.objects.order_by('id').values_list('is_user_message', flat=True)),
+}))
+"""
+
+
+# 多个线程各用自己的数据库连接同时追加同一文档的版本
+CONCURRENT_VERSIONS_SCRIPT = SETUP_SCRIPT + """
+import threading
+from django.db import connection
+
+from agents.core.models import Conversation, DocumentVersion
+from agents.core.persistence import append_document_version, create_document
+
+THREADS, APPENDS = 8, 5
+document = create_document(Conversation.objects.create().id, '# 初稿', 'news_writer')
+barrier = threading.Barrier(THREADS)
+returned, errors = [], []
+
+
+def append(index):
+    barrier.wait()
+    try:
+        for step in range(APPENDS):
+            returned.append(append_document_version(document.id, f'线程{index}第{step}次', 'edit'))
+    except Exception as e:
+        errors.append(repr(e))
+    finally:
+        connection.close()
+
+
+threads = [threading.Thread(target=append, args=(index,)) for index in range(THREADS)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+document.refresh_from_db()
+print(json.dumps({
+    'errors': errors,
+    'returned': returned,
+    'stored': list(DocumentVersion.objects.filter(document_id=document.id).values_list('version_number', flat=True)),
+    'current_version': document.current_version,
+}))
+"""
+
+
+def test_persistence_stays_within_query_budget():
+    """查询预算基准：一轮对话的消息一次写入，文档版本原子递增"""
+    result = subprocess.run(
+        [sys.executable, '-c', QUERY_COUNT_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+
+    for endpoint, budget in QUERY_BUDGET.items():
+        assert stats['counts'][endpoint] <= budget, f"{endpoint}: {stats['counts'][endpoint]} > {budget}"
+    assert stats['versions'] == [1, 2, 3]
+    assert stats['edit_version'] == 3
+    assert stats['messages'] == [True, False, True, False]
+
+
+def test_concurrent_appends_get_distinct_contiguous_versions():
+    """并发追加同一文档的版本时，版本号互不重复且连续，当前版本等于最大版本号"""
+    result = subprocess.run(
+        [sys.executable, '-c', CONCURRENT_VERSIONS_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert stats['errors'] == []
+    assert sorted(stats['returned']) == list(range(2, 42))
+    assert sorted(stats['stored']) == list(range(1, 42))
+    assert stats['current_version'] == 41
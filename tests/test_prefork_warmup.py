@@ -0,0 +1,64 @@
+import gc
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+from agents.core import initialization
+from agents.core.base import AgentType
+from agents.core.warmup import reset_after_fork, warm_up
+
+
+@pytest.fixture
+def manager():
+    initialization._agent_manager = initialization.create_agent_manager()
+    yield initialization._agent_manager
+    initialization._agent_manager = None
+    gc.unfreeze()
+
+
+def test_warm_up_loads_agents_and_freezes_heap(manager):
+    timings = warm_up()
+
+    assert len(manager.agents.loaded()) == len(manager.agents)
+    assert manager.agents[AgentType.GENERAL_QA]._graph is not None
+    assert all(agent._llm is None for agent in manager.agents.loaded().values())
+    assert gc.get_freeze_count() > 0
+    assert timings['total'] >= timings['agents']
+
+
+def test_reset_after_fork_drops_model_clients(manager):
+    warm_up(freeze=False)
+    agent = manager.agents[AgentType.NEWS_WRITER]
+    agent.llm = object()
+
+    reset_after_fork()
+
+    assert agent._llm is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="需要fork")
+def test_forked_child_shares_warm_state_without_clients(manager):
+    warm_up()
+    manager.agents[AgentType.NEWS_WRITER].llm = object()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        ok = (
+            all(agent._llm is None for agent in manager.agents.loaded().values())
+            and manager.agents[AgentType.GENERAL_QA]._graph is not None
+        )
+        os.write(write_fd, b'1' if ok else b'0')
+        os._exit(0)
+
+    os.close(write_fd)
+    result = os.read(read_fd, 1)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    assert result == b'1'
@@ -0,0 +1,86 @@
+import os
+import sys
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from conftest import Reply, agent_message
+
+from agents.core.base import AgentType
+from agents.core.checkpoints import InMemoryCheckpointStore, set_checkpoint_store
+from agents.research_report.agent import ResearchReportAgent
+
+
+class SlowEchoLLM:
+    """按提示返回章节名的模拟LLM，每次调用耗时固定，记录同时进行的调用数"""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def ainvoke(self, messages):
+        prompt = messages[-1].content
+        self.calls.append(prompt)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if "「" in prompt:
+            return Reply("章节内容：" + prompt.split("「")[1].split("」")[0])
+        return Reply("大纲要点")
+
+
+@pytest.fixture(autouse=True)
+def memory_store():
+    set_checkpoint_store(InMemoryCheckpointStore())
+    yield
+    set_checkpoint_store(None)
+
+
+def _message(content, metadata=None):
+    return agent_message(content, AgentType.RESEARCH_REPORT, metadata)
+
+
+@pytest.mark.asyncio
+async def test_sectioned_report_keeps_structure_order():
+    agent = ResearchReportAgent()
+    agent.llm = SlowEchoLLM()
+
+    response = await agent.process(_message("请写一份市场调研报告"))
+
+    assert response.success is True
+    assert response.metadata["generation_mode"] == "sectioned"
+    structure = agent.report_types["市场调研报告"]["structure"]
+    positions = [response.content.index(f"## {section}") for section in structure]
+    assert positions == sorted(positions)
+    # 摘要轮在所有正文章节之后执行
+    assert "「执行摘要」" in agent.llm.calls[-1]
+
+
+@pytest.mark.asyncio
+async def test_sections_run_concurrently():
+    agent = ResearchReportAgent()
+    agent.llm = SlowEchoLLM(delay=0.1)
+    agent.section_concurrency = 8
+
+    await agent.process(_message("请写一份市场调研报告"))
+
+    # 大纲和摘要单独执行，正文章节同时进行
+    structure = agent.report_types["市场调研报告"]["structure"]
+    assert agent.llm.max_active == len(structure) - 1
+
+
+@pytest.mark.asyncio
+async def test_single_mode_uses_one_call():
+    agent = ResearchReportAgent()
+    agent.llm = SlowEchoLLM(delay=0)
+
+    response = await agent.process(_message("请写一份市场调研报告", {"generation_mode": "single"}))
+
+    assert response.metadata["generation_mode"] == "single"
+    assert len(agent.llm.calls) == 1
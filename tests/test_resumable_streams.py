@@ -0,0 +1,318 @@
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+
+django.setup()
+
+from django.test import RequestFactory
+
+from conftest import StreamingLLM
+
+from agents.core.base import AgentType
+from agents.core.cache import set_result_cache
+from agents.core.concurrency import LoopBridge, set_loop_bridge
+from agents.core.manager import AgentManager
+from agents.core.stream_buffer import (MemoryStreamBuffer, RedisStreamBuffer, atail_stream, parse_event_id,
+                                       publish_stream, set_stream_buffer, tail_stream)
+import agents.core.views as views
+from agents.core.views import StreamChatView
+from agents.news_writer.agent import NewsWriterAgent
+
+
+async def slow_frames(count, delay=0.02):
+    for index in range(count):
+        await asyncio.sleep(delay)
+        yield f"data: {index}\n\n"
+
+
+def publish(buffer, stream_id, count):
+    """生成结束后再读取"""
+    asyncio.run(publish_stream(buffer, stream_id, slow_frames(count, delay=0)))
+
+
+def event_ids(frames):
+    return [frame.split('\n', 1)[0][len('id: '):] for frame in frames]
+
+
+def setup_function():
+    set_result_cache(None)
+
+
+def teardown_function():
+    set_stream_buffer(None)
+    set_loop_bridge(None)
+
+
+@pytest.fixture
+def bridge():
+    bridge = LoopBridge()
+    yield bridge
+    bridge.shutdown()
+
+
+def test_reconnect_replays_missed_frames_and_follows_live_generation(bridge):
+    buffer = MemoryStreamBuffer()
+    buffer.open('s1')
+    bridge.submit(publish_stream(buffer, 's1', slow_frames(6)))
+
+    first = tail_stream(buffer, 's1')
+    received = [next(first), next(first)]
+    first.close()
+
+    stream_id, after = parse_event_id(event_ids(received)[-1])
+    resumed = list(tail_stream(buffer, stream_id, after))
+
+    frames = [frame.split('\n', 1)[1] for frame in received + resumed]
+    assert frames == [f"data: {index}\n\n" for index in range(6)]
+    assert stream_id == 's1'
+
+
+def test_replay_from_start_after_generation_finished():
+    buffer = MemoryStreamBuffer()
+    buffer.open('s2')
+    publish(buffer, 's2', 3)
+
+    frames = list(tail_stream(buffer, 's2'))
+
+    assert event_ids(frames) == ['s2:1', 's2:2', 's2:3']
+
+
+def test_reader_expires_when_not_renewed_within_grace():
+    buffer = MemoryStreamBuffer(reader_grace=0.1)
+    buffer.open('s3')
+
+    assert buffer.has_reader('s3')
+    time.sleep(0.15)
+    assert not buffer.has_reader('s3')
+    buffer.touch_reader('s3')
+    assert buffer.has_reader('s3')
+
+
+def stream_deltas(manager):
+    async def deltas():
+        async for event in manager.stream_message("写一篇新闻稿", AgentType.NEWS_WRITER):
+            if event.type == 'delta':
+                yield event.delta
+    return deltas()
+
+
+def test_generation_is_cancelled_after_readers_leave(bridge):
+    agent = NewsWriterAgent()
+    agent.llm = StreamingLLM(["正文"], delay=0.05, endless=True)
+    manager = AgentManager()
+    manager.register_agent(agent)
+    buffer = MemoryStreamBuffer(reader_grace=0.2)
+    buffer.open('s4')
+    task = bridge.submit(publish_stream(buffer, 's4', stream_deltas(manager)))
+
+    reader = tail_stream(buffer, 's4')
+    next(reader)
+    reader.close()
+
+    assert agent.llm.closed.wait(3)
+    task.result(2)
+    # 取消后写入结束标记，续传的读者读完已有的帧后结束
+    assert list(tail_stream(buffer, 's4'))
+    assert bridge.stats()['in_flight'] == 0
+
+
+def test_external_cancellation_propagates_and_finishes_stream():
+    buffer = MemoryStreamBuffer(reader_grace=60)
+    buffer.open('s9')
+
+    async def run():
+        started = asyncio.Event()
+
+        async def frames():
+            yield "data: 0\n\n"
+            started.set()
+            await asyncio.Event().wait()
+            yield "data: 1\n\n"
+
+        task = asyncio.ensure_future(publish_stream(buffer, 's9', frames()))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    # 外部取消后同样写入结束标记
+    assert [frame.split('\n', 1)[1] for frame in tail_stream(buffer, 's9')] == ["data: 0\n\n"]
+
+
+def test_generation_survives_reconnect_within_grace(bridge):
+    agent = NewsWriterAgent()
+    agent.llm = StreamingLLM(["正文"], delay=0.02, endless=True)
+    manager = AgentManager()
+    manager.register_agent(agent)
+    buffer = MemoryStreamBuffer(reader_grace=0.5)
+    buffer.open('s8')
+    bridge.submit(publish_stream(buffer, 's8', stream_deltas(manager)))
+
+    first = tail_stream(buffer, 's8')
+    last = event_ids([next(first)])[-1]
+    first.close()
+    # 宽限期内重连的读者继续跟随同一次生成
+    resumed = tail_stream(buffer, *parse_event_id(last))
+    frames = [next(resumed) for _ in range(20)]
+    resumed.close()
+
+    assert event_ids(frames)[0] == 's8:2'
+    assert not agent.llm.closed.is_set()
+
+
+def test_stream_chat_is_rejected_before_writing_when_loop_is_full(monkeypatch):
+    bridge = LoopBridge(max_in_flight=1, acquire_timeout=0)
+    set_loop_bridge(bridge)
+    set_stream_buffer(MemoryStreamBuffer())
+    held = bridge.reserve()
+    monkeypatch.setattr(views.Conversation, 'objects', None)
+    try:
+        request = RequestFactory().post('/stream-chat/', {'message': '写一篇新闻稿', 'agent_type': 'news_writer'},
+                                        content_type='application/json')
+        response = StreamChatView.as_view()(request)
+    finally:
+        held.release()
+        bridge.shutdown()
+
+    assert response.status_code == 503
+    assert bridge.stats()['rejected'] == 1
+
+
+def test_stream_chat_for_other_users_conversation_is_not_found(monkeypatch, bridge):
+    class Conversations:
+        """对话5属于用户7"""
+
+        def get(self, **kwargs):
+            if kwargs['id'] != 5 or kwargs.get('user_id', 7) != 7:
+                raise views.Conversation.DoesNotExist
+            return views.Conversation(id=5, user_id=7)
+
+    set_loop_bridge(bridge)
+    set_stream_buffer(MemoryStreamBuffer())
+    monkeypatch.setattr(views.Conversation, 'objects', Conversations())
+    monkeypatch.setattr(views.Message, 'objects', None)
+
+    request = RequestFactory().post('/stream-chat/', {'message': '继续', 'agent_type': 'news_writer',
+                                                      'conversation_id': 5}, content_type='application/json')
+    response = StreamChatView.as_view()(request)
+
+    assert response.status_code == 404
+
+
+def test_resume_view_replays_after_last_event_id():
+    buffer = MemoryStreamBuffer()
+    set_stream_buffer(buffer)
+    buffer.open('s5')
+    publish(buffer, 's5', 4)
+
+    request = RequestFactory().get('/stream-chat/s5/', HTTP_LAST_EVENT_ID='s5:2')
+    response = StreamChatView.as_view()(request, stream_id='s5')
+
+    body = b''.join(response.streaming_content).decode()
+    assert body == 'id: s5:3\ndata: 2\n\nid: s5:4\ndata: 3\n\n'
+
+
+def test_resume_view_returns_404_for_unknown_stream():
+    set_stream_buffer(MemoryStreamBuffer())
+
+    request = RequestFactory().get('/stream-chat/missing/')
+    response = StreamChatView.as_view()(request, stream_id='missing')
+
+    assert response.status_code == 404
+
+
+class NoThreads(ThreadPoolExecutor):
+    def submit(self, *args, **kwargs):
+        raise AssertionError("异步读取不应占用线程")
+
+
+def test_async_readers_wait_without_threads(bridge):
+    buffer = MemoryStreamBuffer()
+    buffer.open('s6')
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(NoThreads())
+        readers = [asyncio.ensure_future(collect(atail_stream(buffer, 's6'))) for _ in range(20)]
+        while len(buffer._async_waiters.get('s6', ())) < 20:
+            await asyncio.sleep(0.01)
+        # 所有读者都在等待新帧时由后台事件循环写入
+        bridge.submit(publish_stream(buffer, 's6', slow_frames(3, delay=0)))
+        return await asyncio.gather(*readers)
+
+    async def collect(frames):
+        return [frame async for frame in frames]
+
+    results = asyncio.run(run())
+
+    assert all(event_ids(frames) == ['s6:1', 's6:2', 's6:3'] for frames in results)
+
+
+def test_resume_view_reads_buffer_asynchronously_under_asgi():
+    buffer = MemoryStreamBuffer()
+    set_stream_buffer(buffer)
+    buffer.open('s7')
+    publish(buffer, 's7', 2)
+
+    request = RequestFactory().get('/stream-chat/s7/')
+    request.scope = {'type': 'http'}
+    response = StreamChatView.as_view()(request, stream_id='s7')
+
+    async def body():
+        return b''.join([part async for part in response])
+
+    assert response.is_async
+    assert asyncio.run(body()) == b'id: s7:1\ndata: 0\n\nid: s7:2\ndata: 1\n\n'
+
+
+def redis_client():
+    redis = pytest.importorskip("redis")
+    client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True)
+    try:
+        client.ping()
+    except Exception:
+        pytest.skip("需要Redis")
+    return client
+
+
+def test_redis_buffer_round_trip():
+    buffer = RedisStreamBuffer(redis_client(), ttl=60, reader_grace=1)
+    stream_id = f"test-{time.time_ns()}"
+    buffer.open(stream_id)
+    publish(buffer, stream_id, 3)
+
+    frames = list(tail_stream(buffer, stream_id))
+
+    assert [frame.split('\n', 1)[1] for frame in frames] == [f"data: {index}\n\n" for index in range(3)]
+    after = parse_event_id(event_ids(frames)[0])[1]
+    assert len(list(tail_stream(buffer, stream_id, after))) == 2
+    assert buffer.has_reader(stream_id)
+
+
+def test_redis_buffer_async_round_trip():
+    import redis.asyncio
+
+    buffer = RedisStreamBuffer(redis_client(), ttl=60, reader_grace=1,
+                               async_client_factory=lambda: redis.asyncio.Redis.from_url(
+                                   os.getenv('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True))
+    stream_id = f"test-{time.time_ns()}"
+    buffer.open(stream_id)
+    publish(buffer, stream_id, 3)
+
+    async def run():
+        return [frame async for frame in atail_stream(buffer, stream_id)]
+
+    frames = asyncio.run(run())
+
+    assert [frame.split('\n', 1)[1] for frame in frames] == [f"data: {index}\n\n" for index in range(3)]
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from agents.core.streaming import (StreamEvent, StreamMetrics, coalesce_deltas, get_stream_metrics, sse_content_frame,
+                                   sse_frame, set_stream_metrics)
+
+
+async def produce(pieces, delay=0.0, final='完成'):
+    for piece in pieces:
+        if delay:
+            await asyncio.sleep(delay)
+        yield StreamEvent(type='delta', delta=piece)
+    yield StreamEvent(type='complete', response=final)
+
+
+def collect(events, **kwargs):
+    async def run():
+        return [event async for event in coalesce_deltas(events, **kwargs)]
+    return asyncio.run(run())
+
+
+def setup_function():
+    set_stream_metrics(StreamMetrics())
+
+
+def teardown_function():
+    set_stream_metrics(None)
+
+
+def test_fast_deltas_are_merged_into_few_frames():
+    pieces = [f"词{i}" for i in range(200)]
+
+    events = collect(produce(pieces), flush_interval=0.03, flush_bytes=100000)
+
+    deltas = [event for event in events if event.type == 'delta']
+    assert ''.join(event.delta for event in deltas) == ''.join(pieces)
+    assert len(deltas) < 5
+    assert events[-1].type == 'complete'
+    stats = get_stream_metrics().stats()
+    assert stats['frames'] == len(events)
+    assert stats['deltas_per_frame'] > 10
+
+
+def test_slow_deltas_are_not_delayed():
+    events = collect(produce(["第一段", "第二段", "第三段"], delay=0.05), flush_interval=0.01)
+
+    assert [event.delta for event in events if event.type == 'delta'] == ["第一段", "第二段", "第三段"]
+
+
+def test_byte_threshold_flushes_immediately():
+    events = collect(produce(["abcde"] * 6), flush_interval=10, flush_bytes=10)
+
+    assert [event.delta for event in events if event.type == 'delta'] == ["abcdeabcde"] * 3
+
+
+def test_zero_interval_passes_deltas_through():
+    events = collect(produce(["a", "b", "c"]), flush_interval=0)
+
+    assert [event.delta for event in events if event.type == 'delta'] == ["a", "b", "c"]
+
+
+def test_pending_deltas_are_sent_before_other_events():
+    events = collect(produce(["a", "b"], final='结果'), flush_interval=10, flush_bytes=100000)
+
+    assert [(event.type, event.delta) for event in events] == [('delta', 'ab'), ('complete', '')]
+    assert events[-1].response == '结果'
+
+
+def test_closing_early_closes_source():
+    closed = []
+
+    async def source():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield StreamEvent(type='delta', delta='x')
+        finally:
+            closed.append(True)
+
+    async def run():
+        events = coalesce_deltas(source(), flush_interval=0)
+        async for _ in events:
+            break
+        await events.aclose()
+
+    asyncio.run(run())
+
+    assert closed == [True]
+
+
+def test_content_frame_matches_generic_frame():
+    delta = '第一行\n第二行 "引号"'
+
+    frame = sse_content_frame(delta)
+
+    assert frame == sse_frame({'type': 'content', 'data': delta})
+    assert frame.count('\n') == 2 and frame.endswith('\n\n')
+    assert json.loads(frame[len('data: '):]) == {'type': 'content', 'data': delta}
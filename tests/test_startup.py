@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from agents.core.base import AgentType
+from agents.core.manager import AgentManager
+from agents.core.registry import AgentDescriptor
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend')
+
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from agents.core.initialization import create_agent_manager
+manager = create_agent_manager()
+elapsed = time.perf_counter() - start
+listed = manager.list_agents()
+print(json.dumps({
+    'elapsed': elapsed,
+    'registered': len(manager.agents),
+    'listed': len(listed),
+    'loaded': len(manager.agents.loaded()),
+    'heavy_modules': sorted(name for name in ('langgraph', 'langchain', 'langchain_core') if name in sys.modules),
+}))
+"""
+
+
+def test_cold_start_registers_agents_without_loading_them():
+    """冷启动基准：初始化和列出智能体只使用描述，不导入智能体和LangGraph"""
+    result = subprocess.run(
+        [sys.executable, '-c', COLD_START_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"冷启动耗时 {stats['elapsed'] * 1000:.1f}ms")
+
+    assert stats['registered'] == 7
+    assert stats['listed'] == 7
+    assert stats['loaded'] == 0
+    assert stats['heavy_modules'] == []
+    assert stats['elapsed'] < 2.0
+
+
+def test_agent_is_instantiated_once_on_first_use():
+    manager = AgentManager()
+    manager.register_descriptor(AgentDescriptor(
+        agent_type=AgentType.NEWS_WRITER,
+        import_path="agents.news_writer.agent:NewsWriterAgent"
+    ))
+
+    assert AgentType.NEWS_WRITER in manager.agents
+    assert not manager.agents.is_loaded(AgentType.NEWS_WRITER)
+
+    agent = manager.get_agent(AgentType.NEWS_WRITER)
+    assert agent.agent_type == AgentType.NEWS_WRITER
+    assert manager.get_agent(AgentType.NEWS_WRITER) is agent
+    # 模型客户端在首次调用模型时才创建
+    assert agent._llm is None
+
+
+def test_general_qa_sees_specialists_through_registry():
+    from agents.core.initialization import create_agent_manager
+
+    manager = create_agent_manager()
+    general_qa = manager.agents[AgentType.GENERAL_QA]
+
+    assert AgentType.GENERAL_QA not in general_qa.specialist_agents
+    assert AgentType.CODE_ASSISTANT in general_qa.specialist_agents
+    assert not manager.agents.is_loaded(AgentType.CODE_ASSISTANT)
+
+    assert general_qa.specialist_agents[AgentType.CODE_ASSISTANT] is manager.agents[AgentType.CODE_ASSISTANT]
+
+
+def test_descriptors_match_agent_definitions():
+    from agents.core.initialization import AGENT_DESCRIPTORS
+
+    for entry in AGENT_DESCRIPTORS:
+        agent = AgentDescriptor(**{**entry, 'agent_type': AgentType(entry['agent_type'])}).load_class()()
+        assert (agent.agent_type.value, agent.name, agent.description, agent.get_capabilities()) == (
+            entry['agent_type'], entry['name'], entry['description'], entry['capabilities']
+        )
+
+
+def test_registry_view_rejects_excluded_assignment():
+    manager = AgentManager()
+    view = manager.agents.view(exclude=[AgentType.GENERAL_QA])
+
+    with pytest.raises(KeyError):
+        view[AgentType.GENERAL_QA] = object()
+    assert AgentType.GENERAL_QA not in manager.agents
@@ -0,0 +1,233 @@
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from conftest import StreamingLLM
+
+from agents.core.base import AgentType
+from agents.core.cache import set_result_cache
+from agents.core.concurrency import LoopBridge
+from agents.core.disconnect import (SCOPE_KEY, DisconnectWatchMiddleware, StreamExecutor, StreamsBusy,
+                                    set_stream_executor, stream_body)
+from agents.core.manager import AgentManager
+from agents.core.streaming import StreamMetrics, get_stream_metrics, set_stream_metrics
+from agents.news_writer.agent import NewsWriterAgent
+
+
+def endless_llm(delay=0.05):
+    """持续输出增量直到流被关闭的模型"""
+    return StreamingLLM(["新闻稿正文"], delay=delay, endless=True)
+
+
+def make_manager(llm):
+    agent = NewsWriterAgent()
+    agent.llm = llm
+    manager = AgentManager()
+    manager.register_agent(agent)
+    return manager
+
+
+def setup_function():
+    set_result_cache(None)
+    set_stream_metrics(StreamMetrics())
+
+
+def teardown_function():
+    set_stream_metrics(None)
+    set_stream_executor(None)
+
+
+def test_stopping_iteration_closes_provider_stream_and_counts_cancelled_tokens():
+    llm = endless_llm()
+    manager = make_manager(llm)
+
+    async def run():
+        events = manager.stream_message("写一篇新闻稿", AgentType.NEWS_WRITER)
+        received = []
+        async for event in events:
+            received.append(event)
+            if len(received) == 3:
+                break
+        await events.aclose()
+        return received
+
+    received = asyncio.run(run())
+
+    assert [event.type for event in received] == ['delta'] * 3
+    assert llm.closed.is_set()
+    stats = get_stream_metrics().stats()
+    assert stats['cancelled'] == 1
+    assert stats['completed'] == 0
+    assert stats['in_progress'] == 0
+    assert stats['cancelled_tokens'] >= 3 * 5
+
+
+def test_wsgi_write_failure_cancels_generation():
+    """WSGI服务器写入失败后关闭响应迭代器，后台事件循环中的生成随即取消"""
+    llm = endless_llm()
+    manager = make_manager(llm)
+    bridge = LoopBridge()
+    try:
+        events = bridge.iterate(lambda: manager.stream_message("写一篇新闻稿", AgentType.NEWS_WRITER))
+        assert next(events).type == 'delta'
+        events.close()
+
+        assert llm.closed.wait(2)
+        assert bridge.stats()['in_flight'] == 0
+        assert get_stream_metrics().stats()['cancelled'] == 1
+    finally:
+        bridge.shutdown()
+
+
+def test_disconnect_event_stops_iteration_while_waiting_for_model():
+    # 模型在首个增量前一直等待，只有取消能结束迭代
+    llm = endless_llm(delay=3600)
+    manager = make_manager(llm)
+    bridge = LoopBridge()
+    disconnected = threading.Event()
+    received = []
+    try:
+        events = bridge.iterate(
+            lambda: manager.stream_message("写一篇新闻稿", AgentType.NEWS_WRITER), cancelled=disconnected
+        )
+        consumer = threading.Thread(target=lambda: received.extend(events))
+        consumer.start()
+        assert llm.started.wait(2)
+        disconnected.set()
+        consumer.join(5)
+
+        assert not consumer.is_alive()
+        assert received == []
+        assert llm.closed.wait(2)
+        assert get_stream_metrics().stats()['cancelled'] == 1
+    finally:
+        bridge.shutdown()
+
+
+def test_disconnect_event_stops_iteration_while_model_keeps_streaming():
+    llm = endless_llm(delay=0.01)
+    manager = make_manager(llm)
+    bridge = LoopBridge()
+    disconnected = threading.Event()
+    try:
+        events = bridge.iterate(
+            lambda: manager.stream_message("写一篇新闻稿", AgentType.NEWS_WRITER), cancelled=disconnected
+        )
+        received = [next(events) for _ in range(3)]
+        disconnected.set()
+        # 模型不停输出，迭代能够结束说明已被取消
+        received.extend(events)
+
+        assert len(received) >= 3
+        assert llm.closed.wait(2)
+    finally:
+        bridge.shutdown()
+
+
+def test_middleware_reports_http_disconnect_after_body():
+    seen = {}
+
+    async def app(scope, receive, send):
+        message = await receive()
+        seen['body'] = message['body']
+        disconnected = scope[SCOPE_KEY]
+        for _ in range(50):
+            if disconnected.is_set():
+                break
+            await asyncio.sleep(0.01)
+        seen['disconnected'] = disconnected.is_set()
+
+    async def run():
+        messages = asyncio.Queue()
+        messages.put_nowait({'type': 'http.request', 'body': b'{}', 'more_body': False})
+        asyncio.get_running_loop().call_later(0.05, messages.put_nowait, {'type': 'http.disconnect'})
+
+        async def send(message):
+            pass
+
+        await DisconnectWatchMiddleware(app)({'type': 'http'}, messages.get, send)
+
+    asyncio.run(run())
+
+    assert seen == {'body': b'{}', 'disconnected': True}
+
+
+class AsgiRequest:
+    def __init__(self):
+        self.scope = {SCOPE_KEY: threading.Event()}
+
+
+class NoThreads(ThreadPoolExecutor):
+    """事件循环的默认线程池，被使用即失败"""
+
+    def submit(self, *args, **kwargs):
+        raise AssertionError("不应占用默认线程池")
+
+
+def test_stream_body_streams_sync_generator_under_asgi():
+    received = threading.Event()
+
+    def generate():
+        yield 0
+        # 整体读完后才返回时，第一项送达前就会在这里等待超时
+        assert received.wait(2)
+        yield 1
+
+    async def run():
+        items = []
+        async for item in stream_body(AsgiRequest(), generate()):
+            items.append(item)
+            received.set()
+        return items
+
+    assert asyncio.run(run()) == [0, 1]
+
+
+def test_stream_body_returns_sync_iterator_under_wsgi():
+    iterator = iter([1, 2])
+
+    assert stream_body(object(), iterator) is iterator
+
+
+def test_stream_body_reads_in_dedicated_executor():
+    set_stream_executor(StreamExecutor(max_streams=2))
+
+    async def run():
+        asyncio.get_running_loop().set_default_executor(NoThreads())
+        return [item async for item in stream_body(AsgiRequest(), iter([1, 2, 3]))]
+
+    assert asyncio.run(run()) == [1, 2, 3]
+
+
+def test_streams_beyond_capacity_are_rejected_until_one_finishes():
+    set_stream_executor(StreamExecutor(max_streams=1))
+    closed = []
+
+    def generate():
+        try:
+            yield 1
+        finally:
+            closed.append(True)
+
+    first = stream_body(AsgiRequest(), generate())
+    rejected = generate()
+    next(rejected)
+    with pytest.raises(StreamsBusy):
+        stream_body(AsgiRequest(), rejected)
+    # 被拒绝的迭代器随即关闭
+    assert closed == [True]
+
+    async def consume(stream):
+        return [item async for item in stream]
+
+    assert asyncio.run(consume(first)) == [1]
+    second = stream_body(AsgiRequest(), iter([2]))
+    # Django在响应结束时调用close，未开始迭代也归还名额
+    second.close()
+    assert asyncio.run(consume(stream_body(AsgiRequest(), iter([3])))) == [3]
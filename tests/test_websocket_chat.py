@@ -0,0 +1,254 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+
+django.setup()
+
+from conftest import StreamingLLM
+
+import agents.core.views as views
+from agents.core import initialization
+from agents.core.base import AgentResponse, AgentType, BaseAgent
+from agents.core.cache import set_result_cache
+from agents.core.manager import AgentManager
+from agents.core.streaming import generate_text, report_progress
+from agents.core import websocket
+from agents.core.websocket import CLOSE_FORBIDDEN, CLOSE_NOT_FOUND, ChatSession, WebSocketRouter, resolve_user_id
+
+
+class RecordingAgent(BaseAgent):
+    """记录每轮收到的历史上下文，分两步生成并报告进度"""
+
+    def __init__(self, llm):
+        super().__init__(AgentType.GENERAL_QA, "测试助手", "测试")
+        self.llm = llm
+        self.histories = []
+
+    async def process(self, message):
+        self.histories.append(message.history)
+        report_progress({'completed_steps': ['outline'], 'total_steps': 2})
+        result = await generate_text(self.llm, self._build_messages("你是助手", message.content))
+        return AgentResponse(success=True, content=result.content, agent_type=self.agent_type, execution_time=0)
+
+    def get_capabilities(self):
+        return []
+
+
+class OfflineSession(ChatSession):
+    """不访问数据库的会话"""
+    opened = 0
+
+    def _open(self, conversation_id):
+        OfflineSession.opened += 1
+        self.conversation = type('Conversation', (), {'id': conversation_id or 1})()
+        return True
+
+    def _save_user_message(self, content, agent_type):
+        pass
+
+
+def run_session(messages, llm, query=b'', wait_for=None, headers=(), session_class=OfflineSession):
+    """按顺序发送消息，wait_for指定发送下一条前需要等到的服务端事件类型"""
+    agent = RecordingAgent(llm)
+    manager = AgentManager()
+    manager.register_agent(agent)
+    initialization._agent_manager = manager
+    sent = []
+
+    async def run():
+        incoming = asyncio.Queue()
+        received = asyncio.Queue()
+        incoming.put_nowait({'type': 'websocket.connect'})
+
+        async def send(message):
+            sent.append(message)
+            if message['type'] == 'websocket.send':
+                received.put_nowait(json.loads(message['text'])['type'])
+
+        async def drive():
+            for message, expected in zip(messages, wait_for or [None] * len(messages)):
+                incoming.put_nowait({'type': 'websocket.receive', 'text': json.dumps(message)})
+                while expected is not None and await received.get() != expected:
+                    pass
+            incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+
+        driver = asyncio.ensure_future(drive())
+        scope = {'type': 'websocket', 'query_string': query, 'headers': list(headers)}
+        await session_class(scope, incoming.get, send).run()
+        await driver
+
+    asyncio.run(run())
+    events = [json.loads(message['text']) for message in sent if message['type'] == 'websocket.send']
+    return sent, events, agent
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    set_result_cache(None)
+    OfflineSession.opened = 0
+    monkeypatch.setattr(views, 'persist_agent_response', lambda conversation_id, agent_type, response: 7)
+    monkeypatch.setattr(initialization, '_agent_manager', None)
+
+
+def test_multi_turn_session_streams_and_reuses_cached_history():
+    sent, events, agent = run_session(
+        [{'type': 'message', 'message': '第一问'}, {'type': 'message', 'message': '第二问'}],
+        StreamingLLM(), query=b'conversation_id=5', wait_for=['complete', 'complete']
+    )
+
+    assert sent[0] == {'type': 'websocket.accept'}
+    assert events[0] == {'type': 'session', 'data': {'conversation_id': 5, 'agent_type': 'general_qa'}}
+    types = [event['type'] for event in events]
+    assert types.count('complete') == 2
+    assert 'progress' in types and 'content' in types
+    completes = [event['data'] for event in events if event['type'] == 'complete']
+    assert completes[1]['raw_content'] == '回答：第二问'
+    assert completes[1]['document_id'] == 7
+    # 第二轮的历史上下文来自连接内缓存，包含第一轮的问答
+    recent = [turn.content for turn in agent.histories[1].recent]
+    assert recent == ['第一问', '回答：第一问']
+    assert OfflineSession.opened == 1
+
+
+def test_cancel_stops_generation():
+    llm = StreamingLLM(delay=0.02, endless=True)
+
+    _, events, _ = run_session(
+        [{'type': 'message', 'message': '写很长的内容'}, {'type': 'cancel'}],
+        llm, wait_for=['content', 'cancelled']
+    )
+
+    assert 'cancelled' in [event['type'] for event in events]
+    assert llm.closed.wait(2)
+
+
+def test_control_messages():
+    _, events, _ = run_session(
+        [{'type': 'ping'}, {'type': 'bind', 'agent_type': 'unknown'}, {'type': 'bind', 'agent_type': 'news_writer'},
+         {'type': 'nope'}],
+        StreamingLLM(), wait_for=['pong', 'error', 'session', 'error']
+    )
+
+    assert [event['type'] for event in events] == ['session', 'pong', 'error', 'session', 'error']
+    assert events[3]['data']['agent_type'] == 'news_writer'
+
+
+def test_router_rejects_unknown_websocket_path_and_passes_http():
+    calls = []
+
+    async def http_app(scope, receive, send):
+        calls.append(scope['type'])
+
+    async def run():
+        sent = []
+
+        async def receive():
+            return {'type': 'websocket.connect'}
+
+        async def send(message):
+            sent.append(message)
+
+        router = WebSocketRouter(http_app)
+        await router({'type': 'websocket', 'path': '/ws/other/'}, receive, send)
+        await router({'type': 'http', 'path': '/api/'}, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+
+    assert sent == [{'type': 'websocket.close', 'code': CLOSE_NOT_FOUND}]
+    assert calls == ['http']
+
+
+def test_untrusted_origin_is_rejected_before_opening():
+    sent, _, _ = run_session([], StreamingLLM(), headers=[(b'origin', b'https://evil.example')])
+
+    assert sent == [{'type': 'websocket.close', 'code': CLOSE_FORBIDDEN}]
+    assert OfflineSession.opened == 0
+
+
+def test_trusted_origin_is_accepted():
+    sent, _, _ = run_session([], StreamingLLM(), headers=[(b'origin', b'http://localhost:3000')])
+
+    assert sent[0] == {'type': 'websocket.accept'}
+
+
+class Query:
+    """记录查询条件的模型管理器替身"""
+
+    def __init__(self, result=None):
+        self.result = result
+        self.filters = []
+        self.created = []
+
+    def filter(self, **kwargs):
+        self.filters.append(kwargs)
+        return self
+
+    def first(self):
+        return self.result
+
+    def exists(self):
+        return self.result is not None
+
+    def create(self, **kwargs):
+        self.created.append(kwargs)
+        return type('Conversation', (), {'id': 9})()
+
+
+def test_conversation_is_looked_up_for_the_session_user(monkeypatch):
+    from agents.core.models import Conversation
+
+    conversations = Query()
+    monkeypatch.setattr(Conversation, 'objects', conversations)
+    monkeypatch.setattr(websocket, 'resolve_user_id', lambda scope: 42)
+
+    sent, _, _ = run_session([], StreamingLLM(), query=b'conversation_id=5', session_class=ChatSession)
+    run_session([], StreamingLLM(), session_class=ChatSession)
+
+    assert sent == [{'type': 'websocket.close', 'code': CLOSE_NOT_FOUND}]
+    assert conversations.filters == [{'id': 5, 'user_id': 42}]
+    assert conversations.created == [{'user_id': 42}]
+
+
+def test_edit_rejects_documents_of_other_conversations(monkeypatch):
+    from agents.core import write_behind
+    from agents.core.models import Document
+
+    documents = Query()
+    monkeypatch.setattr(Document, 'objects', documents)
+    monkeypatch.setattr(write_behind, 'ensure_persisted', lambda **kwargs: None)
+    monkeypatch.setattr(views, 'edit_document', lambda *args: pytest.fail('不应编辑其他对话的文档'))
+
+    _, events, _ = run_session(
+        [{'type': 'edit', 'document_id': 3, 'operation': 'polish', 'instruction': '润色'}],
+        StreamingLLM(), query=b'conversation_id=5', wait_for=['error']
+    )
+
+    assert events[-1] == {'type': 'error', 'data': 'Document not found'}
+    assert documents.filters == [{'id': 3, 'conversation_id': 5}]
+
+
+def test_session_user_is_resolved_from_cookie(monkeypatch, settings):
+    from importlib import import_module
+
+    import django.contrib.auth
+
+    settings.SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session['user'] = 42
+    session.save()
+    monkeypatch.setattr(django.contrib.auth, 'get_user', lambda request: type(
+        'User', (), {'is_authenticated': True, 'id': request.session['user']})())
+    cookie = f"{settings.SESSION_COOKIE_NAME}={session.session_key}".encode()
+
+    assert resolve_user_id({'headers': [(b'cookie', cookie)]}) == 42
+    assert resolve_user_id({'headers': []}) is None
@@ -0,0 +1,197 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+
+django.setup()
+
+from django.db import OperationalError
+
+import agents.core.summaries as summaries
+import agents.core.write_behind as write_behind
+from agents.core.base import AgentResponse, AgentType
+from agents.core.views import enqueue_chat_turn
+from agents.core.write_behind import (MemoryWriteQueue, RedisWriteQueue, WriteBehindWriter, conversation_key,
+                                      ensure_persisted, get_write_behind, message_item, reset_after_fork,
+                                      set_write_behind, version_item)
+
+
+class RecordingDatabase:
+    """记录每次写库的批次，failures中的异常依次抛出"""
+
+    def __init__(self, failures=()):
+        self.batches = []
+        self.failures = list(failures)
+        self.lock = threading.Lock()
+
+    def __call__(self, items):
+        with self.lock:
+            if self.failures:
+                error = self.failures.pop(0)
+                if error is not None:
+                    raise error
+            self.batches.append([item['fields']['content'] for item in items])
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(summaries, 'schedule_summary_refresh', refreshed.append)
+    yield refreshed
+    set_write_behind(None)
+
+
+def message(conversation_id, content):
+    return message_item(conversation_id=conversation_id, content=content, agent_type='general_qa',
+                        is_user_message=True)
+
+
+def test_turn_is_written_in_one_batch_and_summary_refreshed_after(monkeypatch, offline):
+    database = RecordingDatabase()
+    monkeypatch.setattr(write_behind, 'write_items', database)
+    writer = WriteBehindWriter(MemoryWriteQueue(), flush_interval=0.05)
+
+    writer.submit([message(1, '问'), version_item(3, '文档'), message(1, '答')])
+
+    assert writer.flush([conversation_key(1)], timeout=2)
+    assert database.batches == [['问', '文档', '答']]
+    assert offline == [1]
+
+
+def test_read_your_writes_does_not_wait_for_flush_interval(monkeypatch):
+    database = RecordingDatabase()
+    monkeypatch.setattr(write_behind, 'write_items', database)
+    writer = WriteBehindWriter(MemoryWriteQueue(), flush_interval=30)
+    set_write_behind(writer)
+
+    writer.submit([message(5, '上一轮')])
+    ensure_persisted(conversation_id=5)
+
+    assert database.batches == [['上一轮']]
+    assert not writer.queue.pending([conversation_key(5)])
+
+
+def test_database_outage_requeues_batch(monkeypatch):
+    database = RecordingDatabase(failures=[OperationalError('gone away')])
+    monkeypatch.setattr(write_behind, 'write_items', database)
+    queue = MemoryWriteQueue()
+    writer = WriteBehindWriter(queue)
+    queue.push([message(1, '一'), message(1, '二')])
+
+    assert not writer.write(queue.take(10))
+    assert queue.pending([conversation_key(1)])
+    assert writer.write(queue.take(10))
+    assert database.batches == [['一', '二']]
+    assert not queue.pending([conversation_key(1)])
+
+
+def test_unwritable_record_is_dropped_without_blocking_others(monkeypatch):
+    database = RecordingDatabase(failures=[ValueError('batch'), None, ValueError('bad row'), None])
+    monkeypatch.setattr(write_behind, 'write_items', database)
+    queue = MemoryWriteQueue()
+    writer = WriteBehindWriter(queue)
+    queue.push([message(1, '一'), message(1, '坏'), message(1, '三')])
+
+    assert writer.write(queue.take(10))
+    assert database.batches == [['一'], ['三']]
+    assert not queue.pending([conversation_key(1)])
+
+
+def test_chat_turn_for_existing_document_is_fully_queued():
+    queue = MemoryWriteQueue()
+    writer = WriteBehindWriter(queue)
+    writer._ensure_thread = lambda: None
+    user_message = {'conversation_id': 2, 'content': '改一下', 'agent_type': 'news_writer',
+                    'is_user_message': True, 'document_id': 8}
+    response = AgentResponse(success=True, content='新稿', agent_type=AgentType.NEWS_WRITER, execution_time=0.5)
+
+    document_id = enqueue_chat_turn(writer, user_message, response, 'news_writer', 8)
+
+    items = queue.take(10)
+    assert document_id == 8
+    assert [item['kind'] for item in items] == ['message', 'version', 'message']
+    assert items[1]['fields'] == {'document_id': 8, 'content': '新稿', 'version_number': None,
+                                  'operation_type': None}
+    assert items[2]['fields']['metadata'] == {'execution_time': 0.5, 'success': True}
+
+
+def test_ensure_persisted_is_noop_when_disabled(monkeypatch):
+    set_write_behind(None)
+    monkeypatch.setattr(write_behind, 'write_items', lambda items: pytest.fail('不应写库'))
+
+    ensure_persisted(conversation_id=1)
+
+
+@pytest.fixture
+def redis_queue():
+    """使用独立键名的Redis队列，测试结束后删除相关的键"""
+    redis = pytest.importorskip("redis")
+    client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True)
+    try:
+        client.ping()
+    except Exception:
+        pytest.skip("需要Redis")
+    key = f"test:write_behind:{time.time_ns()}"
+    yield lambda: RedisWriteQueue(client, key=key)
+    client.delete(*client.keys(f"{key}*") or [key])
+
+
+def test_redis_items_taken_by_crashed_worker_are_requeued_on_startup(redis_queue):
+    crashed = redis_queue()
+    crashed.push([message(1, '一'), message(1, '二'), message(1, '三')])
+    assert [item['fields']['content'] for item in crashed.take(2)] == ['一', '二']
+    # 进程崩溃：处理中的记录没有提交，存活键随后过期
+    crashed.client.delete(crashed._worker_key(crashed.worker_id))
+
+    restarted = redis_queue()
+
+    assert [item['fields']['content'] for item in restarted.take(10)] == ['一', '二', '三']
+    assert not crashed.client.exists(crashed.processing_key)
+
+
+def test_redis_items_of_live_worker_are_not_requeued(redis_queue):
+    live = redis_queue()
+    live.push([message(1, '一')])
+    items = live.take(10)
+
+    assert redis_queue().take(10) == []
+    live.done(items)
+    assert not live.client.exists(live.processing_key)
+    assert not live.pending([conversation_key(1)])
+
+
+def test_redis_wait_claims_item_for_next_take(redis_queue):
+    queue = redis_queue()
+    assert not queue.wait(0.1)
+
+    queue.push([message(1, '一'), message(1, '二')])
+
+    assert queue.wait(1)
+    items = queue.take(10)
+    assert [item['fields']['content'] for item in items] == ['一', '二']
+    queue.requeue(items)
+    assert not queue.client.exists(queue.processing_key)
+    assert [item['fields']['content'] for item in queue.take(10)] == ['一', '二']
+
+
+def test_redis_older_than_6_2_falls_back_to_memory_queue(monkeypatch, settings):
+    import redis
+
+    class OldRedis:
+        def info(self, section):
+            return {'redis_version': '6.0.16'}
+
+    settings.PERSIST_WRITE_BEHIND = 'redis'
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url, **kwargs: OldRedis())
+    monkeypatch.setattr(write_behind.atexit, 'register', lambda function: None)
+    reset_after_fork()
+
+    assert isinstance(get_write_behind().queue, MemoryWriteQueue)